@@ -3,12 +3,22 @@
 #################################################
 from __future__ import annotations
 
-from click import Context, Group, group, option, version_option
+from importlib import import_module
+from typing import Any
+
+from click import (
+    Command,
+    Context,
+    Group,
+    get_current_context,
+    group,
+    option,
+    version_option,
+)
 from click.formatting import HelpFormatter
 
-from .cli.builder import Builder
-from .cli.manager import Manager
 from .utils import cli as cli_utils
+from .utils import timings
 
 from . import __version__
 
@@ -16,19 +26,68 @@ from . import __version__
 #################################################
 # CODE
 #################################################
+# Modules holding each command group, imported only when one of its
+# commands is actually resolved.
+GROUPS: dict[str, tuple[str, str]] = {
+    "Builder": (".cli.builder", "Builder"),
+    "Manager": (".cli.manager", "Manager"),
+}
+
+# Cheap manifest of every command: name -> (group, short help).
+# Keeps `--help` from importing the groups and their heavy dependencies.
+COMMANDS: dict[str, tuple[str, str]] = {
+    "build": ("Builder", "Build the files for the containerization."),
+    "cache": ("Builder", "Manage the local cache of server jars."),
+    "create": ("Builder", "Create all files for the containerization."),
+    "update": ("Builder", "Update the contents of the containers."),
+    "backup": ("Manager", "Create and manage backups of the containers."),
+    "down": ("Manager", "Delete the containers."),
+    "open": ("Manager", "Open the terminal of a server."),
+    "restart": ("Manager", "Restart the containers."),
+    "restore": ("Manager", "Restore a backup into its container."),
+    "start": ("Manager", "Start the containers."),
+    "stats": ("Manager", "Show CPU and memory use of the containers."),
+    "stop": ("Manager", "Stop the containers."),
+    "up": ("Manager", "Start up the containers after changes."),
+}
+
+
 class TopGroup(Group):
 
+    def list_commands(self, ctx: Context) -> list[str]:
+        return sorted(set(COMMANDS) | set(self.commands))
+
+    def get_command(self, ctx: Context, cmd_name: str) -> Command | None:
+        if cmd_name in self.commands or cmd_name not in COMMANDS:
+            return super().get_command(ctx, cmd_name)
+
+        source = COMMANDS[cmd_name][0]
+        cmd = self.__load_group(ctx, source).commands.get(cmd_name)
+        if cmd is not None:
+            # annotate source so TopGroup can display grouped help
+            setattr(cmd, "source", source)
+        return cmd
+
+    def __load_group(self, ctx: Context, source: str) -> Group:
+        # Groups are built once per invocation, they read data.json on init.
+        groups: dict[str, Group] = ctx.meta.setdefault(f"{__name__}.groups", {})
+        if source not in groups:
+            module_name, class_name = GROUPS[source]
+            module: Any = import_module(module_name, __package__)
+            groups[source] = getattr(module, class_name)()
+        return groups[source]
+
     def format_commands(self, ctx: Context, formatter: HelpFormatter) -> None:
         # Build a mapping source -> list[(name, help)]
         sections: dict[str, list[tuple[str, str]]] = {}
         for cmd_name in self.list_commands(ctx):
-            cmd = self.get_command(ctx, cmd_name)  # pylint: disable=W0621
-            if cmd is None:
-                continue
-            source = getattr(cmd, "source", "Other")
-            sections.setdefault(source, []).append(
-                (cmd_name, cmd.get_short_help_str())
-            )
+            if cmd_name in COMMANDS:
+                source, short_help = COMMANDS[cmd_name]
+            else:
+                cmd = self.commands[cmd_name]  # pylint: disable=W0621
+                source = getattr(cmd, "source", "Other")
+                short_help = cmd.get_short_help_str()
+            sections.setdefault(source, []).append((cmd_name, short_help))
 
         # Write sections in a stable order (Builder, Manager, Other)
         order = ["Builder", "Manager"] + [
@@ -67,28 +126,28 @@ class TopGroup(Group):
     default=False,
     help="Do not ask for confirmations (assume yes).",
 )
+@option(
+    "--fast",
+    is_flag=True,
+    default=False,
+    help="Skip UI pacing delays (implied by -v, -y and non-TTY output).",
+)
 @group(cls=TopGroup)
-def cli(verbose: bool = False, no_confirm: bool = False) -> None:
+def cli(
+    verbose: bool = False, no_confirm: bool = False, fast: bool = False
+) -> None:
     # Apply global CLI flags to utility helpers
     try:
         cli_utils.set_verbose(verbose)
         cli_utils.set_no_confirm(no_confirm)
+        cli_utils.set_fast(fast)
     except Exception:
         # If utils cannot be imported for some reason, continue silently
         pass
 
-
-# Add the two command groups
-builder = Builder()
-manager = Manager()
-
-for cmd in builder.commands.values():
-    # annotate source so TopGroup can display grouped help
-    setattr(cmd, "source", "Builder")
-    cli.add_command(cmd)
-for cmd in manager.commands.values():
-    setattr(cmd, "source", "Manager")
-    cli.add_command(cmd)
+    if verbose:
+        # Show where the command spent its time once it finishes
+        get_current_context().call_on_close(timings.report)
 
 
 # Create the main entry point
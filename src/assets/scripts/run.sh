@@ -28,5 +28,29 @@ if [ ! -f "${SERVER_JAR}" ]; then
     exit 1
 fi
 
+# Enable RCON when given a password, backups use it to pause saving
+if [ -n "${RCON_PASSWORD}" ]; then
+    touch server.properties
+    for setting in "enable-rcon=true" "rcon.port=${RCON_PORT:-25575}" "rcon.password=${RCON_PASSWORD}"; do
+        sed -i "/^${setting%%=*}=/d" server.properties
+        echo "${setting}" >> server.properties
+    done
+fi
+
+# Drop the files a restored backup doesn't have. The list starts with its
+# number of files, an empty or truncated list must not delete anything.
+if [ -f .mcdocker-restore ]; then
+    expected=$(head -n 1 .mcdocker-restore)
+    listed=$(tail -n +2 .mcdocker-restore | grep -c . || true)
+    if [[ "${expected}" =~ ^[1-9][0-9]*$ ]] && [ "${listed}" -eq "${expected}" ]; then
+        find . -type f ! -path ./.mcdocker-restore | sed 's|^\./||' \
+            | grep -vxF -f <(tail -n +2 .mcdocker-restore) \
+            | while IFS= read -r file; do rm -f -- "${file}"; done
+    else
+        echo "WARNING: incomplete list of restored files, none was removed"
+    fi
+    rm -f .mcdocker-restore
+fi
+
 # Run minecraft with the designated flags
 exec java -Xmx${MAX_RAM} -Xms${MIN_RAM} ${JAVA_ARGS} -jar ${SERVER_JAR} nogui
@@ -9,11 +9,27 @@ from typing import Any
 
 from InquirerPy import inquirer  # type: ignore
 from InquirerPy.validator import EmptyInputValidator  # type: ignore
-from click import Command, Option
-
+from click import Command, Group, IntRange, Option
+from click import Path as ClickPath
+from click import UsageError
+from importlib_resources import files  # type: ignore
+
+from ..core.cache import MetadataCache
+from ..core.model import (
+    Database,
+    Env,
+    ModelError,
+    Project,
+    Server,
+    ServerFiles,
+)
+from ..core.templates import engine
+from ..core.watch import watcher
 from ..utils.cli import clear, confirm
 from .custom_group import CustomGroup
 from .menu import Menus
+from .param_types import BYTE_SIZE
+from .spec import Spec, SpecError
 
 #################################################
 # CODE
@@ -27,37 +43,43 @@ class Builder(CustomGroup):
     no_data: str = "ERROR: JSON file is empty. Use 'create' first."
     no_servers: str = "ERROR: No servers found. Use 'create' first."
 
-    def __init__(self) -> None:
-        super().__init__()
-        self.compose_manager.sleep = 2
-        self.file_manager.sleep = 2
-
     def create(self) -> Command:
         help = "Create all files for the containerization."
-        options = [Option(["--network"], is_flag=True, default=False)]
+        options = [
+            Option(["--network"], is_flag=True, default=False),
+            Option(
+                ["--from-spec"],
+                type=ClickPath(exists=True, dir_okay=False, path_type=Path),
+                default=None,
+            ),
+        ]
 
-        def callback(network: bool = False) -> None:
+        def callback(
+            network: bool = False, from_spec: Path | None = None
+        ) -> None:
             clear(0)
 
-            servers: dict[str, dicts] = {}
-            database: dict[str, str] = {}
-            web: bool = False
-            envs: dict[str, dicts] = {}
-            server_files: dict[str, dicts] = {}
+            project = Project(database=None, web=False)
 
             if self.cwd.joinpath("data.json").exists():
                 exit(
                     "ERROR: data.json already exists, delete it or use another command."
                 )
 
+            if from_spec is not None:
+                try:
+                    spec_data = Spec(from_spec).build()
+                except SpecError as exc:
+                    exit(f"ERROR: {exc}")
+
+                self.file_manager.save_files(spec_data)
+                print(f"Files saved! ({len(spec_data['envs'])} servers)")
+                return
+
             menu = Menus()
 
             if not network:
-                server, env, server_file = self.__get_data(menu)
-                name: str = menu.name  # type: ignore
-                servers[name] = server
-                envs[name] = env
-                server_files[name] = server_file
+                project.put(*self.__records(*self.__get_data(menu)))
             else:
                 idx = 0
                 while True:
@@ -65,47 +87,28 @@ class Builder(CustomGroup):
 
                     if idx == 0:
                         print("Creating proxy server...")
-                    server, env, server_file = self.__get_data(
+                    answers = self.__get_data(
                         menu, name="proxy" if idx == 0 else None
                     )
-                    name: str = menu.name  # type: ignore
-                    servers[name] = server
-                    envs[name] = env
-                    server_files[name] = server_file
+                    project.put(*self.__records(*answers))
 
                     clear(0.5)
 
                     if idx >= 1 and not confirm(  # type: ignore
-                        msg=f"Want to continue adding servers? (Count: {len(servers)})",
+                        msg=f"Want to continue adding servers? (Count: {len(project.servers)})",
                     ):
                         break
 
                     idx += 1
 
                 if confirm(msg="Want to use a sql database?"):
-                    database = menu.database()
+                    project.database = Database.from_dict(menu.database())
 
                 if confirm(msg="Want to add a web server?"):
-                    web = True
-
-            servers_list = [svc for _, svc in servers.items()]
-            envs_list = [env for _, env in envs.items()]
-            server_files_list = [
-                svc_file for _, svc_file in server_files.items()
-            ]
+                    project.web = True
 
             clear(0)
-            self.file_manager.save_files(
-                data={
-                    "compose": {
-                        "servers": servers_list,
-                        "database": database,
-                        "web": web,
-                    },
-                    "envs": envs_list,
-                    "server_files": server_files_list,
-                }
-            )
+            self.file_manager.save_files(data=project.to_dict())
             clear(0)
             print("Files saved!")
 
@@ -119,7 +122,8 @@ class Builder(CustomGroup):
     def update(self) -> Command:
         help = "Update the contents of the containers."
         options = [
-            Option(["--server"], type=self.server_type, default=None),
+            # Plain string: --add takes names that don't exist yet
+            Option(["--server"], type=str, default=None),
             Option(["--add"], is_flag=True, default=False),
             Option(["--remove"], is_flag=True, default=False),
             Option(["--change"], is_flag=True, default=False),
@@ -140,187 +144,119 @@ class Builder(CustomGroup):
             if (add and remove) or (add and change) or (remove and change):
                 exit("ERROR: You can only use one option flag.")
 
-            path: Path = self.cwd.joinpath("data.json")
+            state = self.state
 
-            if not path.exists():
+            if not state.exists:
                 exit(self.no_json)
 
-            data: dicts = self.file_manager.read_json(path) or {}
-
-            if not data:
+            if not state.data:
                 exit(self.no_data)
 
-            compose: dicts = data.get("compose", {}) or {}
+            # Private copy, the callback edits it in place
+            try:
+                project = Project.from_dict(state.copy())
+            except ModelError as exc:
+                exit(f"ERROR: invalid data.json, {exc}")
 
-            servers_list: list[dicts] = compose.get("servers", []) or []
-            envs_list: list[dicts] = data.get("envs", []) or []
-            server_files_list: list[dicts] = data.get("server_files", []) or []
-
-            servers: dict[Any, dicts] = {
-                svc.get("name"): svc for svc in servers_list
-            }
-            envs: dict[Any, dicts] = {
-                env.get("CONTAINER_NAME"): env for env in envs_list
-            }
-            server_files: dict[Any, dicts] = {
-                svc_file.get("name"): svc_file for svc_file in server_files_list
-            }
-
-            if not servers:
+            if not project.servers:
                 exit(self.no_servers)
 
-            def find_index_by_name(name: str) -> int | None:
-                for i, s in enumerate(servers_list):
-                    if s.get("name") == name:
-                        return i
-                return None
-
             if remove:
                 target = server
                 if not target:
-                    names = [
-                        s.get("name") for s in servers_list if s.get("name")
-                    ]
-                    if not names:
-                        exit("ERROR: No servers found.")
-
                     target = inquirer.select(  # type: ignore
-                        message="Select a server to remove: ", choices=names
+                        message="Select a server to remove: ",
+                        choices=project.names,
                     ).execute()
 
-                idx = find_index_by_name(target)  # type: ignore
-                if idx is None:
+                if target not in project.servers:
                     exit(f"ERROR: server '{target}' not found.")
 
                 clear(0.5)
 
                 if confirm(msg=f"Remove server '{target}'", default=False):
-                    servers_list.pop(idx)
-                    envs_list = [
-                        e
-                        for e in envs_list
-                        if e.get("CONTAINER_NAME") != target
-                    ]
-                    server_files_list = [
-                        f for f in server_files_list if f.get("name") != target
-                    ]
-                    compose["servers"] = servers_list
-                    data["compose"] = compose
-                    data["envs"] = envs_list
-                    data["server_files"] = server_files_list
-                    self.file_manager.save_files(data)
+                    project.remove(target)  # type: ignore
+                    self.file_manager.save_files(
+                        project.to_dict(), servers=[], removed=[target]
+                    )
                     print(f"server '{target}' removed and files updated.")
 
             elif add:
                 name = server
                 if not name:
                     name = self.__get_name("Enter the name of the server: ")
-                if find_index_by_name(name):
+                if name in project.servers:
                     if not confirm(
                         msg=f"server '{name}' already exists. Overwrite? "
                     ):
                         exit("WARNING: Add cancelled.")
 
                 menu = Menus()
-
-                server_obj, env_obj, svc_file_obj = self.__get_data(menu, name)
-                server_obj["name"] = name
-                env_obj["CONTAINER_NAME"] = name
-                svc_file_obj["name"] = name
-
-                servers[name] = server_obj
-                envs[name] = env_obj
-                server_files[name] = svc_file_obj
+                records = self.__get_records(menu, name)
 
                 clear(0.5)
 
                 if confirm(msg=f"Add server '{name}'"):
-                    servers_list = [svc for _, svc in servers.items()]
-                    envs_list = [env for _, env in envs.items()]
-                    server_files_list = [
-                        svc_file for _, svc_file in server_files.items()
-                    ]
-
-                    compose["servers"] = servers_list
-                    data["compose"] = compose
-                    data["envs"] = envs_list
-                    data["server_files"] = server_files_list
-                    self.file_manager.save_files(data)
-                    print(f"server '{name}' removed and files updated.")
+                    project.put(*records)
+                    self.file_manager.save_files(
+                        project.to_dict(), servers=[name]
+                    )
+                    print(f"server '{name}' added and files updated.")
 
             elif change:
                 name = server
-                names = [svc.get("name") for svc in servers_list]
                 if not name:
                     name = str(
                         inquirer.select(  # type: ignore
                             message="Select the server: ",
-                            choices=names,
+                            choices=project.names,
                             validate=EmptyInputValidator(),
                         ).execute()
                     )
-                idx_svc = find_index_by_name(name)
-                if idx_svc is None:
+                if name not in project.servers:
                     exit(f"ERROR: server '{name}' not found.")
 
-                server_obj = servers_list[idx_svc]
-                env_obj = envs_list[idx_svc]
-                svc_file_obj = server_files_list[idx_svc]
+                server_obj, env_obj, svc_file_obj = project.get(name)
+                if env_obj is None or svc_file_obj is None:
+                    exit(f"ERROR: server '{name}' is incomplete in data.json.")
 
                 defaults = {
-                    "server": server_obj,
-                    "env": env_obj,
-                    "server_files": svc_file_obj,
+                    "server": server_obj.to_dict(),
+                    "env": env_obj.to_dict(),
+                    "server_files": svc_file_obj.to_dict(),
                 }
 
                 menu = Menus(defaults=defaults)
-
-                server_obj, env_obj, svc_file_obj = self.__get_data(menu, name)
-                server_obj["name"] = name
-                env_obj["CONTAINER_NAME"] = name
-                svc_file_obj["name"] = name
-
-                servers[name] = server_obj
-                envs[name] = env_obj
-                server_files[name] = svc_file_obj
+                records = self.__get_records(menu, name)
 
                 clear(0.5)
 
                 if confirm(msg=f"Update server '{name}'"):
-                    servers_list = [svc for _, svc in servers.items()]
-                    envs_list = [env for _, env in envs.items()]
-                    server_files_list = [
-                        svc_file for _, svc_file in server_files.items()
-                    ]
-
-                    compose["servers"] = servers_list
-                    data["compose"] = compose
-                    data["envs"] = envs_list
-                    data["server_files"] = server_files_list
-                    self.file_manager.save_files(data)
-                    print(f"server '{name}' removed and files updated.")
+                    project.put(*records)
+                    self.file_manager.save_files(
+                        project.to_dict(), servers=[name]
+                    )
+                    print(f"server '{name}' updated and files saved.")
 
             elif database:
-                current: dict[str, str] = compose.get("database", {}) or {}
-                defaults = (
-                    None
-                    if current == {}
-                    else {"database": current}  # type: ignore
+                current = project.database
+                db_defaults = (
+                    {"database": current.to_dict()}
+                    if isinstance(current, Database)
+                    else None
                 )
-                menu = Menus(defaults=defaults)
+                menu = Menus(defaults=db_defaults)
                 db = menu.database()
                 if confirm(msg="Update database?"):
-                    compose["database"] = db
-                    data["compose"] = compose
-                    self.file_manager.save_files(data)
+                    project.database = Database.from_dict(db)
+                    self.file_manager.save_files(project.to_dict(), servers=[])
                     print("Database was updated.")
 
             elif web:
-                current = compose.get("web", False)
                 if confirm(msg="Update web status?"):
-                    compose["web"] = not current
-                    data["compose"] = compose
-                    self.file_manager.save_files(data)
+                    # Missing means off
+                    project.web = project.web is not True
+                    self.file_manager.save_files(project.to_dict(), servers=[])
                     print("Web status was changed.")
 
             else:
@@ -328,8 +264,9 @@ class Builder(CustomGroup):
                     "Use --add, --remove, --change, --web or --database flag."
                 )
                 print("Use --servers [server] for faster output.")
-                for s in servers:
-                    print(f" - {s.get('name')}")
+                for name in project.names:
+                    print(f" - {name}")
+                exit(1)
 
         return Command(
             name=inspect.currentframe().f_code.co_name,  # type: ignore
@@ -340,26 +277,67 @@ class Builder(CustomGroup):
 
     def build(self) -> Command:
         help = "Build the files for the containerization."
-        options: list[Option] = []
+        options = [
+            Option(
+                ["--server", "servers"],
+                type=self.server_type,
+                multiple=True,
+                help="Only build these servers.",
+            ),
+            Option(
+                ["-j", "--jobs"],
+                type=IntRange(min=1),
+                default=None,
+                help="Parallel jar downloads.",
+            ),
+            Option(
+                ["--watch"],
+                is_flag=True,
+                default=False,
+                help="Rebuild when data.json, the templates or assets change.",
+            ),
+            Option(
+                ["--up"],
+                is_flag=True,
+                default=False,
+                help="With --watch, restart the rebuilt services.",
+            ),
+        ]
+
+        def callback(
+            servers: tuple[str, ...] = (),
+            jobs: int | None = None,
+            watch: bool = False,
+            up: bool = False,
+        ) -> None:
+            if up and not watch:
+                raise UsageError("--up only applies with --watch.")
 
-        def callback() -> None:
             clear(0)
 
-            path: Path = self.cwd.joinpath("data.json")
+            if jobs:
+                self.file_manager.jobs = jobs
+
+            state = self.state
 
-            if not path.exists():
+            if not state.exists:
                 exit(self.no_json)
 
-            data: dicts = self.file_manager.read_json(path) or {}
+            data: dicts = state.data
 
             if not data:
                 exit(self.no_data)
 
             clear(0)
-            self.file_manager.save_files(data, build=True)
+            self.file_manager.save_files(
+                data, build=True, servers=servers or None
+            )
             clear(0)
             print("Files saved!")
 
+            if watch:
+                self.__watch(set(servers) or None, up)
+
         return Command(
             name=inspect.currentframe().f_code.co_name,  # type: ignore
             help=help,
@@ -367,6 +345,96 @@ class Builder(CustomGroup):
             params=options,  # type: ignore
         )
 
+    def cache(self) -> Command:
+        help = "Manage the local cache of server jars."
+        group = Group(
+            name=inspect.currentframe().f_code.co_name,  # type: ignore
+            help=help,
+        )
+
+        prune_options = [
+            Option(["--max-size"], type=BYTE_SIZE, default=None),
+            Option(["--all", "clear_all"], is_flag=True, default=False),
+        ]
+
+        def prune(max_size: int | None = None, clear_all: bool = False) -> None:
+            jar_cache = self.file_manager.jar_cache
+            removed, freed = jar_cache.prune(0 if clear_all else max_size)
+            print(
+                f"Removed {removed} jars ({freed / 1024**2:.1f} MB), "
+                f"{jar_cache.size() / 1024**2:.1f} MB left in {jar_cache.root}"
+            )
+            if clear_all:
+                removed = MetadataCache().clear()
+                print(f"Removed {removed} cached API responses.")
+
+        group.add_command(
+            Command(
+                name="prune",
+                help="Evict least recently used jars over the size limit.",
+                callback=prune,
+                params=prune_options,  # type: ignore
+            )
+        )
+        return group
+
+    def __watch(self, only: set[str] | None, up: bool) -> None:
+        """
+        Rebuild the servers whose records change in data.json (every server
+        if a template or an asset copied into them changes) until
+        interrupted.
+        """
+        data_json = self.cwd.joinpath("data.json").absolute()
+        templates = engine()
+        template_dir = Path(str(templates.root.joinpath(".env.j2"))).parent
+        # Dockerfiles, run.sh, eula.txt and the README, besides templates
+        assets = Path(str(files("src.assets").joinpath("README.md"))).parent
+        asset_dirs = [
+            path
+            for path in assets.iterdir()
+            if path.is_dir() and not path.name.startswith("__")
+        ]
+
+        try:
+            previous = self.state.project
+        except ModelError:
+            previous = Project()
+
+        print("Watching data.json, templates and assets, press Ctrl+C to stop.")
+        with watcher([data_json, template_dir, assets, *asset_dirs]) as changes:
+            try:
+                while True:
+                    changed = changes.wait()
+                    state = self.state
+                    try:
+                        project = state.project
+                    except ModelError as exc:
+                        print(f"WARNING: invalid data.json, {exc}")
+                        continue
+                    if not state.data:
+                        print("WARNING: data.json is empty.")
+                        continue
+
+                    if changed - {data_json}:
+                        templates.reload()
+                        targets = set(project.servers)
+                    else:
+                        targets = project.changed(previous)
+                    if only is not None:
+                        targets &= only
+                    previous = project
+
+                    self.file_manager.save_files(
+                        state.data, build=True, servers=targets
+                    )
+                    names = sorted(targets)
+                    print(f"Rebuilt: {', '.join(names) or 'compose file'}")
+
+                    if up and names:
+                        self.compose_manager.up(False, services=names)
+            except KeyboardInterrupt:
+                print("\nStopped watching.")
+
     def __get_data(
         self, menu: Menus, name: str | None = None
     ) -> tuple[dicts, dicts, dicts]:
@@ -381,6 +449,25 @@ class Builder(CustomGroup):
 
         return (server, env, server_files)
 
+    def __get_records(
+        self, menu: Menus, name: str
+    ) -> tuple[Server, Env, ServerFiles]:
+        server, env, server_files = self.__get_data(menu, name)
+        return self.__records(
+            {**server, "name": name},
+            {**env, "CONTAINER_NAME": name},
+            {**server_files, "name": name},
+        )
+
+    def __records(
+        self, server: dicts, env: dicts, server_files: dicts
+    ) -> tuple[Server, Env, ServerFiles]:
+        return (
+            Server.from_dict(server),
+            Env.from_dict(env),
+            ServerFiles.from_dict(server_files),
+        )
+
     def __get_name(self, message: str) -> str:
         while True:
             clear(0.5)
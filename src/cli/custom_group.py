@@ -12,6 +12,7 @@ from click import Command, Group
 
 from ..core.docker import ComposeManager
 from ..core.files import FileManager
+from ..core.state import ProjectState
 from .param_types import DETACH_KEYS, SERVER_TYPE, ServerType
 
 #################################################
@@ -33,21 +34,7 @@ class CustomGroup(Group):
         self.file_manager = FileManager()
         self.compose_manager = ComposeManager()
 
-        try:
-            data: dicts = (
-                self.file_manager.read_json(self.cwd.joinpath("data.json"))
-                or {}
-            )
-            compose: dicts = data.get("compose", {}) or {}
-            svc_list: list[dicts] = compose.get("servers", []) or []
-            names: list[str] = []
-            for s in svc_list:
-                name = s.get("name")
-                if isinstance(name, str):
-                    names.append(name)
-            servers = names
-        except Exception:
-            servers = []
+        servers = self.state.names
 
         if servers:
             # create an instance bound to the discovered server names
@@ -58,6 +45,11 @@ class CustomGroup(Group):
 
         self.__register_commands()
 
+    @property
+    def state(self) -> ProjectState:
+        """Shared, cached state of the project's data.json."""
+        return ProjectState.load(self.cwd.joinpath("data.json"))
+
     def __register_commands(self) -> None:
         # Iterate only functions declared on the subclass (avoid inherited click methods)
         for name, func in inspect.getmembers(
@@ -4,12 +4,27 @@
 from __future__ import annotations
 
 import inspect
-
-from InquirerPy import inquirer  # type: ignore
-from InquirerPy.validator import EmptyInputValidator  # type: ignore
-from click import Command, Option
+import os
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+from click import (
+    Choice,
+    Command,
+    FloatRange,
+    Group,
+    IntRange,
+    Option,
+)
+from click import Path as ClickPath
+from click import get_current_context
 
 from .custom_group import CustomGroup
+from .param_types import BYTE_SIZE
+
+if TYPE_CHECKING:
+    from ..core.repository import Repository, Snapshot
 
 
 #################################################
@@ -17,11 +32,6 @@ from .custom_group import CustomGroup
 #################################################
 class Manager(CustomGroup):
 
-    def __init__(self) -> None:
-        super().__init__()
-        self.compose_manager.sleep = 2
-        self.file_manager.sleep = 2
-
     def open(self) -> Command:
         help = "Open the terminal of a server."
         options = [
@@ -45,11 +55,459 @@ class Manager(CustomGroup):
 
     def backup(self) -> Command:
 
-        help = "Create a backup of the containers."
-        options: list[Option] = []
+        help = "Create and manage backups of the containers."
+        options = [
+            Option(
+                ["-j", "--jobs"],
+                type=IntRange(min=1),
+                default=None,
+                help="Servers backed up at once.",
+            ),
+            Option(
+                ["--mode"],
+                type=Choice(["incremental", "full"]),
+                default="incremental",
+                show_default=True,
+                help="Read the files changed since the last backup, or all.",
+            ),
+            Option(
+                ["--compression"],
+                type=Choice(["auto", "zstd", "gzip"]),
+                default=None,
+                help="Compression of new data, zstd if installed by default.",
+            ),
+            Option(
+                ["--level"],
+                type=IntRange(min=1, max=22),
+                default=None,
+                help="Compression level, 1-22 for zstd (3 by default) and "
+                "1-9 for gzip (6 by default).",
+            ),
+            Option(
+                ["--prune/--no-prune"],
+                default=True,
+                help="Drop the backups the retention policy doesn't keep.",
+            ),
+            Option(
+                ["--limit"],
+                type=BYTE_SIZE,
+                default=None,
+                help="Throughput cap of the backups per second (20MB).",
+            ),
+            Option(
+                ["--cpu-limit"],
+                type=FloatRange(min=1),
+                default=None,
+                help="Server CPU percent above which backups slow down.",
+            ),
+            Option(
+                ["--nice/--no-nice"],
+                default=None,
+                help="Run the backups with the lowest CPU and I/O priority.",
+            ),
+            Option(
+                ["--database-jobs"],
+                type=IntRange(min=1),
+                default=None,
+                help="Parallel pg_dump workers (4 by default).",
+            ),
+            Option(
+                ["--database-level"],
+                type=IntRange(min=0, max=9),
+                default=None,
+                help="Compression level of the database dump.",
+            ),
+        ]
 
-        def callback() -> None:
-            self.compose_manager.back_up(self.cwd)
+        def callback(
+            jobs: int | None = None,
+            mode: str = "incremental",
+            compression: str | None = None,
+            level: int | None = None,
+            prune: bool = True,
+            limit: int | None = None,
+            cpu_limit: float | None = None,
+            nice: bool | None = None,
+            database_jobs: int | None = None,
+            database_level: int | None = None,
+        ) -> None:
+            if get_current_context().invoked_subcommand is not None:
+                return
+            from ..core.backup import BackupError
+            from ..core.repository import RepositoryError
+
+            try:
+                results = self.compose_manager.back_up(
+                    self.cwd,
+                    jobs,
+                    mode,
+                    prune,
+                    compression=compression,
+                    level=level,
+                    limit=limit,
+                    cpu_limit=cpu_limit,
+                    nice=nice,
+                    database_jobs=database_jobs,
+                    database_level=database_level,
+                )
+            except (BackupError, RepositoryError) as exc:
+                exit(f"ERROR: {exc}")
+            if not all(result.ok for result in results):
+                exit(1)
+
+        group = Group(
+            name=inspect.currentframe().f_code.co_name,  # type: ignore
+            help=help,
+            callback=callback,
+            params=options,  # type: ignore
+            invoke_without_command=True,
+        )
+
+        def list_snapshots(server: str | None = None) -> None:
+            repository = self.compose_manager.backups(self.cwd).repository
+            snapshots = repository.catalog(server)
+            if not snapshots:
+                exit("ERROR: No backups found.")
+
+            print(
+                f"{'SERVER':<20} {'SNAPSHOT':<20} {'KIND':<12} "
+                f"{'FILES':>7} {'SIZE':>10} {'NEW':>10}"
+            )
+            for snapshot in snapshots:
+                print(
+                    f"{snapshot.server:<20} {snapshot.id:<20} "
+                    f"{snapshot.kind:<12} {snapshot.count:>7} "
+                    f"{snapshot.size / 1024**2:>8.1f}MB "
+                    f"{snapshot.added / 1024**2:>8.1f}MB"
+                )
+            print(f"Repository size: {repository.size() / 1024**2:.1f} MB")
+
+        def restore(server: str, to: str, snapshot: str | None = None) -> None:
+            repository = self.compose_manager.backups(self.cwd).repository
+            chosen = find(repository, server, snapshot)
+
+            start = perf_counter()
+            size = repository.extract(chosen, Path(to))
+            elapsed = perf_counter() - start
+            print(
+                f"Restored {chosen.id} of {server} into {to}: "
+                f"{size / 1024**2:.1f} MB in {elapsed:.1f}s "
+                f"({size / 1024**2 / max(elapsed, 1e-9):.1f} MB/s)"
+            )
+
+        def export(
+            server: str,
+            output: str,
+            snapshot: str | None = None,
+            level: int | None = None,
+        ) -> None:
+            from ..core.repository import RepositoryError
+
+            repository = self.compose_manager.backups(self.cwd).repository
+            chosen = find(repository, server, snapshot)
+
+            suffixes = {".zst": "zstd", ".gz": "gzip", ".tgz": "gzip"}
+            compression = suffixes.get(Path(output).suffix, "none")
+            start = perf_counter()
+            try:
+                with open(output, "wb") as f:
+                    size = repository.export(chosen, f, compression, level)
+            except RepositoryError as exc:
+                Path(output).unlink(missing_ok=True)
+                exit(f"ERROR: {exc}")
+            elapsed = perf_counter() - start
+            print(
+                f"Exported {chosen.id} of {server} to {output}: "
+                f"{size / 1024**2:.1f} MB into "
+                f"{Path(output).stat().st_size / 1024**2:.1f} MB "
+                f"in {elapsed:.1f}s"
+            )
+
+        def prune(
+            server: str | None = None,
+            max_size: int | None = None,
+            **counts: int | None,
+        ) -> None:
+            from ..core.backup import BackupError
+            from ..core.retention import Policy
+
+            manager = self.compose_manager.backups(self.cwd)
+            policy = manager.policy
+            # Counts given here replace the configured ones altogether
+            if any(count is not None for count in counts.values()):
+                policy = Policy(
+                    counts["keep"] or 0,
+                    counts["hourly"] or 0,
+                    counts["daily"] or 0,
+                    counts["weekly"] or 0,
+                    counts["monthly"] or 0,
+                    policy.max_bytes,
+                )
+            if max_size is not None:
+                policy.max_bytes = max_size
+            try:
+                with manager.locked():
+                    print(manager.prune(policy, server).status())
+            except BackupError as exc:
+                exit(f"ERROR: {exc}")
+
+        def schedule(
+            every: str, interval: tuple[str, ...], jitter: float
+        ) -> None:
+            from ..core.backup import BackupError
+            from ..core.repository import RepositoryError
+            from ..core.scheduler import parse_duration
+
+            # The options of the group apply to every scheduled backup
+            options = get_current_context().parent.params  # type: ignore
+            try:
+                period = parse_duration(every)
+                intervals = {
+                    name: parse_duration(value)
+                    for name, _, value in (
+                        item.partition("=") for item in interval
+                    )
+                }
+            except ValueError as exc:
+                exit(f"ERROR: {exc}.")
+            if period <= 0 or any(value <= 0 for value in intervals.values()):
+                exit("ERROR: Intervals must be positive.")
+
+            try:
+                self.compose_manager.schedule(
+                    self.cwd,
+                    period,
+                    intervals,
+                    jitter,
+                    options["prune"],
+                    options["jobs"],
+                    options["mode"],
+                    compression=options["compression"],
+                    level=options["level"],
+                    limit=options["limit"],
+                    cpu_limit=options["cpu_limit"],
+                    nice=options["nice"],
+                    database_jobs=options["database_jobs"],
+                    database_level=options["database_level"],
+                )
+            except (BackupError, RepositoryError) as exc:
+                exit(f"ERROR: {exc}")
+
+        def verify(full: bool = False, jobs: int | None = None) -> None:
+            from ..core.backup import BackupError
+            from ..core.repository import RepositoryError
+
+            manager = self.compose_manager.backups(self.cwd)
+            try:
+                result = manager.verify(full, jobs)
+            except (BackupError, RepositoryError) as exc:
+                exit(f"ERROR: {exc}")
+            for error in result.errors:
+                print(f"DAMAGED: {error}")
+            print(result.status())
+            if not result.ok:
+                exit(1)
+
+        def find(
+            repository: Repository, server: str, snapshot: str | None
+        ) -> Snapshot:
+            snapshots = repository.catalog(server)
+            if snapshot is not None:
+                snapshots = [s for s in snapshots if s.id == snapshot]
+            if not snapshots:
+                exit(f"ERROR: No backup of {server} found.")
+            return repository.load(server, snapshots[-1].id)
+
+        server_option = Option(
+            ["--server"], type=self.server_type, default=None
+        )
+        group.add_command(
+            Command(
+                name="list",
+                help="List the backups of the servers.",
+                callback=list_snapshots,
+                params=[server_option],
+            )
+        )
+        group.add_command(
+            Command(
+                name="restore",
+                help="Extract a backup of a server into a folder.",
+                callback=restore,
+                params=[
+                    Option(["--server"], type=self.server_type, required=True),
+                    Option(
+                        ["--snapshot"],
+                        default=None,
+                        help="Snapshot to restore, the latest by default.",
+                    ),
+                    Option(
+                        ["--to"],
+                        type=ClickPath(file_okay=False),
+                        required=True,
+                        help="Folder to write the files into.",
+                    ),
+                ],
+            )
+        )
+        group.add_command(
+            Command(
+                name="export",
+                help="Write a backup of a server as a tar archive.",
+                callback=export,
+                params=[
+                    Option(["--server"], type=self.server_type, required=True),
+                    Option(
+                        ["--snapshot"],
+                        default=None,
+                        help="Snapshot to export, the latest by default.",
+                    ),
+                    Option(
+                        ["-o", "--output"],
+                        type=ClickPath(dir_okay=False),
+                        required=True,
+                        help="Archive to write (.tar.zst, .tar.gz or .tar).",
+                    ),
+                    Option(
+                        ["--level"],
+                        type=IntRange(min=1, max=22),
+                        default=None,
+                    ),
+                ],
+            )
+        )
+        group.add_command(
+            Command(
+                name="prune",
+                help="Drop the backups the retention policy doesn't keep.",
+                callback=prune,
+                params=[
+                    Option(
+                        ["--keep"],
+                        type=IntRange(min=1),
+                        default=None,
+                        help="Latest backups kept.",
+                    ),
+                    *[
+                        Option(
+                            [f"--{period}"],
+                            type=IntRange(min=0),
+                            default=None,
+                            help=f"{unit} whose last backup is kept.",
+                        )
+                        for period, unit in [
+                            ("hourly", "Hours"),
+                            ("daily", "Days"),
+                            ("weekly", "Weeks"),
+                            ("monthly", "Months"),
+                        ]
+                    ],
+                    Option(
+                        ["--max-size"],
+                        type=BYTE_SIZE,
+                        default=None,
+                        help="Space the backups of a server can take (50GB).",
+                    ),
+                    server_option,
+                ],
+            )
+        )
+        group.add_command(
+            Command(
+                name="verify",
+                help="Check the backups against their hashes.",
+                callback=verify,
+                params=[
+                    Option(
+                        ["--full"],
+                        is_flag=True,
+                        default=False,
+                        help="Check everything, not only what changed.",
+                    ),
+                    Option(
+                        ["-j", "--jobs"],
+                        type=IntRange(min=1),
+                        default=None,
+                        help="Files checked at once (number of cores).",
+                    ),
+                ],
+            )
+        )
+        group.add_command(
+            Command(
+                name="schedule",
+                help="Back up the servers periodically until stopped.",
+                callback=schedule,
+                params=[
+                    Option(
+                        ["--every"],
+                        default=os.environ.get("MCDOCKER_BACKUP_EVERY", "1h"),
+                        show_default=True,
+                        help="Time between backups (30m, 6h, 1d).",
+                    ),
+                    Option(
+                        ["--interval"],
+                        multiple=True,
+                        help="Time between backups of one server (NAME=6h).",
+                    ),
+                    Option(
+                        ["--jitter"],
+                        type=FloatRange(min=0, max=1),
+                        default=0.1,
+                        show_default=True,
+                        help="Random delay, as a fraction of the interval.",
+                    ),
+                ],
+            )
+        )
+        return group
+
+    def restore(self) -> Command:
+
+        help = "Restore a backup into its container."
+        options = [
+            Option(["--server"], type=self.server_type, default=None),
+            Option(
+                ["--snapshot"],
+                default=None,
+                help="Snapshot to restore, the latest by default.",
+            ),
+            Option(
+                ["--database"],
+                is_flag=True,
+                default=False,
+                help="Restore the database dump of the snapshot.",
+            ),
+            Option(
+                ["-j", "--jobs"],
+                type=IntRange(min=1),
+                default=None,
+                help="Parallel pg_restore jobs.",
+            ),
+        ]
+
+        def callback(
+            server: str | None = None,
+            snapshot: str | None = None,
+            database: bool = False,
+            jobs: int | None = None,
+        ) -> None:
+            if server is None and not database:
+                exit("ERROR: Choose a --server and/or --database to restore.")
+            from ..core.backup import BackupError
+
+            try:
+                results = self.compose_manager.restore(
+                    self.cwd,
+                    [server] if server else [],
+                    snapshot,
+                    database,
+                    jobs,
+                )
+            except BackupError as exc:
+                exit(f"ERROR: {exc}")
+            if not all(result.ok for result in results):
+                exit(1)
 
         return Command(
             name=inspect.currentframe().f_code.co_name,  # type: ignore
@@ -141,3 +599,28 @@ class Manager(CustomGroup):
             callback=callback,
             params=options,  # type: ignore
         )
+
+    def stats(self) -> Command:
+
+        help = "Show CPU and memory use of the containers."
+        options: list[Option] = []
+
+        def callback() -> None:
+            stats = self.compose_manager.stats()
+            if not stats:
+                exit("ERROR: No containers found. Use 'up' first.")
+
+            print(f"{'NAME':<24} {'CPU %':>7} {'MEMORY':>10} {'LIMIT':>10}")
+            for name, item in sorted(stats.items()):
+                print(
+                    f"{name:<24} {item['cpu']:>7.2f} "
+                    f"{item['memory'] / 1024**2:>8.1f}MB "
+                    f"{item['limit'] / 1024**2:>8.1f}MB"
+                )
+
+        return Command(
+            name=inspect.currentframe().f_code.co_name,  # type: ignore
+            help=help,
+            callback=callback,
+            params=options,  # type: ignore
+        )
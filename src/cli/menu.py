@@ -322,10 +322,10 @@ class Menus:
         ).execute()
 
     def __get_version(self, type: str) -> str | None:
-        import requests  # type: ignore
+        from ..core.downloader import Downloader
 
-        response = requests.get(f"https://fill.papermc.io/v3/projects/{type}")
-        json_response = response.json()
+        api = "https://fill.papermc.io/v3/projects"
+        json_response = Downloader(api).get(type) or {}
         versions: dict[str, list[str]] = json_response.get("versions", {}) or {}
         choices: list[Any] = [Choice(value=None, name="Latest")]
         for version in versions.values():
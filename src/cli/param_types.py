@@ -4,15 +4,26 @@
 from __future__ import annotations
 
 import re
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 from click import ParamType
 
+from ..utils.size import parse_size
+
 
 #################################################
 # CODE
 #################################################
-class DetachKeysType(ParamType):
+# ParamType is generic from click 8.4 on, subscript it for the type checker
+# only so older releases still import this module
+if TYPE_CHECKING:
+    StrParamType = ParamType[str]
+    IntParamType = ParamType[int]
+else:
+    StrParamType = IntParamType = ParamType
+
+
+class DetachKeysType(StrParamType):
     """Click param type for `--detach-keys`.
 
     Accepts one or more key-pairs joined with `,`, where each pair is two
@@ -67,7 +78,7 @@ DETACH_KEYS = DetachKeysType()
 DETACH_KEYS.help = DetachKeysType.help  # type: ignore[attr-defined]
 
 
-class ServerType(ParamType):
+class ServerType(StrParamType):
     """ParamType for server names used by `CustomGroup`.
 
     This type can be constructed without choices and later populated with
@@ -106,3 +117,37 @@ class ServerType(ParamType):
 # Reusable empty instance (can be populated later)
 SERVER_TYPE = ServerType()
 SERVER_TYPE.help = ServerType.help  # type: ignore[attr-defined]
+
+
+class ByteSizeType(IntParamType):
+    """Click param type for sizes like `512M`, `2G` or `1.5T`.
+
+    Parsed by `parse_size`: units are binary (K = 1024 bytes) and case
+    insensitive, a plain number is taken as bytes. The value is returned as
+    an integer amount of bytes.
+    """
+
+    name = "size"
+
+    help = "Size in bytes, or with a unit suffix, e.g. '512M' or '2G'."
+
+    def get_metavar(self, param: Any, ctx: Any = None) -> str:
+        return "SIZE"
+
+    def convert(self, value: Any, param: Any, ctx: Any) -> Any:
+        if value is None or isinstance(value, int):
+            return value
+
+        try:
+            return parse_size(str(value))
+        except ValueError:
+            self.fail(
+                f"Invalid size '{value}'. Use a number with an optional unit, e.g. '512M' or '2G'",
+                param,
+                ctx,
+            )
+
+
+# Reusable instance
+BYTE_SIZE = ByteSizeType()
+BYTE_SIZE.help = ByteSizeType.help  # type: ignore[attr-defined]
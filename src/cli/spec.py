@@ -0,0 +1,341 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+import json
+from pathlib import Path
+import re
+from typing import Any
+
+from importlib_resources import files  # type: ignore
+import psutil  # type: ignore
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+
+class SpecError(ValueError):
+    """Raised when a spec file is invalid."""
+
+
+class Spec:
+    """
+    Non-interactive counterpart of `Menus`. Reads a spec file (JSON, TOML or
+    YAML) describing the whole network and builds the `data.json` contents,
+    applying the same defaults and validation rules as the prompts.
+
+    A server entry may set `count` to create replicas, `{i}` in its name is
+    replaced by the replica number (1-based) and published ports are shifted
+    by one per replica. A top-level `defaults` entry is merged into every
+    server.
+    """
+
+    server_keys = {
+        "name",
+        "count",
+        "type",
+        "version",
+        "jar_file",
+        "ports",
+        "expose",
+        "resources",
+        "heap",
+        "recommended_args",
+        "java_args",
+    }
+
+    def __init__(self, path: Path) -> None:
+        self.spec = self.__read(path)
+
+        self.cpus: float = psutil.cpu_count(logical=True) or 0
+        self.memory: int = (
+            psutil.virtual_memory().available // 1024**2 - 512 or 0
+        )
+
+        self.published: dict[int, str] = {}
+
+    def build(self) -> dicts:
+        """Validate the spec and return the data to save as `data.json`."""
+        entries = self.spec.get("servers")
+        if not isinstance(entries, list) or not entries:
+            raise SpecError("spec must define a non-empty 'servers' list.")
+
+        defaults = self.spec.get("defaults", {}) or {}
+        if not isinstance(defaults, dict):
+            raise SpecError("'defaults' must be a mapping.")
+
+        servers: list[dicts] = []
+        envs: list[dicts] = []
+        server_files: list[dicts] = []
+        for entry in entries:
+            if not isinstance(entry, dict):
+                raise SpecError("every server must be a mapping.")
+            for name, replica in self.__expand({**defaults, **entry}):
+                server, env, server_file = self.__server(name, replica)
+                servers.append(server)
+                envs.append(env)
+                server_files.append(server_file)
+
+        names = [svc["name"] for svc in servers]
+        duplicated = sorted({n for n in names if names.count(n) > 1})
+        if duplicated:
+            raise SpecError(f"duplicated server names: {', '.join(duplicated)}")
+        if len(names) > 1 and "proxy" not in names:
+            raise SpecError("a network needs a server named 'proxy'.")
+
+        database = self.spec.get("database") or {}
+        return {
+            "compose": {
+                "servers": servers,
+                "database": self.__database(database) if database else {},
+                "web": bool(self.spec.get("web", False)),
+            },
+            "envs": envs,
+            "server_files": server_files,
+        }
+
+    def __read(self, path: Path) -> dicts:
+        suffix = path.suffix.lower()
+        try:
+            if suffix == ".json":
+                data = json.loads(path.read_text(encoding="utf-8"))
+            elif suffix == ".toml":
+                import tomllib
+
+                data = tomllib.loads(path.read_text(encoding="utf-8"))
+            elif suffix in (".yaml", ".yml"):
+                try:
+                    import yaml  # type: ignore
+                except ImportError:
+                    raise SpecError("YAML specs require PyYAML installed.")
+                data = yaml.safe_load(path.read_text(encoding="utf-8"))
+            else:
+                raise SpecError(f"unsupported spec format '{suffix}'.")
+        except SpecError:
+            raise
+        except Exception as exc:
+            raise SpecError(f"couldn't read spec {path}: {exc}")
+
+        if not isinstance(data, dict):
+            raise SpecError("spec must be a mapping.")
+        return data
+
+    def __expand(self, entry: dicts) -> list[tuple[str, dicts]]:
+        unknown = set(entry) - self.server_keys
+        if unknown:
+            raise SpecError(
+                f"unknown server keys: {', '.join(sorted(unknown))}"
+            )
+
+        name = str(entry.get("name") or "").strip().lower()
+        if not name:
+            raise SpecError("every server needs a name.")
+
+        count = entry.get("count", 1)
+        if not isinstance(count, int) or count < 1:
+            raise SpecError(
+                f"server '{name}': count must be a positive integer."
+            )
+        if count > 1 and "{i}" not in name:
+            name += "-{i}"
+
+        replicas: list[tuple[str, dicts]] = []
+        for i in range(1, count + 1):
+            replica = dict(entry)
+            replica["ports"] = {
+                port_name: self.__port(name, port) + i - 1
+                for port_name, port in self.__ports(name, entry).items()
+            }
+            replicas.append((name.replace("{i}", str(i)), replica))
+        return replicas
+
+    def __ports(self, name: str, entry: dicts) -> dict[str, Any]:
+        ports = entry.get("ports", {"HOST": 25565})
+        if not isinstance(ports, dict) or not ports:
+            raise SpecError(
+                f"server '{name}': ports must be a non-empty mapping."
+            )
+        return ports
+
+    def __port(self, name: str, port: Any) -> int:
+        if not isinstance(port, int) or not 1 <= port <= 2**16 - 1:
+            raise SpecError(f"server '{name}': invalid port {port!r}.")
+        return port
+
+    def __server(self, name: str, entry: dicts) -> tuple[dicts, dicts, dicts]:
+        proxy = "proxy" in name
+        ports: dict[str, int] = entry["ports"]
+        for port in ports.values():
+            self.__port(name, port)
+
+        # Same default as the prompts: proxies publish, servers expose
+        expose: list[str] = entry.get("expose", [] if proxy else list(ports))
+        if not isinstance(expose, list) or set(expose) - set(ports):
+            raise SpecError(f"server '{name}': expose must list port names.")
+
+        published = [p for n, p in ports.items() if n not in expose]
+        for port in published:
+            if port in self.published:
+                raise SpecError(
+                    f"server '{name}': port {port} already used by "
+                    f"'{self.published[port]}'."
+                )
+            self.published[port] = name
+
+        resources = self.__resources(name, entry.get("resources", {}) or {})
+        heaps = self.__heaps(name, entry.get("heap", {}) or {}, resources)
+
+        server: dicts = {
+            "name": name,
+            "build": {"context": f"./servers/{name}/"},
+            "env_file": f"./servers/{name}/.env",
+            "working_dir": f"/{name}",
+        }
+        if published:
+            server["ports"] = [f"{p}:{p}" for p in published]
+        if expose:
+            server["expose"] = [ports[n] for n in expose]
+        server["resources"] = {
+            scope: {
+                "cpus": values["cpus"],
+                "memory": str(values["memory"] / 1024) + "g",
+            }
+            for scope, values in resources.items()
+        }
+
+        jar_file = str(
+            entry.get("jar_file") or f"{'proxy' if proxy else 'server'}.jar"
+        )
+        java_args = entry.get("java_args")
+        if java_args is None:
+            java_args = (
+                self.__recommended_args()
+                if entry.get("recommended_args", not proxy)
+                else ""
+            )
+
+        env: dicts = {
+            "CONTAINER_NAME": name,
+            "SERVER_JAR": jar_file,
+            "JAVA_ARGS": str(java_args),
+            "MIN_HEAP_SIZE": heaps[0],
+            "MAX_HEAP_SIZE": heaps[1],
+            "HOST_PORTS": ports,
+        }
+
+        choices = ["velocity"] if proxy else ["folia", "paper"]
+        server_type = entry.get("type", choices[-1])
+        if server_type not in choices:
+            raise SpecError(
+                f"server '{name}': type must be one of {', '.join(choices)}."
+            )
+        version = entry.get("version")
+        server_file: dicts = {
+            "name": name,
+            "server": {
+                "jar_file": jar_file,
+                "type": server_type,
+                "version": str(version) if version else None,
+            },
+        }
+
+        return server, env, server_file
+
+    def __resources(self, name: str, resources: dicts) -> dict[str, dicts]:
+        try:
+            cpus_limit = float(resources.get("cpus", 1))
+            cpus_reservation = float(resources.get("cpus_reservation", 0))
+            memory_limit = int(resources.get("memory", 1024))
+            memory_reservation = int(resources.get("memory_reservation", 256))
+        except (TypeError, ValueError):
+            raise SpecError(f"server '{name}': resources must be numbers.")
+
+        if not 0 <= cpus_limit <= self.cpus:
+            raise SpecError(
+                f"server '{name}': cpus {cpus_limit} exceeds the "
+                f"{self.cpus} left."
+            )
+        if not 0 <= cpus_reservation <= cpus_limit:
+            raise SpecError(f"server '{name}': cpus_reservation exceeds cpus.")
+        if not 0 <= memory_limit <= self.memory:
+            raise SpecError(
+                f"server '{name}': memory {memory_limit}MB exceeds the "
+                f"{self.memory}MB left."
+            )
+        if not 0 <= memory_reservation <= memory_limit:
+            raise SpecError(
+                f"server '{name}': memory_reservation exceeds memory."
+            )
+
+        # Allocate like the prompts do, each server takes from what is left
+        self.cpus -= cpus_limit
+        self.memory -= memory_limit
+
+        return {
+            "limits": {"cpus": cpus_limit, "memory": memory_limit},
+            "reservations": {
+                "cpus": cpus_reservation,
+                "memory": memory_reservation,
+            },
+        }
+
+    def __heaps(
+        self, name: str, heap: dicts, resources: dict[str, dicts]
+    ) -> list[str]:
+        reservation: int = resources["reservations"]["memory"]
+        limit: int = resources["limits"]["memory"]
+        min_value = heap.get("min", reservation)
+        max_value = heap.get("max", limit)
+        invalid = SpecError(f"server '{name}': heap sizes must be numbers.")
+        numbers = (int, float, str)
+        if not isinstance(min_value, numbers):
+            raise invalid
+        if not isinstance(max_value, numbers):
+            raise invalid
+        try:
+            min_heap = int(min_value)
+            max_heap = int(max_value)
+        except ValueError:
+            raise invalid
+
+        if not reservation <= min_heap <= limit:
+            raise SpecError(
+                f"server '{name}': min heap must be between {reservation} "
+                f"and {limit}."
+            )
+        if not min_heap <= max_heap <= limit:
+            raise SpecError(
+                f"server '{name}': max heap must be between {min_heap} "
+                f"and {limit}."
+            )
+        return [f"{min_heap}M", f"{max_heap}M"]
+
+    def __recommended_args(self) -> str:
+        txt_file = files("src.assets.config").joinpath("recommended-args.txt")
+        data = txt_file.read_text().splitlines(keepends=True)
+        return " ".join(data).replace("\n", "")
+
+    def __database(self, database: dicts) -> dict[str, str]:
+        db = {
+            key: str(database.get(key) or "")
+            for key in ("user", "password", "db")
+        }
+        if not db["user"] or not db["db"]:
+            raise SpecError("database needs a 'user' and a 'db' name.")
+        if database.get("container"):
+            db["container"] = str(database["container"])
+
+        # Same rule as the password prompt
+        password = db["password"]
+        if (
+            len(password) < 8
+            or not re.search(r"[A-Z]", password)
+            or not re.search(r"[0-9]", password)
+        ):
+            raise SpecError(
+                "database password must have 8+ characters, caps and numbers."
+            )
+        return db
@@ -0,0 +1,1063 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+import hashlib
+from io import BytesIO
+import os
+from pathlib import Path
+import shutil
+import tarfile
+from tempfile import TemporaryFile
+from threading import Thread
+from time import mktime, perf_counter, strftime, strptime, time
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Iterator
+
+from ..utils.lock import FileLock, LockedError
+from ..utils.progress import Progress
+from ..utils.size import parse_size
+from .rcon import DEFAULT_PORT, Rcon, RconError, properties
+from .repository import (
+    FULL,
+    INCREMENTAL,
+    Location,
+    Repository,
+    RepositoryError,
+    Snapshot,
+    SnapshotInfo,
+)
+from .retention import Policy, PruneResult, over_budget
+from .throttle import CpuGuard, Throttle, niced
+from .verify import (
+    VERIFIED,
+    VerifyCache,
+    VerifyResult,
+    check_dump,
+    file_stamp,
+    manifest_path,
+    write_manifest,
+)
+
+if TYPE_CHECKING:
+    from .runtime import Runtime
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+# Directory of the server files inside the containers
+SERVER_HOME = "/home/serverUser"
+# Id of the snapshots and dumps of a backup, sorting by time. Those of
+# older versions were day first.
+STAMP = "%Y-%m-%d_%H-%M-%S"
+OLD_STAMP = "%d-%m-%Y_%H-%M-%S"
+# Number and names of the files of a restored snapshot, run.sh removes
+# the others on start if the list is complete
+RESTORE_LIST = ".mcdocker-restore"
+# Where pg_dump writes in the database container, suffixed by the stamp,
+# and where dumps are copied to be restored
+DUMP_DIR = "/tmp/mcdocker-dump"
+RESTORE_DIR = "/tmp/mcdocker-restore"
+# Held by the process backing up, restoring or pruning the project
+LOCK = "backup.lock"
+
+
+class BackupError(Exception):
+    """Raised when the files of a server can't be backed up."""
+
+
+@dataclass(slots=True)
+class BackupResult:
+    """Outcome of the backup of one server (or the database)."""
+
+    name: str
+    path: Path
+    # Bytes read from the container, and stored once deduplicated
+    size: int = 0
+    stored: int = 0
+    elapsed: float = 0.0
+    error: str | None = None
+    # Snapshot of a world backup, None for the database
+    snapshot: Snapshot | None = None
+    # Seconds the server went without saving, None if it kept saving
+    paused: float | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def status(self) -> str:
+        if not self.ok:
+            return f"{self.name}: FAILED ({self.error})"
+        rate = self.size / self.elapsed if self.elapsed > 0 else 0.0
+        kind = stored = paused = ""
+        if self.snapshot is not None:
+            kind = f" [{self.snapshot.kind}]"
+            stored = f", {self.stored / 1024**2:.1f} MB new"
+        if self.paused is not None:
+            paused = f", saving paused {self.paused:.1f}s"
+        return (
+            f"{self.name}{kind}: {self.size / 1024**2:.1f} MB{stored} in "
+            f"{self.elapsed:.1f}s ({rate / 1024**2:.1f} MB/s){paused}"
+        )
+
+
+class CountingWriter:
+    """
+    File wrapper reporting the bytes written to a `Progress`, at the pace
+    of `throttle` if given, and hashing them.
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        progress: Progress,
+        throttle: Throttle | None = None,
+    ) -> None:
+        self.file = file
+        self.progress = progress
+        self.throttle = throttle
+        self.written = 0
+        self.digest = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        if self.throttle is not None:
+            self.throttle.take(len(data))
+        count = self.file.write(data)
+        self.written += len(data)
+        self.digest.update(data)
+        self.progress.advance(len(data))
+        return count
+
+    def flush(self) -> None:
+        self.file.flush()
+
+
+class CountingReader:
+    """
+    File wrapper reporting the bytes read to a `Progress`, at the pace of
+    `throttle` if given.
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        progress: Progress,
+        throttle: Throttle | None = None,
+    ) -> None:
+        self.file = file
+        self.progress = progress
+        self.throttle = throttle
+        self.read_bytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        if self.throttle is not None:
+            self.throttle.take(len(data))
+        self.read_bytes += len(data)
+        self.progress.advance(len(data))
+        return data
+
+
+class HashingReader:
+    """File wrapper hashing the bytes read."""
+
+    def __init__(self, file: BinaryIO) -> None:
+        self.file = file
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.digest.update(data)
+        return data
+
+
+def stamp_time(stamp: str) -> float:
+    """Time of a backup stamp, 0 if it isn't one."""
+    for format in (STAMP, OLD_STAMP):
+        try:
+            return mktime(strptime(stamp, format))
+        except ValueError:
+            continue
+    return 0.0
+
+
+@contextmanager
+def piped(write: Callable[[BinaryIO], Any]) -> Iterator[BinaryIO]:
+    """
+    Run `write` on a thread into a pipe, giving its reading end as a file.
+    An error of `write` is raised when the block ends, in place of the
+    one it likely caused to the reader.
+    """
+    read_fd, write_fd = os.pipe()
+    reader, writer = os.fdopen(read_fd, "rb"), os.fdopen(write_fd, "wb")
+    errors: list[Exception] = []
+
+    def produce() -> None:
+        try:
+            with writer:
+                write(writer)
+        except BrokenPipeError:
+            pass
+        except Exception as exc:
+            errors.append(exc)
+
+    thread = Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        with reader:
+            yield reader
+    except Exception:
+        thread.join()
+        if errors:
+            raise errors[0] from None
+        raise
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+class BackupManager:
+    """
+    Backup manager class. In charge of backing up the server files of the
+    containers into the repository of `.backup/repo`, dumping the database
+    into `.backup`, and restoring, pruning and verifying those backups.
+    """
+
+    jobs: int = int(os.environ.get("MCDOCKER_BACKUP_JOBS", 2))
+    full_every: int = int(os.environ.get("MCDOCKER_BACKUP_FULL_EVERY", 24))
+    restore_jobs: int = int(
+        os.environ.get("MCDOCKER_RESTORE_JOBS", os.cpu_count() or 2)
+    )
+    limit: int = parse_size(os.environ.get("MCDOCKER_BACKUP_LIMIT") or "0")
+    cpu_limit: float = float(os.environ.get("MCDOCKER_BACKUP_CPU_LIMIT") or 0)
+    nice: bool = os.environ.get("MCDOCKER_BACKUP_NICE") != "0"
+    pause_saves: bool = os.environ.get("MCDOCKER_BACKUP_PAUSE_SAVES") != "0"
+    # Directory of the staging files, `.backup` if None. A faster disk
+    # (or a tmpfs) shortens the time saving stays off.
+    staging: str | None = os.environ.get("MCDOCKER_BACKUP_STAGING")
+    # Container of the database, unless its settings give a `container`
+    database_container: str = os.environ.get(
+        "MCDOCKER_DATABASE_CONTAINER", "postgres_db"
+    )
+    # Parallel pg_dump workers, each with its own connection, and the
+    # compression level (0-9) of the dump, pg_dump's own if None
+    database_jobs: int = int(os.environ.get("MCDOCKER_DATABASE_JOBS", 4))
+    database_level: int | None = (
+        int(os.environ["MCDOCKER_DATABASE_LEVEL"])
+        if os.environ.get("MCDOCKER_DATABASE_LEVEL")
+        else None
+    )
+
+    def __init__(
+        self,
+        runtime: Runtime,
+        cwd: Path,
+        jobs: int | None = None,
+        mode: str = INCREMENTAL,
+        compression: str | None = None,
+        level: int | None = None,
+        limit: int | None = None,
+        cpu_limit: float | None = None,
+        nice: bool | None = None,
+        database_jobs: int | None = None,
+        database_level: int | None = None,
+    ) -> None:
+        self.runtime = runtime
+        self.path = cwd.joinpath(".backup")
+        self.mode = mode
+        self.policy = Policy.from_env()
+        if jobs is not None:
+            self.jobs = jobs
+        if limit is not None:
+            self.limit = limit
+        if cpu_limit is not None:
+            self.cpu_limit = cpu_limit
+        if nice is not None:
+            self.nice = nice
+        if database_jobs is not None:
+            self.database_jobs = database_jobs
+        if database_level is not None:
+            self.database_level = database_level
+        self.repository = Repository(
+            self.path.joinpath("repo"),
+            compression,
+            level,
+            nice=19 if self.nice else 0,
+        )
+        self.throttle = Throttle(self.limit or None)
+
+    def run(
+        self,
+        servers: list[str],
+        database: dicts | None = None,
+        prune: bool = True,
+    ) -> list[BackupResult]:
+        """
+        Back up `servers` and, if given credentials, the database. Prints
+        the status of each one as it ends and the total throughput. Then,
+        if `prune`, drops the backups the retention policy doesn't keep.
+
+        Servers are backed up on up to `jobs` workers: bound by the disk
+        more than by the CPU, a couple of them keeps it busy without making
+        the running servers stall on I/O. The dump gets its own worker, so
+        it runs alongside the worlds instead of queueing behind them. The
+        throughput is capped to `limit` bytes per second, and lowered
+        further while a server uses more than `cpu_limit` percent of CPU.
+        """
+        self.path.mkdir(exist_ok=True)
+        with self.locked():
+            stamp = strftime(STAMP)
+            progress = Progress("Backups", items=len(servers) + bool(database))
+
+            futures: list[Future[BackupResult]] = []
+            guard = (
+                CpuGuard(
+                    self.runtime,
+                    servers,
+                    self.throttle,
+                    self.cpu_limit,
+                    progress.log,
+                )
+                if self.cpu_limit
+                else nullcontext()
+            )
+            with (
+                guard,
+                ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool,
+                ThreadPoolExecutor(max_workers=1) as db_pool,
+            ):
+                if database:
+                    futures.append(
+                        db_pool.submit(self.database, database, stamp, progress)
+                    )
+                futures.extend(
+                    pool.submit(self.server, name, stamp, progress)
+                    for name in servers
+                )
+            self.repository.close()
+            progress.finish()
+
+            if prune:
+                try:
+                    print(self.prune(self.policy).status())
+                except (OSError, RepositoryError) as exc:
+                    print(f"WARNING: backups not pruned ({exc})")
+            return [future.result() for future in futures]
+
+    def prune(self, policy: Policy, server: str | None = None) -> PruneResult:
+        """
+        Drop the snapshots (of `server` if given, else also the database
+        dumps) `policy` doesn't keep, then the data only they used.
+        """
+        result = PruneResult()
+        by_server: dict[str, list[SnapshotInfo]] = {}
+        for info in self.repository.catalog(server):
+            by_server.setdefault(info.server, []).append(info)
+
+        for infos in by_server.values():
+            kept = policy.select([info.time for info in infos])
+            result.snapshots.extend(
+                info for i, info in enumerate(infos) if i not in kept
+            )
+            if policy.max_bytes:
+                survivors = [infos[i] for i in sorted(kept)]
+                trees: dict[str, list[bytes]] = {}
+                references = [
+                    self.repository.references(
+                        self.repository.load(info.server, info.id), trees
+                    )
+                    for info in survivors
+                ]
+                index = self.repository.index
+                sizes = {
+                    chunk: index[chunk].size
+                    for chunks in references
+                    for chunk in chunks
+                    if chunk in index
+                }
+                dropped = over_budget(references, sizes, policy.max_bytes)
+                result.snapshots.extend(survivors[:dropped])
+
+        if server is None:
+            dumps = self.dumps()
+            kept = policy.select(
+                [stamp_time(d.stem.removeprefix("database_")) for d in dumps]
+            )
+            kept_dumps = [dumps[i] for i in sorted(kept)]
+            if policy.max_bytes:
+                dump_sizes = [dump.stat().st_size for dump in kept_dumps]
+                while (
+                    len(kept_dumps) > 1 and sum(dump_sizes) > policy.max_bytes
+                ):
+                    kept_dumps.pop(0)
+                    dump_sizes.pop(0)
+            result.dumps = [d for d in dumps if d not in kept_dumps]
+
+        for info in result.snapshots:
+            self.repository.forget(info)
+        for dump in result.dumps:
+            dump.unlink(missing_ok=True)
+            manifest_path(dump).unlink(missing_ok=True)
+        if result.snapshots:
+            result.packs, result.freed = self.repository.gc()
+        return result
+
+    def server(self, name: str, stamp: str, progress: Progress) -> BackupResult:
+        """
+        Back up server `name` into a new snapshot. Only the files changed
+        since the previous snapshot are read, all of them every
+        `full_every` snapshots in case a change kept the size and mtime of
+        a file. They come out of the container as an uncompressed tar:
+        compression runs on the host, outside the CPU quota of the server.
+        While saving is paused (see `saves_paused`), the tar only goes to a
+        staging file, so the snapshot can't hold half-written chunks:
+        hashing and compression happen once saving is back on.
+        """
+        result = BackupResult(name, self.repository.snapshot_path(name, stamp))
+        start = perf_counter()
+        staged: BinaryIO | None = None
+        try:
+            with self.saves_paused(name, progress) as paused:
+                listed = time()
+                files = self.listing(name)
+                previous = self.previous(name)
+
+                snapshot = Snapshot(name, stamp, listed, FULL)
+                changed = list(files)
+                if previous is not None:
+                    snapshot.kind = INCREMENTAL
+                    changed = previous.changed(files)
+                    for path in files.keys() - set(changed):
+                        snapshot.files[path] = previous.files[path]
+                        if path in previous.hashes:
+                            snapshot.hashes[path] = previous.hashes[path]
+                if changed and paused:
+                    staged, result.size = self.__stage(name, changed, progress)
+                elif changed:
+                    result.size = self.__read(name, changed, snapshot, progress)
+            if paused:
+                result.paused = perf_counter() - start
+            if staged is not None:
+                self.__store(staged, snapshot)
+
+            snapshot.size = sum(item[0] for item in snapshot.files.values())
+            snapshot.elapsed = perf_counter() - start
+            self.repository.save(snapshot)
+            result.stored = snapshot.added
+            result.snapshot = snapshot
+        except Exception as exc:
+            result.error = str(exc)
+        finally:
+            if staged is not None:
+                staged.close()
+        result.elapsed = perf_counter() - start
+        return self.__done(result, progress)
+
+    def database(
+        self, database: dicts, stamp: str, progress: Progress
+    ) -> BackupResult:
+        """
+        Dump the database with `database_jobs` parallel pg_dump workers into
+        a directory of its container, compressed there, and stream that
+        directory into `.backup` as a tar.
+        """
+        user: str = database.get("user", "")
+        db: str = database.get("db", "")
+        container = self.db_container(database)
+        path = self.path.joinpath(f"database_{stamp}.tar")
+        folder = f"{DUMP_DIR}-{stamp}"
+        result = BackupResult("database", path)
+        start = perf_counter()
+        digest = ""
+        cmd = ["pg_dump", "-U", user, "-F", "d", "-j", str(self.database_jobs)]
+        if self.database_level is not None:
+            cmd += ["-Z", str(self.database_level)]
+        try:
+            try:
+                code, stderr = self.runtime.exec(
+                    container,
+                    self.__command([*cmd, "-f", folder, db]),
+                    BytesIO(),
+                )
+                if code == 0:
+                    with open(path, "wb") as f:
+                        writer = CountingWriter(f, progress, self.throttle)
+                        # No TTY, it would mangle the binary output
+                        code, stderr = self.runtime.exec(
+                            container,
+                            self.__command(
+                                ["tar", "-C", folder, "-cf", "-", "."]
+                            ),
+                            writer,  # type: ignore
+                        )
+                    result.size = writer.written
+                    digest = writer.digest.hexdigest()
+            finally:
+                self.runtime.exec(container, ["rm", "-rf", folder], BytesIO())
+            if code != 0:
+                result.error = stderr.decode(errors="ignore").strip() or (
+                    f"exit code {code}"
+                )
+        except Exception as exc:
+            result.error = str(exc)
+        result.elapsed = perf_counter() - start
+
+        if not result.ok:
+            path.unlink(missing_ok=True)
+        else:
+            write_manifest(path, result.size, digest, result.elapsed)
+        return self.__done(result, progress)
+
+    def restore(
+        self,
+        servers: list[str],
+        snapshot: str | None = None,
+        database: dicts | None = None,
+        jobs: int | None = None,
+    ) -> list[BackupResult]:
+        """
+        Put `servers` (and the database, if given its credentials) back as
+        they were in `snapshot`, the latest backup by default. Raises
+        BackupError before touching anything if a backup is missing.
+        """
+        chosen: list[Snapshot] = []
+        for name in servers:
+            history = self.repository.catalog(name)
+            if snapshot is not None:
+                history = [s for s in history if s.id == snapshot]
+            if not history:
+                raise BackupError(f"No backup of {name} found.")
+            chosen.append(self.repository.load(name, history[-1].id))
+
+        dump: Path | None = None
+        if database:
+            dumps = self.dumps()
+            if snapshot is not None:
+                dumps = [d for d in dumps if d.stem == f"database_{snapshot}"]
+            if not dumps:
+                raise BackupError("No backup of the database found.")
+            dump = dumps[-1]
+
+        with self.locked():
+            progress = Progress("Restore", items=len(chosen) + bool(dump))
+            futures: list[Future[BackupResult]] = []
+            with (
+                ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool,
+                ThreadPoolExecutor(max_workers=1) as db_pool,
+            ):
+                if database and dump is not None:
+                    futures.append(
+                        db_pool.submit(
+                            self.restore_database,
+                            database,
+                            dump,
+                            progress,
+                            jobs,
+                        )
+                    )
+                futures.extend(
+                    pool.submit(self.restore_server, item, progress)
+                    for item in chosen
+                )
+            self.repository.close()
+            progress.finish()
+            return [future.result() for future in futures]
+
+    def restore_server(
+        self, snapshot: Snapshot, progress: Progress
+    ) -> BackupResult:
+        """
+        Check `snapshot`, stop its server, stream the files into the
+        container and start it again, with no archive written anywhere in
+        between. The server keeps running if the snapshot is damaged.
+        """
+        name = snapshot.server
+        path = self.repository.snapshot_path(name, snapshot.id)
+        result = BackupResult(name, path)
+        start = perf_counter()
+        try:
+            try:
+                self.repository.verify(snapshot)
+            except RepositoryError as exc:
+                raise BackupError(
+                    f"damaged backup, not restored ({exc})"
+                ) from None
+
+            self.runtime.stop([name])
+            with piped(
+                lambda out: self.repository.write_tar(snapshot, out)
+            ) as stream:
+                reader = CountingReader(stream, progress)  # type: ignore
+                self.runtime.put_archive(name, SERVER_HOME, reader)  # type: ignore
+            result.size = snapshot.size
+
+            # Only once every file is in place: run.sh deletes the others.
+            # The count lets it tell a complete list from a truncated one.
+            names = sorted(snapshot.files)
+            listed = "\n".join([str(len(names)), *names]).encode() + b"\n"
+            self.runtime.put_archive(
+                name, SERVER_HOME, self.__archive(RESTORE_LIST, listed)
+            )
+            self.runtime.start([name])
+        except Exception as exc:
+            result.error = str(exc)
+        result.elapsed = perf_counter() - start
+        return self.__done(result, progress)
+
+    def restore_database(
+        self,
+        database: dicts,
+        dump: Path,
+        progress: Progress,
+        jobs: int | None = None,
+    ) -> BackupResult:
+        """
+        Copy `dump` into the database container and restore it with `jobs`
+        parallel `pg_restore` workers, which need it as files there.
+        Directory dumps (`.tar`) are extracted as they are, the custom
+        format dumps of older versions (`.sql`) copied as a single file.
+        """
+        user: str = database.get("user", "")
+        db: str = database.get("db", "")
+        container = self.db_container(database)
+        result = BackupResult("database", dump)
+        start = perf_counter()
+        try:
+            try:
+                check_dump(dump)
+            except ValueError as exc:
+                raise BackupError(
+                    f"damaged backup, not restored ({exc})"
+                ) from None
+
+            def write(out: BinaryIO) -> None:
+                with (
+                    open(dump, "rb") as f,
+                    tarfile.open(fileobj=out, mode="w|") as tar,
+                ):
+                    info = tarfile.TarInfo("dump")
+                    info.size = os.fstat(f.fileno()).st_size
+                    tar.addfile(info, f)
+
+            directory = dump.suffix == ".tar"
+            self.runtime.exec(
+                container, ["mkdir", "-p", RESTORE_DIR], BytesIO()
+            )
+            try:
+                with open(dump, "rb") if directory else piped(write) as stream:
+                    reader = CountingReader(stream, progress)  # type: ignore
+                    self.runtime.put_archive(
+                        container, RESTORE_DIR, reader  # type: ignore
+                    )
+                result.size = dump.stat().st_size
+                code, stderr = self.runtime.exec(
+                    container,
+                    [
+                        "pg_restore",
+                        "-U",
+                        user,
+                        "-d",
+                        db,
+                        "--clean",
+                        "--if-exists",
+                        "-j",
+                        str(jobs or self.restore_jobs),
+                        RESTORE_DIR if directory else f"{RESTORE_DIR}/dump",
+                    ],
+                    BytesIO(),
+                )
+            finally:
+                self.runtime.exec(
+                    container, ["rm", "-rf", RESTORE_DIR], BytesIO()
+                )
+            if code != 0:
+                result.error = stderr.decode(errors="ignore").strip() or (
+                    f"exit code {code}"
+                )
+        except Exception as exc:
+            result.error = str(exc)
+        result.elapsed = perf_counter() - start
+        return self.__done(result, progress)
+
+    def verify(
+        self, full: bool = False, jobs: int | None = None
+    ) -> VerifyResult:
+        """
+        Check the packs, the files of the snapshots and the database dumps
+        against their hashes, `jobs` at a time, reading them in place.
+        Only what is new or changed since the previous verification is
+        read, everything if `full`.
+        """
+        cache_path = self.path.joinpath(VERIFIED)
+        with self.locked():
+            cache = VerifyCache() if full else VerifyCache.load(cache_path)
+            verified = VerifyCache()
+            result = VerifyResult()
+            start = perf_counter()
+
+            packs: dict[str, list[tuple[bytes, Location]]] = {}
+            for chunk_id, location in self.repository.index.items():
+                packs.setdefault(location.pack, []).append((chunk_id, location))
+            stamps = {
+                pack: self.__stamp(self.repository.pack_path(pack))
+                for pack in packs
+            }
+            dumps = {
+                dump.name: (dump, self.__stamp(dump)) for dump in self.dumps()
+            }
+            files, trees = self.__unverified(cache, result)
+
+            with ThreadPoolExecutor(
+                max_workers=max(1, jobs or os.cpu_count() or 2)
+            ) as pool:
+                pack_futures = {
+                    pack: pool.submit(
+                        self.repository.verify_pack, pack, entries
+                    )
+                    for pack, entries in packs.items()
+                    if stamps[pack] is None
+                    or cache.packs.get(pack) != stamps[pack]
+                }
+                file_futures = {
+                    tree: pool.submit(
+                        self.repository.verify_file, tree, size, digest
+                    )
+                    for tree, (size, digest, _) in files.items()
+                }
+                dump_futures = {
+                    name: pool.submit(check_dump, dump)
+                    for name, (dump, stamp) in dumps.items()
+                    if stamp is None or cache.dumps.get(name) != stamp
+                }
+
+            for pack, stamp in stamps.items():
+                future = pack_futures.get(pack)
+                try:
+                    if future is not None:
+                        result.size += future.result()
+                        result.packs += 1
+                    else:
+                        result.skipped += 1
+                    verified.packs[pack] = stamp  # type: ignore
+                except RepositoryError as exc:
+                    result.errors.append(str(exc))
+            damaged: set[str] = set()
+            for tree, future in file_futures.items():
+                try:
+                    result.size += future.result()
+                    result.files += 1
+                except RepositoryError as exc:
+                    result.errors.append(f"{files[tree][2]}: {exc}")
+                    damaged.add(tree)
+            for name, (_, stamp) in dumps.items():
+                future = dump_futures.get(name)
+                try:
+                    if future is not None:
+                        result.size += future.result()
+                        result.dumps += 1
+                    else:
+                        result.skipped += 1
+                    verified.dumps[name] = stamp  # type: ignore
+                except (OSError, ValueError) as exc:
+                    result.errors.append(f"{name}: {exc}")
+
+            verified.snapshots = [
+                key for key, used in trees.items() if damaged.isdisjoint(used)
+            ]
+            verified.save(cache_path)
+            result.elapsed = perf_counter() - start
+        return result
+
+    def dumps(self) -> list[Path]:
+        """
+        Database dumps, oldest first: directory dumps as tars, and the
+        custom format dumps of older versions.
+        """
+        return sorted(
+            [
+                *self.path.glob("database_*.tar"),
+                *self.path.glob("database_*.sql"),
+            ],
+            key=lambda path: stamp_time(path.stem.removeprefix("database_")),
+        )
+
+    def db_container(self, database: dicts) -> str:
+        """Container of the database of settings `database`."""
+        return database.get("container") or self.database_container
+
+    def listing(self, name: str) -> dict[str, list[int]]:
+        """Size and mtime of every file of server `name`, by relative path."""
+        out = BytesIO()
+        code, stderr = self.runtime.exec(
+            name,
+            self.__command(
+                [
+                    "sh",
+                    "-c",
+                    f"cd {SERVER_HOME} && "
+                    "find . -type f -exec stat -c '%s %Y %n' {} +",
+                ]
+            ),
+            out,
+        )
+        if code != 0:
+            raise BackupError(
+                stderr.decode(errors="ignore").strip()
+                or f"can't list the files (exit code {code})"
+            )
+
+        files: dict[str, list[int]] = {}
+        for line in (
+            out.getvalue().decode(errors="surrogateescape").splitlines()
+        ):
+            size, mtime, path = line.split(" ", 2)
+            files[path.removeprefix("./")] = [int(size), int(mtime)]
+        return files
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """
+        Keep the other backups, restores and prunes of the project out
+        until the block ends. Raises BackupError if one is running.
+        """
+        lock = FileLock(self.path.joinpath(LOCK))
+        try:
+            lock.acquire()
+        except LockedError:
+            raise BackupError("Another backup is running.") from None
+        try:
+            yield
+        finally:
+            lock.release()
+
+    @contextmanager
+    def saves_paused(self, name: str, progress: Progress) -> Iterator[bool]:
+        """
+        Flush the world of server `name` and keep the server from writing
+        it until the block ends. Yields whether saving is off: a server
+        without RCON, or that can't be reached, keeps saving.
+        """
+        rcon: Rcon | None = None
+        paused = resume = False
+        try:
+            rcon = self.rcon(name) if self.pause_saves else None
+            if rcon is not None:
+                rcon.connect()
+                # Saving turned off by hand stays off afterwards
+                resume = "already" not in rcon.command("save-off").lower()
+                rcon.command("save-all flush")
+                paused = True
+        except RconError as exc:
+            progress.log(f"{name}: saving not paused ({exc})")
+        try:
+            yield paused
+        finally:
+            if rcon is not None:
+                try:
+                    if resume:
+                        self.__resume(name, rcon)
+                finally:
+                    rcon.close()
+
+    def rcon(self, name: str) -> Rcon | None:
+        """
+        RCON client of server `name` from its `server.properties`, None if
+        RCON isn't enabled. `$MCDOCKER_RCON_HOST` replaces the address of
+        the container, for hosts that can't reach it.
+        """
+        out = BytesIO()
+        code, _ = self.runtime.exec(
+            name, ["cat", f"{SERVER_HOME}/server.properties"], out
+        )
+        settings = properties(out.getvalue().decode(errors="ignore"))
+        password = settings.get("rcon.password", "")
+        if code != 0 or settings.get("enable-rcon") != "true" or not password:
+            return None
+        host = os.environ.get("MCDOCKER_RCON_HOST")
+        if not host:
+            try:
+                host = self.runtime.address(name)
+            except Exception as exc:
+                raise RconError(f"no address ({exc})") from None
+        port = int(settings.get("rcon.port") or DEFAULT_PORT)
+        return Rcon(host, port, password)
+
+    def previous(self, name: str) -> Snapshot | None:
+        """
+        Snapshot the next one of server `name` builds on, None if every
+        file has to be read.
+        """
+        history = self.repository.catalog(name)
+        fulls = [i for i, s in enumerate(history) if s.kind == FULL]
+        if self.mode == FULL or not fulls:
+            return None
+        if len(history) - fulls[-1] >= self.full_every:
+            return None
+        return self.repository.load(name, history[-1].id)
+
+    def __unverified(
+        self, cache: VerifyCache, result: VerifyResult
+    ) -> tuple[dict[str, tuple[int, str | None, str]], dict[str, set[str]]]:
+        """
+        Files to check in the snapshots `cache` doesn't have: those whose
+        content no earlier snapshot of their server had, by tree, with
+        their size, hash and a label for errors. Also returns the trees
+        each snapshot uses.
+        """
+        files: dict[str, tuple[int, str | None, str]] = {}
+        trees: dict[str, set[str]] = {}
+        known: dict[str, set[str]] = {}
+        for info in self.repository.catalog():
+            key = f"{info.server}/{info.id}"
+            if key in cache.snapshots:
+                # Its files are fine as long as its packs are
+                trees[key] = set()
+                result.skipped += 1
+                known.pop(info.server, None)
+                continue
+            try:
+                snapshot = self.repository.load(info.server, info.id)
+            except RepositoryError as exc:
+                result.errors.append(str(exc))
+                continue
+            if info.server not in known:
+                known[info.server] = self.__trees(info.server, info.time, cache)
+            used = trees[key] = set()
+            for path, (size, *_, tree) in snapshot.files.items():
+                used.add(tree)
+                if tree not in known[info.server] and tree not in files:
+                    label = f"{info.server} {info.id}: {path}"
+                    files[tree] = (size, snapshot.hashes.get(path), label)
+            known[info.server] |= used
+        return files, trees
+
+    def __trees(
+        self, server: str, before: float, cache: VerifyCache
+    ) -> set[str]:
+        """Trees of the last verified snapshot of `server` before `before`."""
+        verified = [
+            info
+            for info in self.repository.catalog(server)
+            if info.time < before and f"{server}/{info.id}" in cache.snapshots
+        ]
+        if not verified:
+            return set()
+        try:
+            snapshot = self.repository.load(server, verified[-1].id)
+        except RepositoryError:
+            return set()
+        return {tree for *_, tree in snapshot.files.values()}
+
+    @staticmethod
+    def __stamp(path: Path) -> list[int] | None:
+        try:
+            return file_stamp(path)
+        except OSError:
+            return None
+
+    def __read(
+        self,
+        name: str,
+        paths: list[str],
+        snapshot: Snapshot,
+        progress: Progress,
+    ) -> int:
+        """
+        Stream `paths` out of the container as an uncompressed tar and store
+        them. Returns the bytes read.
+        """
+        with self.runtime.stream(name, *self.__tar(paths)) as out:
+            reader = CountingReader(out, progress, self.throttle)
+            self.__store(reader, snapshot)  # type: ignore
+        return reader.read_bytes
+
+    def __stage(
+        self, name: str, paths: list[str], progress: Progress
+    ) -> tuple[BinaryIO, int]:
+        """
+        Copy `paths` out of the container into a staging file, as fast as
+        the disk allows. Returns the file, rewound, and its size.
+        """
+        directory = Path(self.staging or self.path)
+        directory.mkdir(parents=True, exist_ok=True)
+        staged = TemporaryFile(dir=directory)
+        try:
+            with self.runtime.stream(name, *self.__tar(paths)) as out:
+                reader = CountingReader(out, progress, self.throttle)
+                shutil.copyfileobj(reader, staged, 1024 * 1024)  # type: ignore
+        except BaseException:
+            staged.close()
+            raise
+        staged.seek(0)
+        return staged, reader.read_bytes  # type: ignore
+
+    def __store(self, stream: BinaryIO, snapshot: Snapshot) -> None:
+        """Store the files of the tar `stream` and add them to `snapshot`."""
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                data = tar.extractfile(member) if member.isfile() else None
+                if data is None:
+                    continue
+                # Hashed in the same pass as it is stored
+                reader = HashingReader(data)  # type: ignore
+                tree, size, added = self.repository.store(reader)  # type: ignore
+                path = member.name.removeprefix("./")
+                snapshot.files[path] = [
+                    size,
+                    int(member.mtime),
+                    member.mode & 0o7777,
+                    tree,
+                ]
+                snapshot.hashes[path] = reader.digest.hexdigest()
+                snapshot.added += added
+
+    def __resume(self, name: str, rcon: Rcon) -> None:
+        """Turn saving back on, reconnecting once if the link dropped."""
+        for attempt in range(2):
+            try:
+                if attempt:
+                    rcon.close()
+                    rcon.connect()
+                rcon.command("save-on")
+                return
+            except RconError as exc:
+                error = exc
+        raise BackupError(
+            f"saving is still off on {name}, run save-on ({error})"
+        )
+
+    @staticmethod
+    def __archive(name: str, data: bytes) -> BinaryIO:
+        """Tar holding a single file."""
+        out = BytesIO()
+        with tarfile.open(fileobj=out, mode="w") as tar:
+            info = tarfile.TarInfo(name)
+            info.size, info.mtime = len(data), int(time())
+            tar.addfile(info, BytesIO(data))
+        out.seek(0)
+        return out
+
+    def __tar(self, paths: list[str]) -> tuple[list[str], BinaryIO]:
+        """Command writing `paths` as a tar, and its input."""
+        listed = BytesIO("\n".join(paths).encode() + b"\n")
+        cmd = ["tar", "-C", SERVER_HOME, "-cf", "-", "-T", "-"]
+        return self.__command(cmd), listed
+
+    def __command(self, cmd: list[str]) -> list[str]:
+        """
+        `cmd`, with the lowest CPU and I/O priority if backups give way to
+        the servers (`nice`), as the compression threads on the host do.
+        """
+        return niced(cmd) if self.nice else cmd
+
+    @staticmethod
+    def __done(result: BackupResult, progress: Progress) -> BackupResult:
+        progress.log(result.status())
+        progress.item_done()
+        return result
@@ -0,0 +1,307 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+from threading import Lock, get_ident
+from time import time
+from typing import Any, Protocol
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+# FICLONE ioctl (reflink) on Linux
+FICLONE = 0x40049409
+
+
+def cache_dir(*parts: str) -> Path:
+    """
+    Cache directory of the CLI (`$MCDOCKER_CACHE_DIR`, or
+    `$XDG_CACHE_HOME/MinecraftDockerCLI`, defaulting to `~/.cache`).
+    """
+    root = os.environ.get("MCDOCKER_CACHE_DIR")
+    if not root:
+        xdg = os.environ.get("XDG_CACHE_HOME") or Path.home().joinpath(".cache")
+        root = str(Path(xdg).joinpath("MinecraftDockerCLI"))
+    return Path(root).joinpath(*parts)
+
+
+class MetadataCache:
+    """
+    On-disk cache of API responses. Entries keep the body with its `ETag`
+    and `Last-Modified` headers, are served as they are for `ttl` seconds
+    and then revalidated with a conditional request.
+    """
+
+    ttl: float = float(os.environ.get("MCDOCKER_METADATA_TTL", 600))
+
+    def __init__(self, root: Path | None = None) -> None:
+        self.root = root or cache_dir("metadata")
+
+    def fetch(self, session: Any, url: str, **kwargs: Any) -> Any:
+        """
+        JSON body of `url`, from disk within the TTL, else revalidated with
+        the stored validators (a 304 costs no body) or fetched again.
+        """
+        entry = self.load(url)
+        if entry is not None and self.fresh(entry):
+            return entry["body"]
+
+        response = session.get(url, headers=self.headers(entry), **kwargs)
+        if response.status_code == 304 and entry is not None:
+            body = entry["body"]
+        else:
+            response.raise_for_status()
+            body = response.json()
+
+        entry = entry or {}
+        self.store(
+            url,
+            body,
+            response.headers.get("ETag") or entry.get("etag"),
+            response.headers.get("Last-Modified") or entry.get("last_modified"),
+        )
+        return body
+
+    def load(self, url: str) -> dicts | None:
+        try:
+            path = self.__path(url)
+            return dict(json.loads(path.read_text(encoding="utf-8")))
+        except Exception:
+            return None
+
+    def fresh(self, entry: dicts) -> bool:
+        return bool(time() - entry.get("fetched", 0) < self.ttl)
+
+    @staticmethod
+    def headers(entry: dicts | None) -> dict[str, str]:
+        """Conditional request headers to revalidate `entry`."""
+        headers: dict[str, str] = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(
+        self,
+        url: str,
+        body: Any,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.__path(url)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}-{get_ident()}")
+        entry = {
+            "url": url,
+            "fetched": time(),
+            "etag": etag,
+            "last_modified": last_modified,
+            "body": body,
+        }
+        tmp.write_text(json.dumps(entry), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def clear(self) -> int:
+        removed = 0
+        for path in self.root.glob("*.json"):
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def __path(self, url: str) -> Path:
+        return self.root.joinpath(
+            f"{hashlib.sha1(url.encode()).hexdigest()}.json"
+        )
+
+
+class JarSource(Protocol):
+    def download(self, resolved: dicts, path: Path) -> str | None: ...
+
+
+class JarCache:
+    """
+    Content-addressed cache of server jars. Blobs are stored by SHA-256 and
+    indexed by `project/version/build`, servers get a hardlink (or reflink,
+    or copy) of the blob. Least recently used blobs are evicted once the
+    cache grows over `max_bytes`.
+    """
+
+    max_bytes: int = int(os.environ.get("MCDOCKER_JAR_CACHE_MAX", 2 * 1024**3))
+
+    def __init__(self, root: Path | None = None) -> None:
+        self.root = root or cache_dir("jars")
+        self.blobs = self.root.joinpath("blobs")
+        self.index_path = self.root.joinpath("index.json")
+        self.lock = Lock()
+
+    @staticmethod
+    def key(resolved: dicts) -> str:
+        return (
+            f"{resolved['project']}/{resolved['version']}/{resolved['build']}"
+        )
+
+    def get(self, resolved: dicts) -> Path | None:
+        """Return the cached blob of a resolved build, if present."""
+        with self.lock:
+            index = self.__read_index()
+            entry = index.get(self.key(resolved))
+            if entry is None:
+                return None
+
+            blob = self.blobs.joinpath(f"{entry['sha256']}.jar")
+            try:
+                if blob.stat().st_size != entry["size"]:
+                    raise OSError("size mismatch")
+            except OSError:
+                index.pop(self.key(resolved), None)
+                self.__write_index(index)
+                return None
+
+            entry["used"] = time()
+            self.__write_index(index)
+            return blob
+
+    def fetch(self, resolved: dicts, source: JarSource) -> Path:
+        """
+        Return the blob of a resolved build, downloading it through `source`
+        on a miss. Raises ValueError if the download doesn't match the
+        published checksum.
+        """
+        blob = self.get(resolved)
+        if blob is not None:
+            return blob
+
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        # Sources resume interrupted transfers from `<tmp>.part`, so a build
+        # keeps the same name across runs; the `finally` only drops `tmp`
+        name = resolved.get("sha256") or f"{os.getpid()}-{id(resolved)}"
+        tmp = self.blobs.joinpath(f".{name}.download")
+        try:
+            # Sources may hash while streaming, saving a second pass
+            sha256 = source.download(resolved, tmp) or self.__hash(tmp)
+            expected = resolved.get("sha256")
+            if expected and expected != sha256:
+                raise ValueError(
+                    f"checksum mismatch for {self.key(resolved)}: "
+                    f"expected {expected}, got {sha256}"
+                )
+            blob = self.blobs.joinpath(f"{sha256}.jar")
+            os.replace(tmp, blob)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+        with self.lock:
+            index = self.__read_index()
+            index[self.key(resolved)] = {
+                "sha256": sha256,
+                "size": blob.stat().st_size,
+                "used": time(),
+            }
+            self.__write_index(index)
+
+        self.prune()
+        return blob
+
+    @staticmethod
+    def link(blob: Path, dest: Path) -> None:
+        """Place `blob` at `dest` as a hardlink, a reflink or a copy."""
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.tmp")
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            if not JarCache.__reflink(blob, tmp):
+                shutil.copyfile(blob, tmp)
+        os.replace(tmp, dest)
+
+    def size(self) -> int:
+        return sum(p.stat().st_size for p in self.blobs.glob("*.jar"))
+
+    def prune(self, max_bytes: int | None = None) -> tuple[int, int]:
+        """
+        Evict least recently used blobs until the cache fits in `max_bytes`
+        (the class default if None) and drop orphans. Returns the number of
+        blobs removed and the bytes freed.
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        removed, freed = 0, 0
+
+        with self.lock:
+            index = self.__read_index()
+
+            # Last use of each blob (several builds may share one)
+            used: dict[str, float] = {}
+            for entry in index.values():
+                sha = entry["sha256"]
+                used[sha] = max(used.get(sha, 0), entry.get("used", 0))
+
+            sizes: dict[str, int] = {}
+            for blob in self.blobs.glob("*.jar"):
+                if blob.stem not in used:
+                    freed += blob.stat().st_size
+                    removed += 1
+                    blob.unlink(missing_ok=True)
+                else:
+                    sizes[blob.stem] = blob.stat().st_size
+
+            # Partial downloads nobody resumed within a day
+            for part in self.blobs.glob(".*.part"):
+                if time() - part.stat().st_mtime > 24 * 3600:
+                    part.unlink(missing_ok=True)
+
+            total = sum(sizes.values())
+            for sha in sorted(sizes, key=lambda s: used[s]):
+                if total <= limit:
+                    break
+                self.blobs.joinpath(f"{sha}.jar").unlink(missing_ok=True)
+                total -= sizes[sha]
+                freed += sizes[sha]
+                removed += 1
+                del sizes[sha]
+
+            index = {k: e for k, e in index.items() if e["sha256"] in sizes}
+            self.__write_index(index)
+
+        return removed, freed
+
+    def __read_index(self) -> dict[str, dicts]:
+        try:
+            return dict(json.loads(self.index_path.read_text(encoding="utf-8")))
+        except Exception:
+            return {}
+
+    def __write_index(self, index: dict[str, dicts]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(index, indent=2), encoding="utf-8")
+        os.replace(tmp, self.index_path)
+
+    @staticmethod
+    def __hash(path: Path) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024**2), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def __reflink(src: Path, dst: Path) -> bool:
+        try:
+            import fcntl
+
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return True
+        except Exception:
+            dst.unlink(missing_ok=True)
+            return False
@@ -4,18 +4,26 @@
 from __future__ import annotations
 
 from pathlib import Path
-from subprocess import PIPE, CalledProcessError, CompletedProcess, run
-from time import sleep, strftime
-from typing import Any
+from subprocess import CalledProcessError, CompletedProcess, run
+from typing import TYPE_CHECKING, Any
 
 from yaspin import yaspin
 
+from ..utils.timings import phase
 from .files import FileManager
+from .state import ProjectState
+
+if TYPE_CHECKING:
+    from .backup import BackupManager, BackupResult
+    from .runtime import Runtime
 
 
 #################################################
 # CODE
 #################################################
+dicts = dict[str, Any]
+
+
 class ComposeManager:
     """
     Compose manager class. In charge of executing docker commands.
@@ -23,10 +31,19 @@ class ComposeManager:
 
     cwd = Path.cwd()
 
-    def __init__(self, sleep: int = 0) -> None:
+    def __init__(self) -> None:
         self.composer_file = self.cwd.joinpath("docker-compose.yml")
         self.file_manager = FileManager()
-        self.sleep = sleep
+        self.__runtime: Runtime | None = None
+
+    @property
+    def runtime(self) -> Runtime:
+        """Engine API or CLI backend, chosen on first use."""
+        if self.__runtime is None:
+            from .runtime import runtime
+
+            self.__runtime = runtime()
+        return self.__runtime
 
     def __run(
         self,
@@ -35,9 +52,10 @@ class ComposeManager:
         print_output: bool = True,
     ) -> CompletedProcess[str]:
         command = ["docker", "compose", "-f", str(self.composer_file), *args]
-        result = run(
-            command, text=True, capture_output=capture_output, check=True
-        )
+        with phase(f"docker compose {args[0]}"):
+            result = run(
+                command, text=True, capture_output=capture_output, check=True
+            )
         if result.returncode != 0 and print_output:
             print("ERROR: ", result.stderr)
         elif print_output:
@@ -45,21 +63,36 @@ class ComposeManager:
         return result
 
     @yaspin(text="Stopping servers...", color="cyan")
-    def stop(self) -> CompletedProcess[str]:
-        sleep(self.sleep)
-
+    def stop(self) -> CompletedProcess[str] | None:
+        if self.runtime.api and self.__api("stop"):
+            return None
         return self.__run("stop")
 
     @yaspin(text="Starting servers...", color="cyan")
-    def start(self) -> CompletedProcess[str]:
-        sleep(self.sleep)
-
+    def start(self) -> CompletedProcess[str] | None:
+        if self.runtime.api and self.__api("start"):
+            return None
         return self.__run("start")
 
+    def stats(self) -> dict[str, dicts]:
+        """CPU and memory use of the running containers of the project."""
+        return self.runtime.stats(self.runtime.containers(self.cwd))
+
+    def __api(self, action: str) -> bool:
+        """
+        Run `action` on every container of the project through the Engine
+        API. Returns False if there are none (not created yet).
+        """
+        names = self.runtime.containers(self.cwd)
+        if not names:
+            return False
+        with phase(f"docker {action}"):
+            getattr(self.runtime, action)(names)
+        print(f"Command run: {action} {' '.join(names)}")
+        return True
+
     @yaspin(text="Removing Container...", color="cyan")
     def down(self, remove_volumes: bool = False) -> CompletedProcess[str]:
-        sleep(self.sleep)
-
         args = ["down"]
         if remove_volumes:
             args.append("-v")
@@ -67,21 +100,28 @@ class ComposeManager:
 
     @yaspin(text="Putting Up Container...", color="cyan")
     def up(
-        self, attached: bool = True, detach_keys: str = "ctrl-p,ctrl-q"
+        self,
+        attached: bool = True,
+        detach_keys: str = "ctrl-p,ctrl-q",
+        services: list[str] | None = None,
     ) -> CompletedProcess[str]:
-        sleep(self.sleep)
-
         args = ["up", "--build"]
         if not attached:
             args.append("-d")
         else:
             args.extend(["--detach-keys", detach_keys])
             print(f"Use '{detach_keys}' to detach (press sequentially).\n")
-        return self.__run(*args)
+        return self.__run(*args, *(services or []))
 
     def open_terminal(
         self, server: str, detach_keys: str = "ctrl-p,ctrl-q"
     ) -> None:
+        """
+        Attach to the console of `server`, or open a shell in it if that
+        fails. Always goes through the docker CLI, whatever the runtime:
+        it owns the terminal (raw mode, resizes, detach keys) and a single
+        interactive session gains nothing from the Engine API.
+        """
         try:
             print(f"Use '{detach_keys}' to detach (press sequentially).\n")
             run(
@@ -106,86 +146,104 @@ class ComposeManager:
 
         print("Couldn't open a shell in the container")
 
-    @yaspin(text="Backing Up Container...", color="cyan")
-    def back_up(self, cwd: Path = Path.cwd()) -> None:
-        sleep(self.sleep)
-
-        backup_path = cwd.joinpath(".backup")
-        compose_json = cwd.joinpath("data.json")
-
-        backup_path.mkdir(exist_ok=True)
-        data: dict[str, Any] = self.file_manager.read_json(compose_json) or {}
-        if not data:
+    def back_up(
+        self,
+        cwd: Path = Path.cwd(),
+        jobs: int | None = None,
+        mode: str = "incremental",
+        prune: bool = True,
+        **options: Any,
+    ) -> list[BackupResult]:
+        """
+        Back up every server, and the database, `jobs` at a time. `mode` is
+        `incremental` (read the changed files) or `full` (read them all).
+        If `prune`, the backups the retention policy doesn't keep are
+        dropped afterwards. `options` go to the backup manager
+        (compression, level).
+        """
+        state = ProjectState.load(cwd.joinpath("data.json"))
+        if not state.data:
             exit("ERROR: data.json is empty")
 
-        servers = data.get("compose", {}).get("servers", []) or []  # type: ignore
-        names: list[str] = [
-            svc.get("name") for svc in servers if svc.get("name") is not None  # type: ignore
-        ]
-
-        for svc_name in names:
-            tar_file = backup_path.joinpath(
-                f"{svc_name}_{strftime('%d-%m-%Y_%H-%M-%S')}.tar.gz"
+        with phase("backup"):
+            return self.backups(cwd, jobs, mode, **options).run(
+                state.names, state.database, prune
             )
 
-            path_inside = "/home/serverUser"
-            try:
-                with open(tar_file, "wb") as f:
-                    proc = run(
-                        [
-                            "docker",
-                            "exec",
-                            svc_name,
-                            "tar",
-                            "-C",
-                            path_inside,
-                            "-czf",
-                            "-",
-                            ".",
-                        ],
-                        stdout=f,
-                        stderr=PIPE,
-                        check=True,
-                    )
-            except Exception as exc:
-                print(f"Error writting backup file {tar_file}: {exc}")
-                continue
-            if proc.returncode != 0:
-                err = proc.stderr.decode(errors="ignore")
-                print(f"tar failed for container {svc_name}: {err}")
-                continue
+    def restore(
+        self,
+        cwd: Path = Path.cwd(),
+        servers: list[str] | None = None,
+        snapshot: str | None = None,
+        database: bool = False,
+        jobs: int | None = None,
+    ) -> list[BackupResult]:
+        """
+        Restore `servers` and, if `database`, the database from `snapshot`
+        (the latest backup by default). `jobs` is the number of parallel
+        `pg_restore` workers.
+        """
+        state = ProjectState.load(cwd.joinpath("data.json"))
+        if not state.data:
+            exit("ERROR: data.json is empty")
+        if database and not state.database:
+            exit("ERROR: The project has no database.")
+
+        with phase("restore"):
+            return self.backups(cwd).restore(
+                servers or [],
+                snapshot,
+                state.database if database else None,
+                jobs,
+            )
 
-        database: dict[str, str] = (
-            data.get("compose", {}).get("database", {}) or {}
+    def schedule(
+        self,
+        cwd: Path = Path.cwd(),
+        every: float = 3600,
+        intervals: dict[str, float] | None = None,
+        jitter: float = 0.1,
+        prune: bool = True,
+        jobs: int | None = None,
+        mode: str = "incremental",
+        **options: Any,
+    ) -> None:
+        """
+        Back up every server, and the database, every `every` seconds (or
+        their own interval in `intervals`) until interrupted. The other
+        arguments are those of `back_up`.
+        """
+        from .scheduler import DATABASE, Scheduler
+
+        state = ProjectState.load(cwd.joinpath("data.json"))
+        if not state.data:
+            exit("ERROR: data.json is empty")
+        unknown = set(intervals or {}) - {*state.names, DATABASE}
+        if unknown:
+            exit(f"ERROR: Unknown server {', '.join(sorted(unknown))}.")
+
+        scheduler = Scheduler(
+            self.backups(cwd, jobs, mode, **options),
+            state.names,
+            every,
+            intervals,
+            jitter,
+            state.database,
+            prune,
         )
-        if database:
-            db_user: str = database.get("user", "")
-            db_name: str = database.get("db", "")
-            db_backup_file = backup_path.joinpath(
-                f"database_{strftime('%d-%m-%Y_%H-%M-%S')}.sql"
-            )
-            try:
-                with open(db_backup_file, "wb") as f:
-                    proc = run(
-                        [
-                            "docker",
-                            "exec",
-                            "-t",
-                            "postgres_db",
-                            "pg_dump",
-                            "-U",
-                            db_user,
-                            "-F",
-                            "c",
-                            db_name,
-                        ],
-                        stdout=f,
-                        stderr=PIPE,
-                        check=True,
-                    )
-            except Exception as exc:
-                print(f"Error writting backup file for sql database: {exc}")
-                return
-            if proc.returncode != 0:
-                err = proc.stderr.decode(errors="ignore")
-                print(f"Failed to extract the sql database: {err}")
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            print("Scheduler stopped.")
+
+    def backups(
+        self,
+        cwd: Path = Path.cwd(),
+        jobs: int | None = None,
+        mode: str = "incremental",
+        **options: Any,
+    ) -> BackupManager:
+        """Backup manager of the project in `cwd`."""
+        from .backup import BackupManager
+
+        return BackupManager(self.runtime, cwd, jobs, mode, **options)
@@ -3,20 +3,34 @@
 #################################################
 from __future__ import annotations
 
+import hashlib
+import os
 from pathlib import Path
-from shutil import copyfileobj
-from typing import Any
+from time import sleep
+from typing import Any, Callable
 
+from requests.exceptions import HTTPError, RequestException  # type: ignore
 from requests.sessions import Session  # type: ignore
 
+from .cache import MetadataCache
+
 #################################################
 # CODE
 #################################################
 dicts = dict[str, Any]
 
 
+class ChecksumError(ValueError):
+    """Raised when a download doesn't match its published checksum."""
+
+
 class Downloader:
 
+    # Attempts per download and base delay (doubled on every retry)
+    retries: int = int(os.environ.get("MCDOCKER_RETRIES", 5))
+    backoff: float = 0.5
+    timeout: float = 30
+
     def __init__(self, api: str, headers: dicts | None = None) -> None:
         self.session = Session()
 
@@ -25,65 +39,173 @@ class Downloader:
 
         self.api = api.rstrip("/")
 
+        # Called with the size of every downloaded chunk
+        self.progress: Callable[[int], None] | None = None
+
+        self.metadata = MetadataCache()
+
     def __build_url(self, endpoint: str) -> str:
         if endpoint.startswith("http"):
             return endpoint
         return f"{self.api}/{endpoint.lstrip('/').rstrip('/')}"
 
     def get(self, endpoint: str, **kwargs: dict[str, Any]) -> Any:
+        """
+        GET a JSON endpoint. Plain requests go through the metadata cache,
+        shared with the prompts and across runs.
+        """
         url = self.__build_url(endpoint)
-        response = self.session.get(url, **kwargs)  # type: ignore
-        response.raise_for_status()
-        return response.json()
-
-    def download_latest(
-        self,
-        endpoint: str,
-        path: Path,
-        jar_file: str,
-        version: str | None = None,
-    ) -> None:
+        if kwargs:
+            response = self.session.get(url, **kwargs)  # type: ignore
+            response.raise_for_status()
+            return response.json()
+
+        return self.metadata.fetch(self.session, url, timeout=self.timeout)
+
+    def resolve(
+        self, endpoint: str, version: str | None = None
+    ) -> dicts | None:
+        """
+        Resolve the latest build of a project version (latest version when
+        `version` is None). Returns its project, version, build and download
+        url, or None if it can't be resolved.
+        """
         versions = self.get(endpoint)
         if not versions:
-            return
+            return None
         try:
             if not version:
                 version = list(versions.get("versions").values())[0][0]
-            endpoint += f"/versions/{version}"
         except Exception:
-            return
+            return None
 
-        builds = self.get(endpoint)
+        builds = self.get(f"{endpoint}/versions/{version}")
         if not builds:
-            return
+            return None
         try:
             build = list(builds.get("builds"))[0]
-            endpoint += f"/builds/{build}"
         except Exception:
-            return
+            return None
 
-        final = self.get(endpoint)
+        final = self.get(f"{endpoint}/versions/{version}/builds/{build}")
         if not final:
-            return
+            return None
         try:
-            downloads = final.get("downloads")
-            if "server:default" in downloads:
-                download_url = downloads["server:default"].get("url")
-            else:
-                return
+            download = final.get("downloads")["server:default"]
+            url = download.get("url")
         except Exception:
-            return
-
-        if not download_url:
-            return
-        out_path = path.joinpath(jar_file)
-        self.__download_file(download_url, out_path)
+            return None
+
+        if not url:
+            return None
+        return {
+            "project": endpoint.strip("/"),
+            "version": version,
+            "build": build,
+            "url": url,
+            "sha256": (download.get("checksums") or {}).get("sha256"),
+        }
+
+    def download(self, resolved: dicts, path: Path) -> str:
+        """
+        Download a build returned by `resolve` to `path`, verified against
+        its published checksum. Returns the SHA-256 of the file.
+        """
+        return self.download_file(resolved["url"], path, resolved.get("sha256"))
 
-    def __download_file(self, endpoint: str, path: Path) -> None:
+    def download_latest(
+        self,
+        endpoint: str,
+        path: Path,
+        jar_file: str,
+        version: str | None = None,
+    ) -> dicts | None:
+        resolved = self.resolve(endpoint, version)
+        if resolved is None:
+            return None
+        self.download(resolved, path.joinpath(jar_file))
+        return resolved
+
+    def download_file(
+        self, endpoint: str, path: Path, sha256: str | None = None
+    ) -> str:
+        """
+        Stream `endpoint` into `path` and return its SHA-256. Data goes to
+        `<path>.part` first, interrupted transfers are resumed with a Range
+        request (up to `retries` attempts with exponential backoff) and the
+        file is only renamed into place once complete and, if `sha256` is
+        given, verified. Raises ChecksumError on a mismatch.
+        """
         url = self.__build_url(endpoint)
-
-        with self.session.get(url, stream=True) as response:
+        part = path.with_name(f"{path.name}.part")
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        attempt = 0
+        while True:
+            try:
+                digest = self.__stream(url, part)
+                if sha256 and digest != sha256:
+                    part.unlink(missing_ok=True)
+                    raise ChecksumError(
+                        f"checksum mismatch for {url}: "
+                        f"expected {sha256}, got {digest}"
+                    )
+                break
+            except (RequestException, ValueError) as exc:
+                attempt += 1
+                if attempt >= max(1, self.retries) or not self.__retry(exc):
+                    raise
+                sleep(self.backoff * 2 ** (attempt - 1))
+
+        os.replace(part, path)
+        return digest
+
+    def __retry(self, exc: Exception) -> bool:
+        # Neither bad data nor client errors go away by asking again
+        if isinstance(exc, ChecksumError):
+            return False
+        if isinstance(exc, HTTPError) and exc.response is not None:
+            status = exc.response.status_code
+            return status >= 500 or status in (408, 429)
+        return True
+
+    def __stream(self, endpoint: str, path: Path) -> str:
+        """
+        Append the rest of `endpoint` to the partial file `path` and return
+        the SHA-256 of the whole file.
+        """
+        h = hashlib.sha256()
+        offset = 0
+        if path.exists():
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024**2), b""):
+                    h.update(chunk)
+                    offset += len(chunk)
+
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self.session.get(
+            endpoint, stream=True, headers=headers, timeout=self.timeout
+        ) as response:
+            if response.status_code == 416:
+                # Stale partial file, start over
+                path.unlink(missing_ok=True)
+                raise ValueError(f"can't resume {endpoint}")
             response.raise_for_status()
-            path.parent.mkdir(parents=True, exist_ok=True)
-            with open(path, "wb") as f:
-                copyfileobj(response.raw, f)
+
+            if offset and response.status_code != 206:
+                # Range not honoured, the whole file is coming again
+                h, offset = hashlib.sha256(), 0
+            expected = response.headers.get("Content-Length")
+            size = offset + int(expected) if expected else None
+
+            with open(path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=256 * 1024):
+                    f.write(chunk)
+                    h.update(chunk)
+                    offset += len(chunk)
+                    if self.progress is not None:
+                        self.progress(len(chunk))
+
+        if size is not None and offset != size:
+            raise ValueError(f"incomplete download of {endpoint}")
+        return h.hexdigest()
@@ -3,16 +3,21 @@
 #################################################
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 import json
+import os
 from pathlib import Path
-from time import sleep
-from typing import Any, cast
+from typing import Any, Iterable
 
-from importlib_resources import as_file, files  # type: ignore
-import jinja2
+from importlib_resources import files  # type: ignore
 from yaspin import yaspin  # type: ignore
 
-from .downloader import Downloader
+from ..utils.progress import Progress
+from ..utils.timings import phase
+from .cache import JarCache
+from .manifest import BuildManifest
+from .state import ProjectState
+from .templates import TemplateEngine, engine
 
 #################################################
 # CODE
@@ -27,49 +32,105 @@ class FileManager:
 
     cwd = Path.cwd()
 
-    def __init__(self, sleep: int = 0) -> None:
-        self.sleep = sleep
+    # Concurrent workers used to fetch server jars
+    jobs: int = int(os.environ.get("MCDOCKER_JOBS", 4))
 
-    def save_files(self, data: dicts, build: bool = False) -> None:
+    def __init__(self) -> None:
+        self.jar_cache = JarCache()
+
+    def save_files(
+        self,
+        data: dicts,
+        build: bool = False,
+        servers: Iterable[str] | None = None,
+        removed: Iterable[str] = (),
+    ) -> None:
         """
         Create/Update files and save them. Also copies the asset files.
+        Outputs whose inputs didn't change since the last build (see
+        `BuildManifest`) are left untouched. With `servers`, only the files
+        of those servers are generated (the compose file is still checked).
+        The files generated for the `removed` servers are deleted.
         """
+        only = None if servers is None else set(servers)
+
+        templates = engine()
 
-        tmps_path = files("src.assets.templates")
-        composer_template = tmps_path.joinpath("docker-compose.yml.j2")
-        env_template = tmps_path.joinpath(".env.j2")
+        manifest = BuildManifest(self.cwd)
 
         if not build:
-            self.write_json(self.cwd.joinpath("data.json"), data)
+            with phase("write data.json"):
+                self.write_json(self.cwd.joinpath("data.json"), data)
 
         compose: dicts = data.get("compose") or {}
-        with as_file(composer_template) as composer_tmp:  # type: ignore
-            composer_tmp = cast(Path, composer_tmp)
-            self.template_to_file(
-                composer_tmp, compose, self.cwd.joinpath("docker-compose.yml")
+        with phase("render docker-compose.yml"):
+            self.render_files(
+                templates,
+                "docker-compose.yml.j2",
+                [(compose, self.cwd.joinpath("docker-compose.yml"))],
+                manifest,
             )
 
         server_files: list[dicts] = data.get("server_files", []) or []
-        self.copy_server_files(self.cwd, server_files)
+        if only is not None:
+            server_files = [f for f in server_files if f.get("name") in only]
+        with phase("copy server files"):
+            self.copy_server_files(self.cwd, server_files, manifest)
 
         if compose.get("web", False):
-            self.copy_web_files(self.cwd)
+            with phase("copy web files"):
+                self.copy_web_files(self.cwd, manifest)
 
         envs: list[dicts] = data.get("envs") or []
-        for env in envs:
-            relative_path = f"servers/{env.get('CONTAINER_NAME')}/.env"  # type: ignore
-            with as_file(env_template) as env_tmp:  # type: ignore
-                env_tmp = cast(Path, env_tmp)
-                self.template_to_file(
-                    env_tmp, env, self.cwd.joinpath(relative_path)
-                )
+        if only is not None:
+            envs = [e for e in envs if e.get("CONTAINER_NAME") in only]
+        with phase("render .env files"):
+            self.render_files(
+                templates,
+                ".env.j2",
+                [
+                    (
+                        env,
+                        self.cwd.joinpath(
+                            "servers", str(env.get("CONTAINER_NAME")), ".env"
+                        ),
+                    )
+                    for env in envs
+                ],
+                manifest,
+            )
+
+        for name in removed:
+            self.remove_server_files(name, manifest)
 
         self.cwd.joinpath(".backup").mkdir(exist_ok=True)
+        # Outputs of the servers left out weren't seen, keep them
+        manifest.save(prune=only is None)
+
+    def remove_server_files(self, name: str, manifest: BuildManifest) -> None:
+        """
+        Delete the files generated for server `name` and forget them. Its
+        world and anything else added to its folder are kept.
+        """
+        folder = self.cwd.joinpath("servers", name)
+        for output in manifest.forget(f"servers/{name}/"):
+            output.unlink(missing_ok=True)
+
+        # Then the folders left empty, deepest first
+        if folder.is_dir():
+            dirs = sorted(
+                (p for p in folder.rglob("*") if p.is_dir()),
+                key=lambda p: len(p.parts),
+                reverse=True,
+            )
+            for path in [*dirs, folder]:
+                try:
+                    path.rmdir()
+                except OSError:
+                    pass
 
     @yaspin(text="Reading JSON...", color="cyan")
     def read_json(self, file: Path) -> dict[Any, Any] | None:
-        sleep(self.sleep)
-
         try:
             with open(file, "r+") as f:
                 data = dict(json.load(f))
@@ -79,17 +140,18 @@ class FileManager:
 
     @yaspin(text="Writting JSON...", color="cyan")
     def write_json(self, file: Path, data: dict[Any, Any]) -> None:
-        sleep(self.sleep)
-
         data_str = json.dumps(data, indent=2)
         with open(file, "w+") as f:
             f.write(data_str)
+        ProjectState.forget(file)
         return None
 
-    @yaspin(text="Copying server files...", color="cyan")
-    def copy_server_files(self, path: Path, server_files: list[dicts]) -> None:
-        sleep(self.sleep)
-
+    def copy_server_files(
+        self,
+        path: Path,
+        server_files: list[dicts],
+        manifest: BuildManifest | None = None,
+    ) -> None:
         docker_pkg = files("src.assets.docker")
         dockerfile_res = docker_pkg.joinpath("minecraft.Dockerfile")
         dockerignore_res = docker_pkg.joinpath("minecraft.dockerignore")
@@ -101,26 +163,29 @@ class FileManager:
         if not path.exists():
             raise ValueError("Path doesn't exist")
 
+        own_manifest = manifest is None
+        manifest = manifest or BuildManifest(path)
+
         # Read bytes from resources once
-        dockerfile_bytes = dockerfile_res.read_bytes()
-        dockerignore_bytes = dockerignore_res.read_bytes()
-        runsh_bytes = runsh_res.read_bytes()
+        assets = {
+            "Dockerfile": dockerfile_res.read_bytes(),
+            ".dockerignore": dockerignore_res.read_bytes(),
+            "run.sh": runsh_res.read_bytes(),
+            "data/eula.txt": eula_res.read_bytes(),
+        }
+        keys = {name: manifest.digest(data) for name, data in assets.items()}
         readme_bytes = readme_res.read_bytes()
-        eula_bytes = eula_res.read_bytes()
 
         # Write files for each server
+        jars: list[tuple[str, str, str | None, Path]] = []
         for server_file in server_files:
             name = str(server_file.get("name"))
             dest_dir = path.joinpath("servers", name)
-            dest_dir.mkdir(parents=True, exist_ok=True)
-
-            (dest_dir / "Dockerfile").write_bytes(dockerfile_bytes)
-            (dest_dir / ".dockerignore").write_bytes(dockerignore_bytes)
-            (dest_dir / "run.sh").write_bytes(runsh_bytes)
-
             mc_dir = dest_dir.joinpath("data")
             mc_dir.mkdir(parents=True, exist_ok=True)
-            (mc_dir / "eula.txt").write_bytes(eula_bytes)
+
+            for asset, data in assets.items():
+                manifest.write(dest_dir.joinpath(asset), keys[asset], data)
 
             server = server_file.get("server")
             if server:
@@ -131,62 +196,156 @@ class FileManager:
                 if server_type is None or jar_file is None:
                     continue
 
-                d = Downloader("https://fill.papermc.io/v3/projects")
-                d.download_latest(server_type, mc_dir, jar_file, version)
+                jars.append((name, server_type, version, mc_dir / jar_file))
+
+        self.fetch_jars(jars, manifest)
 
         # Write top-level README into the given path
-        (path / "README.md").write_bytes(readme_bytes)
+        manifest.write(
+            path / "README.md", manifest.digest(readme_bytes), readme_bytes
+        )
+
+        if own_manifest:
+            manifest.save()
+
+    def fetch_jars(
+        self,
+        jars: list[tuple[str, str, str | None, Path]],
+        manifest: BuildManifest,
+    ) -> None:
+        """
+        Resolve and download the jars of several servers concurrently, using
+        up to `jobs` workers. `jars` holds (server, type, version, jar path)
+        items. Identical requests are coalesced: each (type, version) is
+        resolved once and each resolved build is downloaded once.
+        """
+        from .downloader import Downloader
+
+        api = "https://fill.papermc.io/v3/projects"
+        progress = Progress("Downloading jars")
+
+        def resolve(request: tuple[str, str | None]) -> dicts | None:
+            try:
+                return Downloader(api).resolve(*request)
+            except Exception as exc:
+                print(
+                    f"Error resolving {request[0]} {request[1] or 'latest'}: {exc}"
+                )
+                return None
+
+        def fetch(resolved: dicts) -> Path:
+            d = Downloader(api)
+            d.progress = progress.advance
+            try:
+                return self.jar_cache.fetch(resolved, d)
+            finally:
+                progress.item_done()
+
+        workers = max(1, self.jobs)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            requests = list(dict.fromkeys((t, v) for _, t, v, _ in jars))
+            resolved = dict(zip(requests, pool.map(resolve, requests)))
+
+            # Only fetch again when a different build was resolved
+            pending: dict[str, list[tuple[str, Path, dicts]]] = {}
+            for name, server_type, version, jar_path in jars:
+                build = resolved[(server_type, version)]
+                if build is None:
+                    manifest.keep(jar_path)
+                elif not manifest.fresh(
+                    jar_path, manifest.digest(build), mtime=False
+                ):
+                    key = JarCache.key(build)
+                    pending.setdefault(key, []).append((name, jar_path, build))
+            if not pending:
+                return
+
+            progress.items = len(pending)
+            futures = {
+                key: pool.submit(fetch, targets[0][2])
+                for key, targets in pending.items()
+            }
+
+        for key, future in futures.items():
+            try:
+                blob = future.result()
+            except Exception as exc:
+                names = ", ".join(name for name, _, _ in pending[key])
+                print(f"Error downloading {key} for {names}: {exc}")
+                continue
+            for _, jar_path, build in pending[key]:
+                self.jar_cache.link(blob, jar_path)
+                manifest.record(
+                    jar_path, manifest.digest(build), build=build["build"]
+                )
+        progress.finish()
 
     @yaspin(text="Copying web files...", color="cyan")
-    def copy_web_files(self, path: Path) -> None:
-        sleep(self.sleep)
+    def copy_web_files(
+        self, path: Path, manifest: BuildManifest | None = None
+    ) -> None:
         docker_pkg = files("src.assets.docker")
-        frontend_dockerfile_res = docker_pkg.joinpath("node.Dockerfile")
-        frontend_dockerignore_res = docker_pkg.joinpath("node.dockerignore")
-        backend_dockerfile_res = docker_pkg.joinpath("python.Dockerfile")
-        backend_dockerignore_res = docker_pkg.joinpath("python.dockerignore")
+        assets = {
+            "frontend/Dockerfile": docker_pkg.joinpath("node.Dockerfile"),
+            "frontend/.dockerignore": docker_pkg.joinpath("node.dockerignore"),
+            "backend/Dockerfile": docker_pkg.joinpath("python.Dockerfile"),
+            "backend/.dockerignore": docker_pkg.joinpath("python.dockerignore"),
+        }
 
         if not path.exists():
             raise ValueError("Path doesn't exist")
 
-        frontend_dockerfile_bytes = frontend_dockerfile_res.read_bytes()
-        frontend_dockerignore_bytes = frontend_dockerignore_res.read_bytes()
-        backend_dockerfile_bytes = backend_dockerfile_res.read_bytes()
-        backend_dockerignore_bytes = backend_dockerignore_res.read_bytes()
+        own_manifest = manifest is None
+        manifest = manifest or BuildManifest(path)
 
         web_dir = path.joinpath("web")
-        web_dir.mkdir(parents=True, exist_ok=True)
-
-        frontend_dir = web_dir.joinpath("frontend")
-        backend_dir = web_dir.joinpath("backend")
-        frontend_dir.mkdir(parents=True, exist_ok=True)
-        backend_dir.mkdir(parents=True, exist_ok=True)
-
-        (frontend_dir / "Dockerfile").write_bytes(frontend_dockerfile_bytes)
-        (frontend_dir / ".dockerignore").write_bytes(
-            frontend_dockerignore_bytes
-        )
-        (backend_dir / "Dockerfile").write_bytes(backend_dockerfile_bytes)
-        (backend_dir / ".dockerignore").write_bytes(backend_dockerignore_bytes)
+        for asset, res in assets.items():
+            data = res.read_bytes()
+            manifest.write(web_dir.joinpath(asset), manifest.digest(data), data)
+
+        if own_manifest:
+            manifest.save()
+
+    def render_files(
+        self,
+        templates: TemplateEngine,
+        name: str,
+        targets: list[tuple[dicts, Path]],
+        manifest: BuildManifest,
+    ) -> None:
+        """
+        Render template `name` once per (context, destination) target,
+        batching every output that isn't fresh in `manifest`.
+        """
+        source = templates.source(name)
+        stale: list[tuple[dicts, Path, str]] = []
+        for context, dest_path in targets:
+            key = manifest.digest(source, context)
+            if not manifest.fresh(dest_path, key):
+                stale.append((context, dest_path, key))
+        if not stale:
+            return
+
+        rendered = templates.render_many(name, [c for c, _, _ in stale])
+        for (_, dest_path, key), text in zip(stale, rendered):
+            manifest.write(dest_path, key, text.encode("utf-8"))
 
     @yaspin(text="Rendering template...", color="cyan")
     def template_to_file(
-        self, template_path: Path, context: dict[Any, Any], dest_path: Path
+        self,
+        template_path: Path,
+        context: dict[Any, Any],
+        dest_path: Path,
+        manifest: BuildManifest | None = None,
     ) -> Path:
-        sleep(self.sleep)
-
-        rendered = self.__render_template(template_path, context)
-        dest_path.parent.mkdir(parents=True, exist_ok=True)
-        dest_path.write_text(rendered, encoding="utf-8")
-        return dest_path
-
-    def __render_template(
-        self, template_path: Path, context: dict[Any, Any]
-    ) -> str:
-        env = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(str(template_path.parent)),
-            trim_blocks=True,
-            lstrip_blocks=True,
+        templates = engine(template_path.parent)
+        if manifest is None:
+            rendered = templates.render(template_path.name, context)
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            dest_path.write_text(rendered, encoding="utf-8")
+            return dest_path
+
+        self.render_files(
+            templates, template_path.name, [(context, dest_path)], manifest
         )
-        template_obj = env.get_template(template_path.name)
-        return template_obj.render(**context)
+        return dest_path
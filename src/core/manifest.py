@@ -0,0 +1,135 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Callable
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+
+class BuildManifest:
+    """
+    Build manifest class. Records, for every generated file, a hash of the
+    inputs it was built from, so a rebuild only touches outputs whose
+    inputs changed and leaves the others (and their mtimes) alone.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.path = root.joinpath(".mcdocker", "manifest.json")
+        self.touched: set[str] = set()
+
+        try:
+            entries = json.loads(self.path.read_text(encoding="utf-8"))
+            self.entries: dict[str, dicts] = entries.get("outputs", {})
+        except Exception:
+            self.entries = {}
+
+    @staticmethod
+    def digest(*inputs: Any) -> str:
+        """Hash the given inputs (bytes, or anything JSON serializable)."""
+        h = hashlib.sha256()
+        for item in inputs:
+            if not isinstance(item, bytes):
+                item = json.dumps(item, sort_keys=True, default=str).encode()
+            h.update(hashlib.sha256(item).digest())
+        return h.hexdigest()
+
+    def fresh(self, output: Path, key: str, mtime: bool = True) -> bool:
+        """
+        Whether `output` exists untouched and was built from `key`. Without
+        `mtime` only its size is compared (for files copied as they are).
+        """
+        name = self.__name(output)
+        self.touched.add(name)
+
+        entry = self.entries.get(name)
+        if not entry or entry.get("inputs") != key:
+            return False
+        try:
+            stat = output.stat()
+        except OSError:
+            return False
+        recorded = entry.get("stat") or [None, None]
+        if not mtime:
+            return bool(stat.st_size == recorded[1])
+        return [stat.st_mtime_ns, stat.st_size] == recorded
+
+    def keep(self, output: Path) -> None:
+        """Keep the entry of `output` although it wasn't rebuilt."""
+        self.touched.add(self.__name(output))
+
+    def record(self, output: Path, key: str, **extra: Any) -> None:
+        """Record that `output` is now built from `key`."""
+        name = self.__name(output)
+        self.touched.add(name)
+
+        stat = output.stat()
+        self.entries[name] = {
+            "inputs": key,
+            "stat": [stat.st_mtime_ns, stat.st_size],
+            **extra,
+        }
+
+    def write(
+        self, output: Path, key: str, content: bytes | Callable[[], bytes]
+    ) -> bool:
+        """
+        Write `content` to `output` unless it is fresh. Returns whether the
+        file changed on disk.
+        """
+        if self.fresh(output, key):
+            return False
+
+        data = content() if callable(content) else content
+        try:
+            changed = output.read_bytes() != data
+        except OSError:
+            changed = True
+        if changed:
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_bytes(data)
+
+        self.record(output, key)
+        return changed
+
+    def forget(self, prefix: str) -> list[Path]:
+        """
+        Drop the entries of the outputs under `prefix` (relative to the
+        root, e.g. `servers/name/`). Returns the paths of those outputs.
+        """
+        names = [name for name in self.entries if name.startswith(prefix)]
+        for name in names:
+            del self.entries[name]
+            self.touched.discard(name)
+        return [self.root.joinpath(name) for name in names]
+
+    def save(self, prune: bool = False) -> None:
+        """
+        Persist the manifest. With `prune`, drop outputs not seen in this
+        build (e.g. removed servers).
+        """
+        if prune:
+            self.entries = {
+                name: entry
+                for name, entry in self.entries.items()
+                if name in self.touched
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(
+            json.dumps({"outputs": self.entries}, indent=2, sort_keys=True),
+            encoding="utf-8",
+        )
+
+    def __name(self, output: Path) -> str:
+        try:
+            return output.relative_to(self.root).as_posix()
+        except ValueError:
+            return output.as_posix()
@@ -0,0 +1,259 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from dataclasses import dataclass, field, fields
+from typing import Any, ClassVar, TypeVar
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+
+class ModelError(ValueError):
+    """Raised when `data.json` doesn't match the project model."""
+
+
+class _Absent:
+    """Marks a key missing from the JSON (`None` is a valid value)."""
+
+    def __repr__(self) -> str:
+        return "ABSENT"
+
+
+ABSENT: Any = _Absent()
+
+R = TypeVar("R", bound="Record")
+
+
+@dataclass(slots=True)
+class Record:
+    """
+    Base of the model records. Known keys become typed attributes (renamed
+    through `aliases`), unknown keys are kept in `extra` so serializing
+    gives back the same JSON.
+    """
+
+    aliases: ClassVar[dict[str, str]] = {}
+    # Attribute identifying the record, None if it isn't indexed
+    key: ClassVar[str | None] = "name"
+
+    @classmethod
+    def from_dict(cls: type[R], data: Any) -> R:
+        if not isinstance(data, dict):
+            raise ModelError(f"{cls.__name__.lower()} must be a mapping.")
+
+        data = dict(data)
+        values: dicts = {}
+        for f in fields(cls):  # type: ignore
+            if f.name == "extra":
+                continue
+            json_key = cls.aliases.get(f.name, f.name)
+            if json_key in data:
+                values[f.name] = data.pop(json_key)
+
+        key = cls.key
+        if key is not None and not isinstance(values.get(key), str):
+            raise ModelError(
+                f"{cls.__name__.lower()} without a valid "
+                f"'{cls.aliases.get(key, key)}'."
+            )
+        return cls(**values, extra=data)  # type: ignore
+
+    def to_dict(self) -> dicts:
+        data: dicts = {}
+        for f in fields(self):  # type: ignore
+            if f.name == "extra":
+                continue
+            value = getattr(self, f.name)
+            if value is not ABSENT:
+                data[self.aliases.get(f.name, f.name)] = value
+        data.update(self.extra)  # type: ignore
+        return data
+
+    @property
+    def id(self) -> str:
+        return str(getattr(self, self.key or ""))
+
+
+@dataclass(slots=True)
+class Server(Record):
+    """Compose service of a server."""
+
+    name: str = ""
+    build: dicts = ABSENT
+    env_file: str = ABSENT
+    working_dir: str = ABSENT
+    ports: list[str] = ABSENT
+    expose: list[int] = ABSENT
+    resources: dict[str, dicts] = ABSENT
+    extra: dicts = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class Env(Record):
+    """Contents of the `.env` file of a server."""
+
+    aliases: ClassVar[dict[str, str]] = {
+        "container_name": "CONTAINER_NAME",
+        "server_jar": "SERVER_JAR",
+        "java_args": "JAVA_ARGS",
+        "min_heap_size": "MIN_HEAP_SIZE",
+        "max_heap_size": "MAX_HEAP_SIZE",
+        "host_ports": "HOST_PORTS",
+    }
+    key: ClassVar[str | None] = "container_name"
+
+    container_name: str = ""
+    server_jar: str = ABSENT
+    java_args: str = ABSENT
+    min_heap_size: str = ABSENT
+    max_heap_size: str = ABSENT
+    host_ports: dict[str, int] = ABSENT
+    extra: dicts = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class ServerFiles(Record):
+    """Jar to download for a server (`version` None means latest)."""
+
+    name: str = ""
+    server: dicts = ABSENT
+    extra: dicts = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class Database(Record):
+    """Credentials of the PostgreSQL service."""
+
+    key: ClassVar[str | None] = None
+
+    user: str = ABSENT
+    password: str = ABSENT
+    db: str = ABSENT
+    extra: dicts = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class Project:
+    """
+    Whole `data.json`. Servers, envs and server files are indexed by server
+    name, so lookups and edits don't depend on the three JSON lists being
+    aligned. Dicts keep insertion order, which is the order written back.
+    """
+
+    servers: dict[str, Server] = field(default_factory=dict)
+    envs: dict[str, Env] = field(default_factory=dict)
+    server_files: dict[str, ServerFiles] = field(default_factory=dict)
+    # None for "database": {} (no database)
+    database: Database | None = ABSENT
+    web: bool = ABSENT
+    compose_extra: dicts = field(default_factory=dict)
+    extra: dicts = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Any) -> Project:
+        """Validate `data` in a single pass and index it by name."""
+        if not isinstance(data, dict):
+            raise ModelError("data must be a mapping.")
+
+        data = dict(data)
+        compose = data.pop("compose", {}) or {}
+        if not isinstance(compose, dict):
+            raise ModelError("compose must be a mapping.")
+        compose = dict(compose)
+
+        project = cls(
+            servers=cls.__index(Server, compose.pop("servers", None)),
+            envs=cls.__index(Env, data.pop("envs", None)),
+            server_files=cls.__index(
+                ServerFiles, data.pop("server_files", None)
+            ),
+        )
+
+        if "database" in compose:
+            database = compose.pop("database")
+            project.database = (
+                Database.from_dict(database) if database else None
+            )
+        if "web" in compose:
+            project.web = bool(compose.pop("web"))
+
+        project.compose_extra = compose
+        project.extra = data
+        return project
+
+    def to_dict(self) -> dicts:
+        compose: dicts = {
+            "servers": [s.to_dict() for s in self.servers.values()]
+        }
+        if self.database is not ABSENT:
+            compose["database"] = (
+                self.database.to_dict() if self.database else {}
+            )
+        if self.web is not ABSENT:
+            compose["web"] = self.web
+        compose.update(self.compose_extra)
+
+        return {
+            "compose": compose,
+            "envs": [e.to_dict() for e in self.envs.values()],
+            "server_files": [f.to_dict() for f in self.server_files.values()],
+            **self.extra,
+        }
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.servers)
+
+    def get(self, name: str) -> tuple[Server, Env | None, ServerFiles | None]:
+        """Records of server `name`. Raises KeyError if it doesn't exist."""
+        return (
+            self.servers[name],
+            self.envs.get(name),
+            self.server_files.get(name),
+        )
+
+    def put(self, server: Server, env: Env, server_files: ServerFiles) -> None:
+        """Add server records, replacing (in place) any with the same name."""
+        if not server.name == env.container_name == server_files.name:
+            raise ModelError("server records must share the same name.")
+        self.servers[server.name] = server
+        self.envs[env.container_name] = env
+        self.server_files[server_files.name] = server_files
+
+    def remove(self, name: str) -> bool:
+        """Remove every record of server `name`. Returns whether it existed."""
+        found = self.servers.pop(name, None) is not None
+        self.envs.pop(name, None)
+        self.server_files.pop(name, None)
+        return found
+
+    def changed(self, other: Project) -> set[str]:
+        """Servers added, or with any record changed, since `other`."""
+        return {
+            name
+            for name, server in self.servers.items()
+            if server != other.servers.get(name)
+            or self.envs.get(name) != other.envs.get(name)
+            or self.server_files.get(name) != other.server_files.get(name)
+        }
+
+    @staticmethod
+    def __index(record: type[R], items: Any) -> dict[str, R]:
+        if items is None:
+            return {}
+        if not isinstance(items, list):
+            raise ModelError(f"{record.__name__.lower()}s must be a list.")
+
+        index: dict[str, R] = {}
+        for item in items:
+            obj = record.from_dict(item)
+            if obj.id in index:
+                raise ModelError(
+                    f"duplicated {record.__name__.lower()} '{obj.id}'."
+                )
+            index[obj.id] = obj
+        return index
@@ -0,0 +1,140 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from itertools import count
+import socket
+import struct
+from types import TracebackType
+from typing import Any
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+DEFAULT_PORT = 25575
+
+# Packet types of the Source RCON protocol spoken by the server
+LOGIN = 3
+COMMAND = 2
+RESPONSE = 0
+
+# Header (length, id, type) and the longest body of a response packet,
+# longer outputs come split over several of them
+HEADER = struct.Struct("<iii")
+MAX_BODY = 4096
+
+
+class RconError(Exception):
+    """Raised when the RCON server is unreachable or rejects a request."""
+
+
+class Rcon:
+    """
+    RCON client class. In charge of logging into the remote console of a
+    server and running commands on it, one at a time.
+    """
+
+    def __init__(
+        self, host: str, port: int, password: str, timeout: float = 30
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+
+        self.__sock: socket.socket | None = None
+        self.__ids = count(1)
+
+    def __enter__(self) -> Rcon:
+        self.connect()
+        return self
+
+    def __exit__(
+        self,
+        kind: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def connect(self) -> None:
+        try:
+            self.__sock = socket.create_connection(
+                (self.host, self.port), timeout=self.timeout
+            )
+        except OSError as exc:
+            raise RconError(
+                f"can't reach {self.host}:{self.port} ({exc})"
+            ) from None
+        request = self.__send(LOGIN, self.password)
+        # A failed login answers with the id -1
+        while True:
+            id, kind, _ = self.__receive()
+            if id == -1:
+                self.close()
+                raise RconError("wrong RCON password")
+            if id == request and kind == COMMAND:
+                return
+
+    def command(self, command: str) -> str:
+        """Run `command` and return its output."""
+        if self.__sock is None:
+            raise RconError("not connected")
+        request = self.__send(COMMAND, command)
+        output = ""
+        while True:
+            id, _, body = self.__receive()
+            if id != request:
+                continue
+            output += body
+            if len(body.encode()) < MAX_BODY:
+                return output
+
+    def close(self) -> None:
+        if self.__sock is not None:
+            self.__sock.close()
+            self.__sock = None
+
+    def __send(self, kind: int, body: str) -> int:
+        id = next(self.__ids)
+        payload = body.encode() + b"\x00\x00"
+        packet = HEADER.pack(len(payload) + 8, id, kind) + payload
+        try:
+            self.__sock.sendall(packet)  # type: ignore
+        except OSError as exc:
+            self.close()
+            raise RconError(f"connection lost ({exc})") from None
+        return id
+
+    def __receive(self) -> tuple[int, int, str]:
+        length, id, kind = HEADER.unpack(self.__read(HEADER.size))
+        body = self.__read(length - 8)
+        return id, kind, body[:-2].decode(errors="replace")
+
+    def __read(self, size: int) -> bytes:
+        data = bytearray()
+        try:
+            while len(data) < size:
+                chunk = self.__sock.recv(size - len(data))  # type: ignore
+                if not chunk:
+                    raise ConnectionError("closed by the server")
+                data.extend(chunk)
+        except OSError as exc:
+            self.close()
+            raise RconError(f"connection lost ({exc})") from None
+        return bytes(data)
+
+
+def properties(text: str) -> dict[str, str]:
+    """Settings of a `server.properties` file."""
+    settings: dict[str, str] = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("#", "!")):
+            continue
+        key, _, value = line.partition("=")
+        settings[key.strip()] = value.strip()
+    return settings
@@ -0,0 +1,803 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+import secrets
+import struct
+import sys
+import tarfile
+from threading import Lock, get_native_id, local
+from time import time
+from typing import Any, BinaryIO, Iterator
+import zlib
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+# Content-defined chunking: a chunk ends right after MARKER, found at C
+# speed with bytes.find, once it is CHUNK_MIN long, or at CHUNK_MAX. On
+# compressed data such as region files MARKER shows up every 64 KiB on
+# average, so chunks average ~128 KiB and an edit only changes the chunks
+# around it, wherever it shifts the rest of the file.
+CHUNK_MIN = 64 * 1024
+CHUNK_MAX = 1024 * 1024
+MARKER = b"\xe3\x1c"
+
+# Packs are closed once this big
+PACK_SIZE = 32 * 1024 * 1024
+# Packs with less live data than this are rewritten by `gc`
+REPACK_RATIO = 0.5
+
+INDEX_MAGIC = b"MCDIDX1\n"
+# Chunk id (sha256), offset, stored size, raw size, codec
+ENTRY = struct.Struct("<32sQIIB")
+
+# Codecs of the stored chunks
+RAW = 0
+ZLIB = 1
+ZSTD = 2
+
+# Compressions, their default levels and the levels they take
+LEVELS = {"zstd": 3, "gzip": 6}
+LEVEL_RANGES = {"zstd": (1, 22), "gzip": (1, 9)}
+
+# How snapshots read their files: every file, or the changed ones
+FULL = "full"
+INCREMENTAL = "incremental"
+
+
+class RepositoryError(Exception):
+    """Raised when the backup repository is missing data or corrupted."""
+
+
+def zstd() -> Any:
+    """The optional zstandard module, None if it isn't installed."""
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        return None
+    return zstandard
+
+
+def resolve_compression(name: str | None = None) -> str:
+    """
+    Compression to use: `name`, else `$MCDOCKER_BACKUP_COMPRESSION`. `auto`
+    (the default) is zstd when installed, gzip otherwise.
+    """
+    name = name or os.environ.get("MCDOCKER_BACKUP_COMPRESSION", "auto")
+    name = name.lower()
+    if name == "auto":
+        return "zstd" if zstd() is not None else "gzip"
+    if name not in LEVELS:
+        raise RepositoryError(f"unknown compression '{name}'.")
+    if name == "zstd" and zstd() is None:
+        raise RepositoryError(
+            "zstd compression requires the zstandard package "
+            "(pip install 'MinecraftDockerCLI[zstd]')."
+        )
+    return name
+
+
+def check_level(name: str, level: int) -> int:
+    """`level`, if compression `name` takes it. Raises RepositoryError if not."""
+    low, high = LEVEL_RANGES[name]
+    if not low <= level <= high:
+        raise RepositoryError(
+            f"{name} compression levels go from {low} to {high}, not {level}."
+        )
+    return level
+
+
+def chunks(stream: BinaryIO, read_size: int = 4 * CHUNK_MAX) -> Iterator[bytes]:
+    """Split `stream` into content-defined chunks."""
+    buf = bytearray()
+    start = 0
+    eof = False
+    while True:
+        if not eof and len(buf) - start < CHUNK_MAX:
+            if start:
+                del buf[:start]
+                start = 0
+            data = stream.read(read_size)
+            if data:
+                buf += data
+                continue
+            eof = True
+        if start >= len(buf):
+            return
+
+        # Either a full window is buffered or the stream ended
+        found = buf.find(
+            MARKER, start + CHUNK_MIN - len(MARKER), start + CHUNK_MAX
+        )
+        end = found + len(MARKER) if found >= 0 else start + CHUNK_MAX
+        end = min(end, len(buf))
+        yield bytes(buf[start:end])
+        start = end
+
+
+@dataclass(slots=True, frozen=True)
+class Location:
+    """Where a chunk is stored."""
+
+    pack: str
+    offset: int
+    size: int
+    raw: int
+    codec: int
+
+
+@dataclass(slots=True)
+class Snapshot:
+    """
+    Backup of the files of a server. `files` maps each path to its size,
+    mtime, mode and the id of its tree (the list of its chunks), so an
+    unchanged file costs a line here and nothing in the packs. `hashes`
+    holds the sha256 of each file, taken while it was stored, to check it
+    end to end (snapshots of older versions have none).
+    """
+
+    server: str
+    id: str
+    # When the files were listed, mtimes from then on are not trusted
+    time: float
+    kind: str = FULL
+    files: dict[str, list[Any]] = field(default_factory=dict)
+    # Bytes of the files, and new bytes this snapshot added to the packs
+    # once compressed
+    size: int = 0
+    added: int = 0
+    # Seconds the backup took
+    elapsed: float = 0.0
+    hashes: dict[str, str] = field(default_factory=dict)
+
+    def changed(self, files: dict[str, list[int]]) -> list[str]:
+        """
+        Paths of `files` (size and mtime by path) new or modified since this
+        snapshot. Files written in the second it was listed count as
+        modified, as their mtime can't tell whether the write came before
+        or after.
+        """
+        racy = int(self.time) - 1
+        changed: list[str] = []
+        for path, (size, mtime) in files.items():
+            known = self.files.get(path)
+            if known is None or known[:2] != [size, mtime] or mtime >= racy:
+                changed.append(path)
+        return changed
+
+    def info(self) -> SnapshotInfo:
+        return SnapshotInfo(
+            self.server,
+            self.id,
+            self.time,
+            self.kind,
+            self.size,
+            self.added,
+            len(self.files),
+            self.elapsed,
+        )
+
+
+@dataclass(slots=True)
+class SnapshotInfo:
+    """Summary of a snapshot, as kept in the snapshot index."""
+
+    server: str
+    id: str
+    time: float
+    kind: str
+    size: int
+    added: int
+    # Number of files
+    count: int
+    elapsed: float = 0.0
+
+
+class FileReader:
+    """Read-only file streaming the chunks of a tree from the packs."""
+
+    def __init__(self, repository: Repository, tree: str) -> None:
+        self.repository = repository
+        self.ids = repository.tree(tree)
+        self.next = 0
+        self.buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        parts = [self.buffer]
+        have = len(self.buffer)
+        while self.next < len(self.ids) and (size < 0 or have < size):
+            chunk = self.repository.get(self.ids[self.next])
+            self.next += 1
+            parts.append(chunk)
+            have += len(chunk)
+
+        data = b"".join(parts)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+
+class Repository:
+    """
+    Backup repository class. In charge of a content-addressed store of
+    file chunks under `root`:
+
+    - `packs/`: chunks appended to pack files, compressed one by one.
+    - `index/`: one index per pack, fixed-size binary entries giving each
+      chunk's pack, offset and sizes. Loaded once into memory.
+    - `snapshots/<server>/<id>.json`: the files of each snapshot.
+    - `snapshots/index.json`: a summary of every snapshot, so listing and
+      pruning them doesn't read thousands of files. Rebuilt if missing.
+
+    Chunks are only stored once, whatever the number of snapshots or
+    servers holding them. Workers of a backup share one pack writer, and
+    a pool of `threads` hashing and compressing chunks on the host.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        compression: str | None = None,
+        level: int | None = None,
+        threads: int | None = None,
+        nice: int = 0,
+    ) -> None:
+        self.root = root
+        # Niceness of the compression threads, on Linux
+        self.nice = nice
+        self.compression = resolve_compression(compression)
+        level = level or int(
+            os.environ.get("MCDOCKER_BACKUP_LEVEL", LEVELS[self.compression])
+        )
+        self.level = check_level(self.compression, level)
+        self.threads = threads or int(
+            os.environ.get("MCDOCKER_BACKUP_THREADS", os.cpu_count() or 2)
+        )
+
+        self.__index: dict[bytes, Location] | None = None
+        self.__lock = Lock()
+        self.__catalog_lock = Lock()
+        self.__pool: ThreadPoolExecutor | None = None
+        self.__local = local()
+        self.__pack: BinaryIO | None = None
+        self.__pack_id = ""
+        self.__pack_entries: list[tuple[bytes, Location]] = []
+
+    @property
+    def index(self) -> dict[bytes, Location]:
+        with self.__lock:
+            if self.__index is None:
+                self.__index = self.__load_index()
+            return self.__index
+
+    def pack_path(self, pack: str) -> Path:
+        return self.root.joinpath("packs", pack[:2], f"{pack}.pack")
+
+    def index_path(self, pack: str) -> Path:
+        return self.root.joinpath("index", f"{pack}.idx")
+
+    def put(self, data: bytes) -> tuple[bytes, int]:
+        """
+        Store a chunk unless already there. Returns its id and the bytes it
+        added to the packs.
+        """
+        return self.__commit(self.__prepare(data))
+
+    def get(self, chunk_id: bytes) -> bytes:
+        location = self.index.get(chunk_id)
+        if location is None:
+            raise RepositoryError(f"missing chunk {chunk_id.hex()}.")
+
+        with self.__lock:
+            if location.pack == self.__pack_id and self.__pack is not None:
+                self.__pack.flush()
+        with open(self.pack_path(location.pack), "rb") as f:
+            f.seek(location.offset)
+            blob = f.read(location.size)
+
+        data = self.__decompress(blob, location.codec)
+        if hashlib.sha256(data).digest() != chunk_id:
+            raise RepositoryError(f"corrupted chunk {chunk_id.hex()}.")
+        return data
+
+    def store(self, stream: BinaryIO) -> tuple[str, int, int]:
+        """
+        Store the contents of `stream`. Returns the id of its tree, its size
+        and the bytes it added to the packs.
+        """
+        ids: list[bytes] = []
+        size = added = 0
+
+        def commit(
+            future: Future[tuple[bytes, int, int, bytes | None]],
+        ) -> None:
+            nonlocal added
+            chunk_id, stored = self.__commit(future.result())
+            ids.append(chunk_id)
+            added += stored
+
+        # Chunks are hashed and compressed in the pool, a few ahead of the
+        # one being written, and stored in order
+        pending: deque[Future[tuple[bytes, int, int, bytes | None]]] = deque()
+        for chunk in chunks(stream):
+            size += len(chunk)
+            pending.append(self.pool.submit(self.__prepare, chunk))
+            if len(pending) > 2 * self.threads:
+                commit(pending.popleft())
+        while pending:
+            commit(pending.popleft())
+
+        tree_id, stored = self.put(b"".join(ids))
+        return tree_id.hex(), size, added + stored
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        with self.__lock:
+            if self.__pool is None:
+                self.__pool = ThreadPoolExecutor(
+                    max_workers=max(1, self.threads),
+                    thread_name_prefix="compress",
+                    initializer=self.__lower_priority,
+                )
+            return self.__pool
+
+    def close(self) -> None:
+        """Close the current pack and stop the compression threads."""
+        self.flush()
+        with self.__lock:
+            pool, self.__pool = self.__pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def tree(self, tree: str) -> list[bytes]:
+        """Ids of the chunks of a file."""
+        data = self.get(bytes.fromhex(tree))
+        return [data[i : i + 32] for i in range(0, len(data), 32)]
+
+    def open(self, tree: str) -> FileReader:
+        return FileReader(self, tree)
+
+    def write_tar(self, snapshot: Snapshot, out: BinaryIO) -> int:
+        """
+        Write the files of `snapshot` to `out` as an uncompressed tar stream.
+        Returns the bytes of the files.
+        """
+        with tarfile.open(
+            fileobj=out, mode="w|", format=tarfile.PAX_FORMAT
+        ) as tar:
+            for path, (size, mtime, mode, tree) in sorted(
+                snapshot.files.items()
+            ):
+                info = tarfile.TarInfo(path)
+                info.size, info.mtime, info.mode = size, mtime, mode
+                tar.addfile(info, self.open(tree))  # type: ignore
+        return snapshot.size or sum(f[0] for f in snapshot.files.values())
+
+    def export(
+        self,
+        snapshot: Snapshot,
+        out: BinaryIO,
+        compression: str | None = None,
+        level: int | None = None,
+    ) -> int:
+        """
+        Write `snapshot` to `out` as a tar compressed on the host with zstd
+        (on every core) or gzip, or uncompressed if `compression` is
+        `none`. Returns the bytes of the files.
+        """
+        if compression == "none":
+            return self.write_tar(snapshot, out)
+
+        name = resolve_compression(compression)
+        level = check_level(name, level or LEVELS[name])
+        writer: Any
+        if name == "zstd":
+            compressor = zstd().ZstdCompressor(level=level, threads=-1)
+            writer = compressor.stream_writer(out, closefd=False)
+        else:
+            writer = gzip.GzipFile(
+                fileobj=out, mode="wb", compresslevel=level, mtime=0
+            )
+        with writer:
+            return self.write_tar(snapshot, writer)
+
+    def extract(self, snapshot: Snapshot, dest: Path, jobs: int = 4) -> int:
+        """
+        Write the files of `snapshot` into `dest`, streaming them from the
+        packs. Returns the bytes written.
+        """
+        dest = dest.absolute()
+        dest.mkdir(parents=True, exist_ok=True)
+
+        def write(item: tuple[str, list[Any]]) -> int:
+            path, (size, mtime, mode, tree) = item
+            target = Path(os.path.normpath(dest.joinpath(path)))
+            if not target.is_relative_to(dest) or target == dest:
+                raise RepositoryError(f"unsafe path in snapshot: {path}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(target, "wb") as f:
+                for chunk_id in self.tree(tree):
+                    f.write(self.get(chunk_id))
+            os.chmod(target, mode)
+            os.utime(target, (mtime, mtime))
+            return int(size)
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            return sum(pool.map(write, snapshot.files.items()))
+
+    def verify(self, snapshot: Snapshot) -> int:
+        """
+        Read back every chunk of `snapshot` on the compression threads,
+        checking its hash. Returns the bytes checked, raises RepositoryError
+        on a missing or corrupted chunk.
+        """
+        ids: set[bytes] = set()
+        for *_, tree in snapshot.files.values():
+            ids.update(self.tree(tree))
+        return sum(self.pool.map(lambda chunk_id: len(self.get(chunk_id)), ids))
+
+    def verify_pack(
+        self, pack: str, entries: list[tuple[bytes, Location]]
+    ) -> int:
+        """
+        Check the chunks `entries` of `pack`, read in the order they were
+        written. Returns the bytes read, raises RepositoryError if the
+        pack is missing or damaged.
+        """
+        read = damaged = 0
+        try:
+            with open(self.pack_path(pack), "rb") as f:
+                for chunk_id, location in sorted(
+                    entries, key=lambda entry: entry[1].offset
+                ):
+                    f.seek(location.offset)
+                    blob = f.read(location.size)
+                    read += len(blob)
+                    try:
+                        raw = self.__decompress(blob, location.codec)
+                    except RepositoryError:
+                        raise
+                    except Exception:
+                        damaged += 1
+                        continue
+                    if hashlib.sha256(raw).digest() != chunk_id:
+                        damaged += 1
+        except OSError as exc:
+            raise RepositoryError(f"can't read pack {pack} ({exc}).") from None
+        if damaged:
+            raise RepositoryError(
+                f"pack {pack} has {damaged} corrupted chunks."
+            )
+        return read
+
+    def verify_file(self, tree: str, size: int, digest: str | None) -> int:
+        """
+        Stream the file of `tree` from the packs, checking its `size` and,
+        if given, its sha256 `digest`. Returns its size, raises
+        RepositoryError if it doesn't match.
+        """
+        hasher = hashlib.sha256()
+        read = 0
+        for chunk_id in self.tree(tree):
+            chunk = self.get(chunk_id)
+            hasher.update(chunk)
+            read += len(chunk)
+        if read != size:
+            raise RepositoryError(f"{read} bytes instead of {size}.")
+        if digest is not None and hasher.hexdigest() != digest:
+            raise RepositoryError("content doesn't match its hash.")
+        return read
+
+    def references(
+        self, snapshot: Snapshot, trees: dict[str, list[bytes]] | None = None
+    ) -> set[bytes]:
+        """
+        Ids of the trees and chunks `snapshot` uses. `trees` caches the
+        chunks of the trees read, across calls.
+        """
+        trees = trees if trees is not None else {}
+        ids: set[bytes] = set()
+        for *_, tree in snapshot.files.values():
+            if tree not in trees:
+                trees[tree] = self.tree(tree)
+            ids.add(bytes.fromhex(tree))
+            ids.update(trees[tree])
+        return ids
+
+    def save(self, snapshot: Snapshot) -> Path:
+        """Make the chunks of `snapshot` durable, then record it."""
+        self.flush()
+        path = self.snapshot_path(snapshot.server, snapshot.id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.__write(path, json.dumps(asdict(snapshot), separators=(",", ":")))
+        with self.__catalog_lock:
+            entries = self.__read_catalog()
+            entries[f"{snapshot.server}/{snapshot.id}"] = asdict(
+                snapshot.info()
+            )
+            self.__write_catalog(entries)
+        return path
+
+    def load(self, server: str, snapshot_id: str) -> Snapshot:
+        """Snapshot `snapshot_id` of `server`, with its files."""
+        path = self.snapshot_path(server, snapshot_id)
+        try:
+            return Snapshot(**json.loads(path.read_text()))
+        except (OSError, ValueError, TypeError):
+            raise RepositoryError(
+                f"can't read snapshot {snapshot_id} of {server}."
+            ) from None
+
+    def catalog(self, server: str | None = None) -> list[SnapshotInfo]:
+        """
+        Summaries of the snapshots (of `server` if given), oldest first,
+        from the snapshot index.
+        """
+        with self.__catalog_lock:
+            entries = self.__read_catalog()
+        found = [
+            SnapshotInfo(**entry)
+            for entry in entries.values()
+            if server is None or entry["server"] == server
+        ]
+        return sorted(found, key=lambda info: info.time)
+
+    def reindex(self) -> int:
+        """Rebuild the snapshot index from the snapshots. Returns their count."""
+        with self.__catalog_lock:
+            self.catalog_path.unlink(missing_ok=True)
+            return len(self.__read_catalog())
+
+    @property
+    def catalog_path(self) -> Path:
+        return self.root.joinpath("snapshots", "index.json")
+
+    def snapshot_path(self, server: str, snapshot_id: str) -> Path:
+        return self.root.joinpath("snapshots", server, f"{snapshot_id}.json")
+
+    def snapshots(self, server: str | None = None) -> list[Snapshot]:
+        """Snapshots (of `server` if given), oldest first."""
+        folder = self.root.joinpath("snapshots")
+        pattern = f"{server}/*.json" if server else "*/*.json"
+        found: list[Snapshot] = []
+        for path in folder.glob(pattern):
+            try:
+                found.append(Snapshot(**json.loads(path.read_text())))
+            except (OSError, ValueError, TypeError):
+                continue
+        return sorted(found, key=lambda snapshot: snapshot.time)
+
+    def forget(self, snapshot: Snapshot | SnapshotInfo) -> None:
+        """Drop a snapshot. Its chunks stay until `gc`."""
+        with self.__catalog_lock:
+            entries = self.__read_catalog()
+            entries.pop(f"{snapshot.server}/{snapshot.id}", None)
+            self.__write_catalog(entries)
+        self.snapshot_path(snapshot.server, snapshot.id).unlink(missing_ok=True)
+
+    def flush(self) -> None:
+        """Close the current pack, writing its index."""
+        with self.__lock:
+            self.__close_pack()
+
+    def gc(self, grace: float = 3600) -> tuple[int, int]:
+        """
+        Delete the chunks no snapshot uses: packs without live chunks are
+        removed, mostly dead ones rewritten. Packs without index younger
+        than `grace` seconds may be being written and are left alone.
+        Returns the packs removed and the bytes freed.
+        """
+        self.flush()
+        live: set[bytes] = set()
+        for snapshot in self.snapshots():
+            for *_, tree in snapshot.files.values():
+                tree_id = bytes.fromhex(tree)
+                if tree_id not in live:
+                    live.add(tree_id)
+                    live.update(self.tree(tree))
+
+        index = self.index
+        packs: dict[str, list[tuple[bytes, Location]]] = {}
+        for chunk_id, location in index.items():
+            packs.setdefault(location.pack, []).append((chunk_id, location))
+
+        removed = freed = 0
+        for pack, entries in packs.items():
+            alive = [(c, loc) for c, loc in entries if c in live]
+            total = sum(loc.size for _, loc in entries)
+            kept = sum(loc.size for _, loc in alive)
+            if alive and kept >= total * REPACK_RATIO:
+                continue
+
+            # Copy the live chunks as they are into the current pack
+            for chunk_id, location in alive:
+                with open(self.pack_path(pack), "rb") as f:
+                    f.seek(location.offset)
+                    blob = f.read(location.size)
+                with self.__lock:
+                    index[chunk_id] = self.__append(
+                        chunk_id, blob, location.raw, location.codec
+                    )
+            self.flush()
+
+            with self.__lock:
+                for chunk_id, location in entries:
+                    if index.get(chunk_id) == location:
+                        del index[chunk_id]
+            self.index_path(pack).unlink(missing_ok=True)
+            self.pack_path(pack).unlink(missing_ok=True)
+            removed += 1
+            freed += total - kept
+
+        # Leftovers of interrupted backups
+        for path in self.root.joinpath("packs").glob("*/*.pack"):
+            stat = path.stat()
+            if path.stem not in packs and time() - stat.st_mtime > grace:
+                path.unlink()
+                removed += 1
+                freed += stat.st_size
+        return removed, freed
+
+    def size(self) -> int:
+        """Bytes of the packs."""
+        return sum(
+            p.stat().st_size for p in self.root.joinpath("packs").glob("*/*")
+        )
+
+    def __prepare(self, data: bytes) -> tuple[bytes, int, int, bytes | None]:
+        """
+        Hash and, if new, compress a chunk. Runs in the pool: hashlib, zlib
+        and zstandard release the GIL, so chunks compress in parallel.
+        """
+        chunk_id = hashlib.sha256(data).digest()
+        if chunk_id in self.index:
+            return chunk_id, len(data), RAW, None
+        codec, blob = self.__compress(data)
+        return chunk_id, len(data), codec, blob
+
+    def __commit(
+        self, prepared: tuple[bytes, int, int, bytes | None]
+    ) -> tuple[bytes, int]:
+        chunk_id, raw, codec, blob = prepared
+        if blob is None:
+            return chunk_id, 0
+        with self.__lock:
+            assert self.__index is not None
+            # Another worker may have stored it meanwhile
+            if chunk_id in self.__index:
+                return chunk_id, 0
+            self.__index[chunk_id] = self.__append(chunk_id, blob, raw, codec)
+        return chunk_id, len(blob)
+
+    def __compress(self, data: bytes) -> tuple[int, bytes]:
+        if self.compression == "zstd":
+            # Compression contexts can't be shared between threads
+            compressor = getattr(self.__local, "zstd", None)
+            if compressor is None:
+                compressor = zstd().ZstdCompressor(level=self.level)
+                self.__local.zstd = compressor
+            codec, blob = ZSTD, compressor.compress(data)
+        else:
+            codec, blob = ZLIB, zlib.compress(data, self.level)
+        # Already compressed data (most of the region files) is kept raw
+        if len(blob) >= len(data):
+            return RAW, data
+        return codec, blob
+
+    @staticmethod
+    def __decompress(blob: bytes, codec: int) -> bytes:
+        if codec == RAW:
+            return blob
+        if codec == ZLIB:
+            return zlib.decompress(blob)
+        if codec == ZSTD:
+            module = zstd()
+            if module is None:
+                raise RepositoryError(
+                    "the repository has zstd chunks, install zstandard."
+                )
+            return bytes(module.ZstdDecompressor().decompress(blob))
+        raise RepositoryError(f"unknown codec {codec}.")
+
+    def __append(
+        self, chunk_id: bytes, blob: bytes, raw: int, codec: int
+    ) -> Location:
+        """Append a blob to the current pack. Call with the lock held."""
+        if self.__pack is None:
+            self.__pack_id = secrets.token_hex(16)
+            path = self.pack_path(self.__pack_id)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.__pack = open(path, "wb")
+
+        location = Location(
+            self.__pack_id, self.__pack.tell(), len(blob), raw, codec
+        )
+        self.__pack.write(blob)
+        self.__pack_entries.append((chunk_id, location))
+        if self.__pack.tell() >= PACK_SIZE:
+            self.__close_pack()
+        return location
+
+    def __close_pack(self) -> None:
+        """Sync the current pack and write its index. Call with the lock."""
+        if self.__pack is None:
+            return
+        self.__pack.flush()
+        os.fsync(self.__pack.fileno())
+        self.__pack.close()
+
+        data = INDEX_MAGIC + b"".join(
+            ENTRY.pack(chunk_id, loc.offset, loc.size, loc.raw, loc.codec)
+            for chunk_id, loc in self.__pack_entries
+        )
+        path = self.index_path(self.__pack_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.__write(path, data)
+
+        self.__pack = None
+        self.__pack_id = ""
+        self.__pack_entries = []
+
+    def __load_index(self) -> dict[bytes, Location]:
+        index: dict[bytes, Location] = {}
+        for path in self.root.joinpath("index").glob("*.idx"):
+            data = path.read_bytes()
+            if not data.startswith(INDEX_MAGIC):
+                raise RepositoryError(f"invalid index {path.name}.")
+            for chunk_id, offset, size, raw, codec in ENTRY.iter_unpack(
+                data[len(INDEX_MAGIC) :]
+            ):
+                index[chunk_id] = Location(path.stem, offset, size, raw, codec)
+        return index
+
+    def __lower_priority(self) -> None:
+        if self.nice and sys.platform == "linux":
+            try:
+                os.setpriority(os.PRIO_PROCESS, get_native_id(), self.nice)
+            except OSError:
+                pass
+
+    def __read_catalog(self) -> dict[str, dicts]:
+        """
+        Entries of the snapshot index, read from disk each time so other
+        processes' changes show. Rebuilt from the snapshots if unusable.
+        """
+        try:
+            entries = json.loads(self.catalog_path.read_bytes())["snapshots"]
+            if isinstance(entries, dict):
+                return entries
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        entries = {
+            f"{snapshot.server}/{snapshot.id}": asdict(snapshot.info())
+            for snapshot in self.snapshots()
+        }
+        self.__write_catalog(entries)
+        return entries
+
+    def __write_catalog(self, entries: dict[str, dicts]) -> None:
+        self.catalog_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": 1, "snapshots": entries}
+        self.__write(self.catalog_path, json.dumps(data, separators=(",", ":")))
+
+    @staticmethod
+    def __write(path: Path, data: str | bytes) -> None:
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data.encode() if isinstance(data, str) else data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
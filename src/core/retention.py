@@ -0,0 +1,133 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+import os
+from pathlib import Path
+from time import localtime, strftime
+from typing import TYPE_CHECKING, Any, Mapping
+
+from ..utils.size import parse_size
+
+if TYPE_CHECKING:
+    from .repository import SnapshotInfo
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+# Period of each grandfather-father-son bucket, as a strftime key: two
+# snapshots share a bucket when their keys are equal
+BUCKETS = {
+    "hourly": "%Y-%m-%d %H",
+    "daily": "%Y-%m-%d",
+    "weekly": "%G-%V",
+    "monthly": "%Y-%m",
+}
+
+
+@dataclass(slots=True)
+class Policy:
+    """
+    Retention policy. Keeps the `last` snapshots, and the newest snapshot
+    of each of the latest `hourly`, `daily`, `weekly` and `monthly`
+    periods that have one. Then, if the snapshots kept take more than
+    `max_bytes` in the repository, the oldest of them go too. The newest
+    snapshot is always kept.
+    """
+
+    last: int = 0
+    hourly: int = 0
+    daily: int = 0
+    weekly: int = 0
+    monthly: int = 0
+    max_bytes: int = 0
+
+    @classmethod
+    def from_env(cls) -> Policy:
+        """
+        Policy of `$MCDOCKER_KEEP_<LAST|HOURLY|DAILY|WEEKLY|MONTHLY>` and
+        `$MCDOCKER_BACKUP_MAX_SIZE` (such as `50GB`), by default a day of
+        hourly snapshots, a week of daily, a month of weekly and half a
+        year of monthly ones, whatever their size.
+        """
+        defaults = {"hourly": 24, "daily": 7, "weekly": 4, "monthly": 6}
+        counts = {
+            name: int(
+                os.environ.get(f"MCDOCKER_KEEP_{name.upper()}")
+                or defaults.get(name, 0)
+            )
+            for name in ("last", *BUCKETS)
+        }
+        size = os.environ.get("MCDOCKER_BACKUP_MAX_SIZE", "")
+        return cls(**counts, max_bytes=parse_size(size) if size else 0)
+
+    @property
+    def counts(self) -> bool:
+        """Whether the policy keeps snapshots by count or age at all."""
+        return any(
+            (self.last, self.hourly, self.daily, self.weekly, self.monthly)
+        )
+
+    def select(self, times: list[float]) -> set[int]:
+        """
+        Indexes of the snapshots taken at `times` the counts and periods
+        keep, all of them if the policy has none.
+        """
+        if not self.counts:
+            return set(range(len(times)))
+        newest = sorted(range(len(times)), key=times.__getitem__, reverse=True)
+        kept = set(newest[: max(1, self.last)])
+        for bucket, key in BUCKETS.items():
+            wanted = getattr(self, bucket)
+            periods: set[str] = set()
+            for i in newest:
+                if len(periods) >= wanted:
+                    break
+                period = strftime(key, localtime(times[i]))
+                if period not in periods:
+                    periods.add(period)
+                    kept.add(i)
+        return kept
+
+
+@dataclass(slots=True)
+class PruneResult:
+    """What a pruning removed."""
+
+    snapshots: list[SnapshotInfo] = field(default_factory=list)
+    dumps: list[Path] = field(default_factory=list)
+    packs: int = 0
+    freed: int = 0
+
+    def status(self) -> str:
+        return (
+            f"Removed {len(self.snapshots)} snapshots, {len(self.dumps)} "
+            f"database dumps and {self.packs} packs "
+            f"({self.freed / 1024**2:.1f} MB freed)."
+        )
+
+
+def over_budget(
+    references: list[set[bytes]], sizes: Mapping[bytes, int], budget: int
+) -> int:
+    """
+    How many of the oldest snapshots to drop for the chunks of the others
+    to fit in `budget` bytes. `references` holds the chunks of each
+    snapshot, oldest first, and `sizes` their stored size. A chunk only
+    frees space once no remaining snapshot uses it.
+    """
+    users = Counter(chunk for chunks in references for chunk in chunks)
+    total = sum(sizes.get(chunk, 0) for chunk in users)
+    dropped = 0
+    while total > budget and dropped < len(references) - 1:
+        for chunk in references[dropped]:
+            users[chunk] -= 1
+            if not users[chunk]:
+                total -= sizes.get(chunk, 0)
+        dropped += 1
+    return dropped
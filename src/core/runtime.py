@@ -0,0 +1,583 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import http.client
+import json
+import os
+from pathlib import Path
+import socket
+from subprocess import DEVNULL, PIPE, Popen, run
+from threading import Lock, Thread
+from typing import Any, BinaryIO, Iterator, cast
+from urllib.parse import quote, urlencode
+
+from ..utils.size import parse_size
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+
+# Label docker compose puts on the containers of a project
+WORKING_DIR_LABEL = "com.docker.compose.project.working_dir"
+
+
+class DockerError(Exception):
+    """Raised when the Docker daemon rejects a request."""
+
+
+class Runtime(ABC):
+    """
+    Container runtime base class. In charge of the per-container operations
+    (start, stop, exec, stats) of a compose project. `api` tells whether
+    it talks to the Engine API instead of running the docker CLI.
+    """
+
+    api: bool = False
+
+    @abstractmethod
+    def containers(self, project_dir: Path) -> list[str]:
+        """Names of the containers of the compose project in `project_dir`."""
+
+    @abstractmethod
+    def start(self, names: list[str]) -> None:
+        """Start the containers `names`."""
+
+    @abstractmethod
+    def stop(self, names: list[str]) -> None:
+        """Stop the containers `names`."""
+
+    @abstractmethod
+    def exec(
+        self,
+        container: str,
+        cmd: list[str],
+        stdout: BinaryIO,
+        stdin: BinaryIO | None = None,
+    ) -> tuple[int, bytes]:
+        """
+        Run `cmd` in `container`, streaming its output to `stdout` and, if
+        given, `stdin` to its input. Returns the exit code and stderr.
+        """
+
+    @abstractmethod
+    def stats(self, names: list[str]) -> dict[str, dicts]:
+        """CPU (percent), memory and memory limit (bytes) of each container."""
+
+    @abstractmethod
+    def address(self, container: str) -> str:
+        """IP address of `container` on its first network."""
+
+    @abstractmethod
+    def running(self, container: str) -> bool:
+        """Whether `container` exists and is running."""
+
+    @abstractmethod
+    def put_archive(self, container: str, path: str, stream: BinaryIO) -> None:
+        """
+        Extract the tar `stream` into `path` of `container`, running or
+        not. The files belong to the user of the container.
+        """
+
+    @contextmanager
+    def stream(
+        self, container: str, cmd: list[str], stdin: BinaryIO | None = None
+    ) -> Iterator[BinaryIO]:
+        """
+        Run `cmd` in `container`, giving its output as a file to read from
+        while it runs. Raises DockerError if it fails.
+        """
+        read_fd, write_fd = os.pipe()
+        reader, writer = os.fdopen(read_fd, "rb"), os.fdopen(write_fd, "wb")
+        outcome: dicts = {}
+
+        def produce() -> None:
+            try:
+                with writer:
+                    outcome["result"] = self.exec(container, cmd, writer, stdin)
+            except Exception as exc:
+                outcome["error"] = exc
+
+        thread = Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            with reader:
+                yield reader
+                # Let the command end even if the output wasn't all read
+                while reader.read(256 * 1024):
+                    pass
+        except Exception:
+            # A failing command is the likely reason the output was bad.
+            # Errors writing it are not, the pipe was closed under them.
+            thread.join()
+            error = self.__failure(outcome)
+            if isinstance(error, DockerError):
+                raise error from None
+            raise
+        thread.join()
+        error = self.__failure(outcome)
+        if error is not None:
+            raise error
+
+    @staticmethod
+    def __failure(outcome: dicts) -> Exception | None:
+        if "error" in outcome:
+            return cast(Exception, outcome["error"])
+        code, stderr = outcome.get("result", (0, b""))
+        if code != 0:
+            return DockerError(
+                stderr.decode(errors="ignore").strip() or f"exit code {code}"
+            )
+        return None
+
+
+class CliRuntime(Runtime):
+    """Runtime running the docker CLI, one process per operation."""
+
+    def containers(self, project_dir: Path) -> list[str]:
+        result = run(
+            [
+                "docker",
+                "ps",
+                "-a",
+                "--filter",
+                f"label={WORKING_DIR_LABEL}={project_dir.absolute()}",
+                "--format",
+                "{{.Names}}",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return [line for line in result.stdout.splitlines() if line]
+
+    def start(self, names: list[str]) -> None:
+        run(["docker", "start", *names], capture_output=True, check=True)
+
+    def stop(self, names: list[str]) -> None:
+        run(["docker", "stop", *names], capture_output=True, check=True)
+
+    def exec(
+        self,
+        container: str,
+        cmd: list[str],
+        stdout: BinaryIO,
+        stdin: BinaryIO | None = None,
+    ) -> tuple[int, bytes]:
+        interactive = ["-i"] if stdin is not None else []
+        proc = Popen(
+            ["docker", "exec", *interactive, container, *cmd],
+            stdin=PIPE if stdin is not None else None,
+            stdout=PIPE,
+            stderr=PIPE,
+        )
+        # Drain stderr (and feed stdin) aside so neither pipe can fill up
+        # and block the output
+        stderr = bytearray()
+        threads = [
+            Thread(
+                target=lambda: stderr.extend(proc.stderr.read()),  # type: ignore
+                daemon=True,
+            )
+        ]
+        if stdin is not None:
+            threads.append(
+                Thread(target=feed, args=(stdin, proc.stdin), daemon=True)
+            )
+        for thread in threads:
+            thread.start()
+        try:
+            while chunk := proc.stdout.read(256 * 1024):  # type: ignore
+                stdout.write(chunk)
+        except BaseException:
+            proc.kill()
+            raise
+        for thread in threads:
+            thread.join()
+        return proc.wait(), bytes(stderr[: 64 * 1024])
+
+    def stats(self, names: list[str]) -> dict[str, dicts]:
+        result = run(
+            [
+                "docker",
+                "stats",
+                "--no-stream",
+                "--format",
+                "{{json .}}",
+                *names,
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        stats: dict[str, dicts] = {}
+        for line in result.stdout.splitlines():
+            item = json.loads(line)
+            used, _, limit = item.get("MemUsage", "").partition("/")
+            try:
+                memory, total = parse_size(used), parse_size(limit)
+            except ValueError:
+                # "-- / --" while the container starts or stops
+                memory = total = 0
+            stats[item["Name"]] = {
+                "cpu": float(item.get("CPUPerc", "0").rstrip("%") or 0),
+                "memory": memory,
+                "limit": total,
+            }
+        return stats
+
+    def address(self, container: str) -> str:
+        result = run(
+            [
+                "docker",
+                "inspect",
+                "--format",
+                "{{range .NetworkSettings.Networks}}{{.IPAddress}} {{end}}",
+                container,
+            ],
+            capture_output=True,
+            text=True,
+        )
+        addresses = result.stdout.split()
+        if result.returncode != 0 or not addresses:
+            raise DockerError(
+                result.stderr.strip() or f"{container} has no IP address"
+            )
+        return addresses[0]
+
+    def running(self, container: str) -> bool:
+        result = run(
+            ["docker", "inspect", "--format", "{{.State.Running}}", container],
+            capture_output=True,
+            text=True,
+        )
+        return result.returncode == 0 and result.stdout.strip() == "true"
+
+    def put_archive(self, container: str, path: str, stream: BinaryIO) -> None:
+        proc = Popen(
+            ["docker", "cp", "--archive", "-", f"{container}:{path}"],
+            stdin=PIPE,
+            stdout=DEVNULL,
+            stderr=PIPE,
+        )
+        output = bytearray()
+        thread = Thread(
+            target=lambda: output.extend(proc.stderr.read()),  # type: ignore
+            daemon=True,
+        )
+        thread.start()
+        try:
+            feed(stream, proc.stdin)
+        except BaseException:
+            proc.kill()
+            raise
+        thread.join()
+        if proc.wait() != 0:
+            raise DockerError(
+                output.decode(errors="ignore").strip()
+                or f"can't copy into {container}"
+            )
+
+
+class UnixConnection(http.client.HTTPConnection):
+    """HTTP connection over a unix socket."""
+
+    def __init__(self, path: str, timeout: float | None = None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class EngineRuntime(Runtime):
+    """
+    Runtime talking to the Docker Engine API over its unix socket. Requests
+    reuse a small pool of keep-alive connections, so a batch of operations
+    costs neither a process nor a handshake each.
+    """
+
+    api = True
+
+    def __init__(
+        self,
+        path: str = DEFAULT_SOCKET,
+        size: int = 4,
+        timeout: float | None = 300,
+    ) -> None:
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.opened = 0
+
+        self.__idle: list[UnixConnection] = []
+        self.__lock = Lock()
+
+    def containers(self, project_dir: Path) -> list[str]:
+        label = f"{WORKING_DIR_LABEL}={project_dir.absolute()}"
+        query = {"all": "1", "filters": json.dumps({"label": [label]})}
+        containers = self.request("GET", "/containers/json", query=query)
+        return [c["Names"][0].lstrip("/") for c in containers if c["Names"]]
+
+    def start(self, names: list[str]) -> None:
+        self.__each("start", names)
+
+    def stop(self, names: list[str]) -> None:
+        self.__each("stop", names)
+
+    def exec(
+        self,
+        container: str,
+        cmd: list[str],
+        stdout: BinaryIO,
+        stdin: BinaryIO | None = None,
+    ) -> tuple[int, bytes]:
+        created = self.request(
+            "POST",
+            f"/containers/{quote(container)}/exec",
+            {
+                "AttachStdin": stdin is not None,
+                "AttachStdout": True,
+                "AttachStderr": True,
+                "Tty": False,
+                "Cmd": cmd,
+            },
+        )
+        exec_id = created["Id"]
+
+        # The daemon hijacks the connection to stream the output, so it
+        # can't go back to the pool
+        conn = self.__connect()
+        stderr = bytearray()
+        try:
+            conn.request(
+                "POST",
+                f"/exec/{exec_id}/start",
+                json.dumps({"Detach": False, "Tty": False}),
+                {"Content-Type": "application/json"},
+            )
+            # getresponse() lets go of the socket of a closing response
+            sock = conn.sock
+            response = conn.getresponse()
+            if response.status >= 400:
+                raise DockerError(self.__message(response.read()))
+            if stdin is not None:
+                # Written on the raw socket while the output is read, then
+                # half-closed so the command sees the end of its input
+                Thread(target=feed, args=(stdin, sock), daemon=True).start()
+
+            # Multiplexed stream: 8 byte header (stream, 0, 0, 0, size)
+            while True:
+                header = response.read(8)
+                if len(header) < 8:
+                    break
+                stream, size = header[0], int.from_bytes(header[4:], "big")
+                while size:
+                    chunk = response.read(min(size, 256 * 1024))
+                    if not chunk:
+                        break
+                    size -= len(chunk)
+                    if stream == 2:
+                        stderr += chunk[: 64 * 1024 - len(stderr)]
+                    else:
+                        stdout.write(chunk)
+        finally:
+            conn.close()
+
+        inspect = self.request("GET", f"/exec/{exec_id}/json")
+        return int(inspect.get("ExitCode") or 0), bytes(stderr)
+
+    def stats(self, names: list[str]) -> dict[str, dicts]:
+        def one(name: str) -> dicts:
+            data = self.request(
+                "GET",
+                f"/containers/{quote(name)}/stats",
+                query={"stream": "false", "one-shot": "true"},
+            )
+            cpu, pre = data.get("cpu_stats", {}), data.get("precpu_stats", {})
+            cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - (
+                pre.get("cpu_usage", {}).get("total_usage", 0)
+            )
+            system_delta = cpu.get("system_cpu_usage", 0) - pre.get(
+                "system_cpu_usage", 0
+            )
+            cpus = cpu.get("online_cpus") or 1
+            memory = data.get("memory_stats", {})
+            return {
+                "cpu": (
+                    cpu_delta / system_delta * cpus * 100
+                    if system_delta > 0
+                    else 0.0
+                ),
+                "memory": memory.get("usage", 0)
+                - memory.get("stats", {}).get("inactive_file", 0),
+                "limit": memory.get("limit", 0),
+            }
+
+        with ThreadPoolExecutor(max_workers=self.size) as pool:
+            return dict(zip(names, pool.map(one, names)))
+
+    def address(self, container: str) -> str:
+        data = self.request("GET", f"/containers/{quote(container)}/json")
+        networks = data.get("NetworkSettings", {}).get("Networks") or {}
+        for network in networks.values():
+            if network.get("IPAddress"):
+                return str(network["IPAddress"])
+        raise DockerError(f"{container} has no IP address")
+
+    def running(self, container: str) -> bool:
+        try:
+            data = self.request("GET", f"/containers/{quote(container)}/json")
+        except DockerError:
+            return False
+        return bool(data.get("State", {}).get("Running"))
+
+    def put_archive(self, container: str, path: str, stream: BinaryIO) -> None:
+        query = urlencode({"path": path, "copyUIDGID": "1"})
+        url = f"/containers/{quote(container)}/archive?{query}"
+        with self.__connection() as conn:
+            conn.blocksize = 256 * 1024
+            # A file body without length goes out chunked
+            conn.request(
+                "PUT", url, stream, {"Content-Type": "application/x-tar"}
+            )
+            response = conn.getresponse()
+            data = response.read()
+            if response.will_close:
+                conn.close()
+        if response.status >= 400:
+            raise DockerError(self.__message(data))
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Any = None,
+        query: dict[str, str] | None = None,
+    ) -> Any:
+        """
+        Send a request through a pooled connection and return its decoded
+        JSON body (None if empty). Raises DockerError on error statuses.
+        """
+        url = f"{path}?{urlencode(query)}" if query else path
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload else {}
+
+        # A pooled connection may have been closed by the daemon meanwhile
+        for attempt in range(2):
+            with self.__connection() as conn:
+                try:
+                    conn.request(method, url, payload, headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except (http.client.RemoteDisconnected, ConnectionError):
+                    conn.close()
+                    if attempt:
+                        raise
+                    continue
+                if response.will_close:
+                    conn.close()
+                break
+
+        if response.status >= 400:
+            raise DockerError(self.__message(data))
+        return json.loads(data) if data else None
+
+    def close(self) -> None:
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+        for conn in idle:
+            conn.close()
+
+    @contextmanager
+    def __connection(self) -> Iterator[UnixConnection]:
+        with self.__lock:
+            conn = self.__idle.pop() if self.__idle else None
+        if conn is None:
+            conn = self.__connect()
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        if conn.sock is not None:
+            with self.__lock:
+                if len(self.__idle) < self.size:
+                    self.__idle.append(conn)
+                    return
+            conn.close()
+
+    def __connect(self) -> UnixConnection:
+        with self.__lock:
+            self.opened += 1
+        return UnixConnection(self.path, timeout=self.timeout)
+
+    def __each(self, action: str, names: list[str]) -> None:
+        def one(name: str) -> None:
+            self.request("POST", f"/containers/{quote(name)}/{action}")
+
+        with ThreadPoolExecutor(max_workers=self.size) as pool:
+            list(pool.map(one, names))
+
+    @staticmethod
+    def __message(data: bytes) -> str:
+        try:
+            return str(json.loads(data).get("message"))
+        except Exception:
+            return data.decode(errors="ignore")
+
+
+def feed(source: BinaryIO, target: Any) -> None:
+    """
+    Copy `source` into a pipe or socket, then close its writing side. A
+    command that exits early (closing its input) just ends the copy.
+    """
+    try:
+        while chunk := source.read(256 * 1024):
+            if isinstance(target, socket.socket):
+                target.sendall(chunk)
+            else:
+                target.write(chunk)
+    except ConnectionError:
+        pass
+    finally:
+        try:
+            if isinstance(target, socket.socket):
+                target.shutdown(socket.SHUT_WR)
+            else:
+                target.close()
+        except OSError:
+            pass
+
+
+def socket_path() -> str | None:
+    """Unix socket of the daemon (`$DOCKER_HOST` or the default one)."""
+    host = os.environ.get("DOCKER_HOST")
+    if host:
+        return host[len("unix://") :] if host.startswith("unix://") else None
+    return DEFAULT_SOCKET if os.path.exists(DEFAULT_SOCKET) else None
+
+
+def runtime() -> Runtime:
+    """
+    Runtime chosen by `$MCDOCKER_RUNTIME` (`engine`, `cli` or `auto`). The
+    default uses the Engine API when its socket is usable, the CLI
+    otherwise.
+    """
+    choice = os.environ.get("MCDOCKER_RUNTIME", "auto").lower()
+    if choice == "cli":
+        return CliRuntime()
+    path = socket_path()
+    if choice == "engine" or (path and os.access(path, os.R_OK | os.W_OK)):
+        return EngineRuntime(path or DEFAULT_SOCKET)
+    return CliRuntime()
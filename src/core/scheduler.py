@@ -0,0 +1,239 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from random import Random
+import re
+from threading import Event
+from time import localtime, strftime, time
+from typing import TYPE_CHECKING, Any, Callable
+
+from ..utils.lock import FileLock, LockedError
+from .backup import BackupError, BackupResult, stamp_time
+from .rcon import Rcon, RconError
+from .repository import RepositoryError
+
+if TYPE_CHECKING:
+    from .backup import BackupManager
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+# Key of the database in the intervals of a schedule
+DATABASE = "database"
+# Held by the scheduler of the project while it runs
+SCHEDULE_LOCK = "schedule.lock"
+
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+DURATION = re.compile(r"(\d+(?:\.\d+)?)([smhdw])")
+# Reply of `list`: "There are 2 of a max of 20 players online: ..." on
+# vanilla, "There are 2 out of maximum 20 players online." on Paper
+PLAYERS = re.compile(r"There are (\d+)")
+
+
+def parse_duration(text: str) -> float:
+    """Seconds of a duration such as `90`, `30m`, `6h` or `1h30m`."""
+    text = text.strip().lower()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = DURATION.findall(text)
+    if not parts or "".join(n + u for n, u in parts) != text:
+        raise ValueError(f"Invalid duration {text}")
+    return sum(float(number) * UNITS[unit] for number, unit in parts)
+
+
+class Scheduler:
+    """
+    Scheduler class. In charge of backing up the servers of a project
+    every `every` seconds, or their own interval in `intervals` (the
+    database under `database`), until stopped.
+
+    The due time of each server is pushed back by up to `jitter` times its
+    interval, so servers sharing an interval don't all hit the disk at the
+    same instant. Servers that are stopped, or that had no players online
+    since their previous snapshot, are skipped: their world hasn't
+    changed. Players are counted with `list` through RCON every `tick`
+    seconds; a server without RCON is always backed up.
+    """
+
+    tick: float = 60.0
+
+    def __init__(
+        self,
+        manager: BackupManager,
+        servers: list[str],
+        every: float,
+        intervals: dict[str, float] | None = None,
+        jitter: float = 0.1,
+        database: dicts | None = None,
+        prune: bool = True,
+        clock: Callable[[], float] = time,
+        log: Callable[[str], None] = print,
+    ) -> None:
+        self.manager = manager
+        self.servers = servers
+        self.every = every
+        self.intervals = intervals or {}
+        self.jitter = jitter
+        self.database = database
+        self.prune = prune
+        self.clock = clock
+        self.log = log
+        self.random = Random()
+
+        # Next backup of each server (and the database), by name
+        self.due: dict[str, float] = {}
+        # Whether players were online since the last snapshot of a server,
+        # None when unknown
+        self.active: dict[str, bool | None] = {}
+        self.__rcon: dict[str, Rcon | None] = {}
+
+    @property
+    def names(self) -> list[str]:
+        return self.servers + ([DATABASE] if self.database else [])
+
+    def interval(self, name: str) -> float:
+        return self.intervals.get(name, self.every)
+
+    def start(self) -> None:
+        """Plan the first backups, an interval after the latest ones."""
+        now = self.clock()
+        latest: dict[str, float] = {}
+        for info in self.manager.repository.catalog():
+            latest[info.server] = info.time
+        dumps = self.manager.dumps()
+        if dumps:
+            latest[DATABASE] = stamp_time(
+                dumps[-1].stem.removeprefix("database_")
+            )
+
+        for name in self.names:
+            previous = latest.get(name)
+            due = now if previous is None else previous + self.interval(name)
+            self.due[name] = max(now, due) + self.__jitter(name)
+            self.active.setdefault(name, None)
+
+    def step(self) -> list[str]:
+        """
+        Count the players of the servers and back up the ones due. Returns
+        the names backed up.
+        """
+        if not self.due:
+            self.start()
+        now = self.clock()
+        running = {name: self.__running(name) for name in self.names}
+        for name in self.servers:
+            if running[name]:
+                self.__poll(name)
+
+        due = [name for name in self.names if self.due[name] <= now]
+        chosen: list[str] = []
+        for name in due:
+            if not running[name]:
+                self.__skip(name, now, "stopped")
+            elif self.active.get(name) is False:
+                self.__skip(name, now, "no players since the last backup")
+            else:
+                chosen.append(name)
+        if not chosen:
+            return []
+
+        servers = [name for name in chosen if name != DATABASE]
+        database = self.database if DATABASE in chosen else None
+        self.log(f"{self.__now()} Backing up {', '.join(chosen)}")
+        results: list[BackupResult] = []
+        try:
+            results = self.manager.run(servers, database, self.prune)
+        except BackupError as exc:
+            # Another backup holds the lock, try again on the next tick
+            self.log(f"{self.__now()} Backup postponed: {exc}")
+            return []
+        except (OSError, RepositoryError) as exc:
+            self.log(f"{self.__now()} Backup failed: {exc}")
+
+        finished = self.clock()
+        for name in chosen:
+            self.due[name] = (
+                finished + self.interval(name) + self.__jitter(name)
+            )
+        for result in results:
+            if result.ok and result.snapshot is not None:
+                # Players online right now show up on the next poll
+                self.active[result.name] = (
+                    False if self.__rcon.get(result.name) else None
+                )
+        return chosen
+
+    def run_forever(self, stop: Event | None = None) -> None:
+        """
+        Run `step` until `stop` is set, waking up on every tick and when a
+        backup is due. Raises BackupError if another scheduler is running.
+        """
+        stop = stop or Event()
+        lock = FileLock(self.manager.path.joinpath(SCHEDULE_LOCK))
+        try:
+            lock.acquire()
+        except LockedError:
+            raise BackupError("Another scheduler is running.") from None
+        try:
+            self.start()
+            for name in self.names:
+                self.log(
+                    f"{name}: every {self.interval(name) / 60:.0f} minutes, "
+                    f"next backup at {self.__now(self.due[name])}"
+                )
+            while not stop.is_set():
+                self.step()
+                wait = (
+                    min(self.due.values(), default=self.clock()) - self.clock()
+                )
+                stop.wait(max(1.0, min(self.tick, wait)))
+        finally:
+            lock.release()
+
+    def __running(self, name: str) -> bool:
+        container = (
+            self.manager.db_container(self.database or {})
+            if name == DATABASE
+            else name
+        )
+        try:
+            return self.manager.runtime.running(container)
+        except Exception:
+            return False
+
+    def __poll(self, name: str) -> None:
+        """Note whether server `name` has players online."""
+        try:
+            if name not in self.__rcon:
+                self.__rcon[name] = self.manager.rcon(name)
+            rcon = self.__rcon[name]
+            if rcon is None:
+                return
+            with rcon:
+                match = PLAYERS.search(rcon.command("list"))
+        except Exception:
+            # Its address or password may have changed, read them again.
+            # Until then, nothing tells its world didn't change.
+            self.__rcon.pop(name, None)
+            self.active[name] = None
+            return
+        if match and int(match.group(1)):
+            self.active[name] = True
+
+    def __skip(self, name: str, now: float, reason: str) -> None:
+        self.log(f"{self.__now()} Skipped {name}: {reason}")
+        self.due[name] = now + self.interval(name) + self.__jitter(name)
+
+    def __jitter(self, name: str) -> float:
+        return self.random.uniform(0, self.jitter * self.interval(name))
+
+    def __now(self, moment: float | None = None) -> str:
+        return strftime(
+            "[%Y-%m-%d %H:%M:%S]", localtime(moment or self.clock())
+        )
@@ -0,0 +1,133 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from copy import deepcopy
+import json
+from pathlib import Path
+from typing import Any
+
+from .model import Project
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+
+class ProjectState:
+    """
+    Project state class. Parsed `data.json` shared by every group and manager
+    of the process, only re-parsed when the file changes.
+    """
+
+    __states: dict[Path, ProjectState] = {}
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.__signature: tuple[int, int] | None = None
+        self.__data: dicts = {}
+        self.__views: dict[str, dict[str, dicts]] = {}
+        self.__project: Project | None = None
+
+    @classmethod
+    def load(cls, path: Path) -> ProjectState:
+        """
+        Return the state for `path`, re-parsing it if its mtime or size changed.
+        """
+        path = path.absolute()
+        state = cls.__states.get(path)
+        if state is None:
+            state = cls.__states[path] = cls(path)
+        state.refresh()
+        return state
+
+    @classmethod
+    def forget(cls, path: Path) -> None:
+        """Drop the cached state of `path` (used after writing it)."""
+        cls.__states.pop(path.absolute(), None)
+
+    def refresh(self) -> None:
+        try:
+            stat = self.path.stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+
+        if signature is not None and signature == self.__signature:
+            return
+
+        self.__signature = signature
+        self.__views = {}
+        self.__project = None
+        self.__data = {}
+        if signature is None:
+            return
+        try:
+            data = json.loads(self.path.read_bytes())
+            self.__data = data if isinstance(data, dict) else {}
+        except Exception:
+            self.__data = {}
+
+    @property
+    def exists(self) -> bool:
+        return self.__signature is not None
+
+    @property
+    def data(self) -> dicts:
+        """Shared parsed data. Do not mutate it, use `copy()` instead."""
+        return self.__data
+
+    def copy(self) -> dicts:
+        """Return a private deep copy of the data, safe to mutate."""
+        return deepcopy(self.__data)
+
+    @property
+    def project(self) -> Project:
+        """
+        Validated model of the data, built once per change of the file.
+        Shared like `data`, edit a `Project.from_dict(copy())` instead.
+        Raises ModelError if the data is invalid.
+        """
+        if self.__project is None:
+            self.__project = Project.from_dict(self.__data)
+        return self.__project
+
+    @property
+    def compose(self) -> dicts:
+        return self.__data.get("compose", {}) or {}
+
+    @property
+    def database(self) -> dict[str, str]:
+        return self.compose.get("database", {}) or {}
+
+    @property
+    def servers(self) -> dict[str, dicts]:
+        """Compose servers by `name`."""
+        return self.__view("servers", self.compose.get("servers"), "name")
+
+    @property
+    def envs(self) -> dict[str, dicts]:
+        """Env files by `CONTAINER_NAME`."""
+        return self.__view("envs", self.__data.get("envs"), "CONTAINER_NAME")
+
+    @property
+    def server_files(self) -> dict[str, dicts]:
+        """Server files by `name`."""
+        return self.__view(
+            "server_files", self.__data.get("server_files"), "name"
+        )
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.servers)
+
+    def __view(self, view: str, items: Any, key: str) -> dict[str, dicts]:
+        if view not in self.__views:
+            self.__views[view] = {
+                item[key]: item
+                for item in items or []
+                if isinstance(item, dict) and isinstance(item.get(key), str)
+            }
+        return self.__views[view]
@@ -0,0 +1,98 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Callable, Iterable
+
+from importlib_resources import files  # type: ignore
+
+from .cache import cache_dir
+
+if TYPE_CHECKING:
+    import jinja2
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+
+class TemplateEngine:
+    """
+    Template engine class. In charge of compiling the templates of a
+    directory once per process (and, through a bytecode cache on disk,
+    once across runs) and rendering them.
+    """
+
+    def __init__(self, root: Any, bytecode_cache: Path | None = None) -> None:
+        # Any Traversable: a Path or a package resource directory
+        self.root = root
+        self.bytecode_cache = bytecode_cache
+
+        self.__env: jinja2.Environment | None = None
+        self.__sources: dict[str, bytes] = {}
+        self.__lock = Lock()
+
+    @property
+    def env(self) -> jinja2.Environment:
+        with self.__lock:
+            if self.__env is None:
+                self.__env = self.__environment()
+            return self.__env
+
+    def source(self, name: str) -> bytes:
+        """Raw bytes of a template, read once."""
+        if name not in self.__sources:
+            self.__sources[name] = self.root.joinpath(name).read_bytes()
+        return self.__sources[name]
+
+    def reload(self) -> None:
+        """Forget compiled templates and sources (after editing them)."""
+        with self.__lock:
+            self.__env = None
+            self.__sources = {}
+
+    def render(self, name: str, context: dicts) -> str:
+        return self.env.get_template(name).render(**context)
+
+    def render_many(self, name: str, contexts: Iterable[dicts]) -> list[str]:
+        """Render one template for every context in a single pass."""
+        template = self.env.get_template(name)
+        return [template.render(**context) for context in contexts]
+
+    def __environment(self) -> jinja2.Environment:
+        import jinja2
+
+        bcc = None
+        if self.bytecode_cache is not None:
+            self.bytecode_cache.mkdir(parents=True, exist_ok=True)
+            bcc = jinja2.FileSystemBytecodeCache(str(self.bytecode_cache))
+
+        return jinja2.Environment(
+            loader=jinja2.FunctionLoader(self.__load),
+            bytecode_cache=bcc,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            auto_reload=False,
+        )
+
+    def __load(self, name: str) -> tuple[str, str, Callable[[], bool]]:
+        source = self.source(name).decode("utf-8")
+        return source, str(self.root.joinpath(name)), lambda: True
+
+
+ENGINES: dict[str, TemplateEngine] = {}
+
+
+def engine(root: Any = None) -> TemplateEngine:
+    """
+    Shared engine of a template directory, the bundled templates if None.
+    """
+    root = root if root is not None else files("src.assets.templates")
+    key = str(root)
+    if key not in ENGINES:
+        ENGINES[key] = TemplateEngine(root, cache_dir("templates"))
+    return ENGINES[key]
@@ -0,0 +1,167 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+from types import TracebackType
+from typing import TYPE_CHECKING, Any, Callable
+
+if TYPE_CHECKING:
+    from .runtime import Runtime
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+# Commands run through it get the lowest CPU priority and, where ionice
+# exists, the idle I/O class: they only use the disk when nothing else does.
+# The cgroup io.max limit (BlkioDeviceReadBps through the Engine API) isn't
+# used on purpose: it applies to the whole container, so it would cap the
+# reads of the server as well as those of the backup exec
+NICE_SCRIPT = (
+    "if command -v ionice >/dev/null 2>&1; then "
+    'exec nice -n 19 ionice -c 3 "$@"; fi; '
+    'exec nice -n 19 "$@"'
+)
+
+
+def niced(cmd: list[str]) -> list[str]:
+    """`cmd` run with the lowest CPU and I/O priority."""
+    return ["sh", "-c", NICE_SCRIPT, "nice", *cmd]
+
+
+class Throttle:
+    """
+    Throttle class. In charge of a token bucket shared by the streams of a
+    backup, capping their total throughput to `rate` bytes per second
+    (None for no cap). The rate can be lowered for a while with
+    `slow_down` and raised back with `speed_up`, down to `floor`.
+    """
+
+    def __init__(self, rate: float | None = None, floor: float = 1024**2):
+        self.rate = rate
+        self.floor = floor
+        # Rate now in force, None while unlimited
+        self.current = rate
+
+        self.__lock = Lock()
+        self.__allowance = 0.0
+        self.__last = monotonic()
+        self.__moved = 0
+        self.__sampled = monotonic()
+        self.__peak = 0.0
+
+    def take(self, size: int) -> None:
+        """Account for `size` bytes, sleeping as long as the rate requires."""
+        with self.__lock:
+            self.__moved += size
+            if self.current is None:
+                return
+            now = monotonic()
+            # Bursts of up to a second's worth
+            self.__allowance = min(
+                self.current,
+                self.__allowance + (now - self.__last) * self.current,
+            )
+            self.__last = now
+            self.__allowance -= size
+            wait = -self.__allowance / self.current
+        if wait > 0:
+            sleep(wait)
+
+    def sample(self) -> float:
+        """Throughput since the previous sample, in bytes per second."""
+        with self.__lock:
+            now = monotonic()
+            rate = self.__moved / max(now - self.__sampled, 1e-9)
+            self.__moved, self.__sampled = 0, now
+            if self.current is None:
+                self.__peak = max(self.__peak, rate)
+            return rate
+
+    def slow_down(self, measured: float) -> None:
+        """Halve the rate, from the one `measured` if unlimited."""
+        with self.__lock:
+            if self.current is None:
+                self.__peak = max(self.__peak, measured)
+            current = self.current if self.current is not None else measured
+            self.current = max(self.floor, current / 2)
+
+    def speed_up(self) -> None:
+        """Raise the rate by half, back to the cap (or to unlimited)."""
+        with self.__lock:
+            if self.current is None:
+                return
+            self.current *= 1.5
+            ceiling = self.rate or self.__peak
+            if self.current >= ceiling:
+                self.current = self.rate
+
+
+class CpuGuard:
+    """
+    CPU guard class. In charge of watching the CPU of the servers while
+    they are backed up: every `interval` seconds, the throttle slows down
+    if one of them is above `threshold` percent (as `docker stats` shows
+    it) and speeds up again once they all are below.
+    """
+
+    interval: float = 2.0
+
+    def __init__(
+        self,
+        runtime: Runtime,
+        names: list[str],
+        throttle: Throttle,
+        threshold: float,
+        log: Callable[[str], None] = print,
+    ) -> None:
+        self.runtime = runtime
+        self.names = names
+        self.throttle = throttle
+        self.threshold = threshold
+        self.log = log
+        self.backoffs = 0
+
+        self.__stop = Event()
+        self.__thread = Thread(target=self.__watch, daemon=True)
+
+    def __enter__(self) -> CpuGuard:
+        self.__thread.start()
+        return self
+
+    def __exit__(
+        self,
+        kind: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.__stop.set()
+        self.__thread.join()
+
+    def __watch(self) -> None:
+        slowed = False
+        while not self.__stop.wait(self.interval):
+            measured = self.throttle.sample()
+            try:
+                stats = self.runtime.stats(self.names)
+            except Exception:
+                continue
+            busy = max((item["cpu"] for item in stats.values()), default=0.0)
+            if busy > self.threshold:
+                self.throttle.slow_down(measured)
+                self.backoffs += 1
+                if not slowed:
+                    self.log(
+                        f"Servers busy ({busy:.0f}% CPU), slowing backups "
+                        f"down to {self.throttle.current / 1024**2:.1f} MB/s"  # type: ignore
+                    )
+                slowed = True
+            else:
+                self.throttle.speed_up()
+                if slowed and self.throttle.current == self.throttle.rate:
+                    self.log("Servers calm, backups back to full speed")
+                    slowed = False
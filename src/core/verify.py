@@ -0,0 +1,139 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+import hashlib
+import json
+import os
+from pathlib import Path
+import tarfile
+from typing import Any, BinaryIO
+
+#################################################
+# CODE
+#################################################
+dicts = dict[str, Any]
+
+# What `backup verify` found intact, in `.backup`
+VERIFIED = "verified.json"
+
+
+def file_stamp(path: Path) -> list[int]:
+    """Size and mtime of `path`: a file is re-read once they change."""
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def manifest_path(dump: Path) -> Path:
+    return dump.with_suffix(".json")
+
+
+def write_manifest(dump: Path, size: int, digest: str, elapsed: float) -> None:
+    """Record the size, sha256 and duration of database `dump` next to it."""
+    manifest = {"size": size, "sha256": digest, "elapsed": elapsed}
+    manifest_path(dump).write_text(json.dumps(manifest))
+
+
+def read_manifest(dump: Path) -> dicts | None:
+    """Manifest of database `dump`, None if it has none."""
+    try:
+        manifest = json.loads(manifest_path(dump).read_text())
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) else None
+
+
+def check_dump(dump: Path) -> int:
+    """
+    Read database `dump` and check it against its manifest, and that it
+    is a pg_dump archive: a custom format file (`.sql`) or the tar of a
+    directory dump (`.tar`). Returns its size, raises ValueError if not.
+    """
+    manifest = read_manifest(dump)
+    hasher = hashlib.sha256()
+    size = 0
+    with open(dump, "rb") as f:
+        while data := f.read(1024 * 1024):
+            hasher.update(data)
+            size += len(data)
+        f.seek(0)
+        if dump.suffix == ".tar":
+            header = toc(f)
+        else:
+            header = f.read(5)
+    if header != b"PGDMP":
+        raise ValueError("not a pg_dump archive.")
+    if manifest is None:
+        return size
+    if size != manifest.get("size"):
+        raise ValueError(f"{size} bytes instead of {manifest.get('size')}.")
+    if hasher.hexdigest() != manifest.get("sha256"):
+        raise ValueError("content doesn't match its hash.")
+    return size
+
+
+def toc(file: BinaryIO) -> bytes:
+    """Start of the table of contents of the directory dump tar `file`."""
+    try:
+        with tarfile.open(fileobj=file, mode="r:") as tar:
+            for member in tar:
+                if member.name.removeprefix("./") == "toc.dat":
+                    return tar.extractfile(member).read(5)  # type: ignore
+    except tarfile.TarError:
+        pass
+    return b""
+
+
+@dataclass(slots=True)
+class VerifyCache:
+    """
+    What the previous verifications found intact: packs and dumps by
+    their size and mtime, and snapshots by `server/id`.
+    """
+
+    packs: dict[str, list[int]] = field(default_factory=dict)
+    snapshots: list[str] = field(default_factory=list)
+    dumps: dict[str, list[int]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> VerifyCache:
+        """Cache saved in `path`, empty if missing or unusable."""
+        try:
+            return cls(**json.loads(path.read_text()))
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+    def save(self, path: Path) -> None:
+        temp = path.with_suffix(".tmp")
+        temp.write_text(json.dumps(asdict(self), separators=(",", ":")))
+        os.replace(temp, path)
+
+
+@dataclass(slots=True)
+class VerifyResult:
+    """What a verification read, skipped and found damaged."""
+
+    packs: int = 0
+    files: int = 0
+    dumps: int = 0
+    # Bytes read, and packs, snapshots and dumps left alone as unchanged
+    size: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def status(self) -> str:
+        rate = self.size / self.elapsed if self.elapsed > 0 else 0.0
+        return (
+            f"Checked {self.packs} packs, {self.files} files and "
+            f"{self.dumps} database dumps ({self.size / 1024**2:.1f} MB in "
+            f"{self.elapsed:.1f}s, {rate / 1024**2:.1f} MB/s), "
+            f"{self.skipped} unchanged since the last check: "
+            + ("no errors." if self.ok else f"{len(self.errors)} errors.")
+        )
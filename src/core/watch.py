@@ -0,0 +1,207 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+import ctypes
+import ctypes.util
+import os
+from pathlib import Path
+import select
+import struct
+from time import monotonic, sleep
+from typing import Any, Iterable
+
+#################################################
+# CODE
+#################################################
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+
+EVENT = struct.Struct("iIII")
+
+
+class Watcher(ABC):
+    """
+    Base watcher class. In charge of waiting for changes on a set of files
+    and directories (any file directly inside them), coalescing bursts of
+    writes into a single batch.
+    """
+
+    def __init__(self, paths: Iterable[Path], debounce: float = 0.3) -> None:
+        self.paths = {p.absolute() for p in paths}
+        self.debounce = debounce
+
+    def wait(self, timeout: float | None = None) -> set[Path]:
+        """
+        Block until a watched path changes, then until writes settle for
+        `debounce` seconds. Returns the changed paths, empty on timeout.
+        """
+        changed = self.poll(timeout)
+        if not changed:
+            return set()
+        while True:
+            more = self.poll(self.debounce)
+            if not more:
+                return changed
+            changed |= more
+
+    @abstractmethod
+    def poll(self, timeout: float | None) -> set[Path]:
+        """Changed paths within `timeout` seconds, empty if none."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Release what the watcher holds, such as file descriptors."""
+
+    def watched(self, path: Path) -> bool:
+        return path in self.paths or path.parent in self.paths
+
+    def __enter__(self) -> Watcher:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class InotifyWatcher(Watcher):
+    """
+    Linux watcher on inotify. Watches the parent directories (editors often
+    replace files instead of writing them) and sleeps in `select` between
+    events. Raises OSError if inotify is unavailable.
+    """
+
+    mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, paths: Iterable[Path], debounce: float = 0.3) -> None:
+        super().__init__(paths, debounce)
+
+        name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+
+        self.fd: int = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.dirs: dict[int, Path] = {}
+        try:
+            for path in self.paths:
+                folder = path if path.is_dir() else path.parent
+                if folder in self.dirs.values():
+                    continue
+                wd = libc.inotify_add_watch(
+                    self.fd, os.fsencode(folder), self.mask
+                )
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f"can't watch {folder}")
+                self.dirs[wd] = folder
+        except OSError:
+            self.close()
+            raise
+
+    def poll(self, timeout: float | None) -> set[Path]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed: set[Path] = set()
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, report everything
+                changed |= self.paths
+                continue
+            folder = self.dirs.get(wd)
+            if folder is None or not name:
+                continue
+            path = folder.joinpath(os.fsdecode(name))
+            if self.watched(path):
+                changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher(Watcher):
+    """Portable watcher comparing mtimes and sizes every `interval` seconds."""
+
+    def __init__(
+        self,
+        paths: Iterable[Path],
+        debounce: float = 0.3,
+        interval: float = 1.0,
+    ) -> None:
+        super().__init__(paths, debounce)
+        self.interval = interval
+        self.snapshot = self.__scan()
+
+    def poll(self, timeout: float | None) -> set[Path]:
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                return set()
+            sleep(
+                self.interval
+                if remaining is None
+                else min(self.interval, remaining)
+            )
+
+            snapshot = self.__scan()
+            changed = {
+                path
+                for path in snapshot.keys() | self.snapshot.keys()
+                if snapshot.get(path) != self.snapshot.get(path)
+            }
+            self.snapshot = snapshot
+            if changed:
+                return changed
+
+    def close(self) -> None:
+        self.snapshot = {}
+
+    def __scan(self) -> dict[Path, tuple[int, int]]:
+        files: list[Path] = []
+        for path in self.paths:
+            if path.is_dir():
+                files.extend(p for p in path.iterdir() if p.is_file())
+            else:
+                files.append(path)
+
+        snapshot: dict[Path, tuple[int, int]] = {}
+        for path in files:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+
+def watcher(paths: Iterable[Path], debounce: float = 0.3) -> Watcher:
+    """Inotify watcher where available, polling otherwise."""
+    paths = list(paths)
+    try:
+        return InotifyWatcher(paths, debounce)
+    except (OSError, AttributeError):
+        return PollingWatcher(paths, debounce)
@@ -4,16 +4,16 @@
 from __future__ import annotations
 
 from os import name, system
+import sys
 from time import sleep
 
-from InquirerPy import inquirer  # type: ignore
-
 #################################################
 # CODE
 #################################################
 # Global flags controlled by the CLI
 VERBOSE = False
 NO_CONFIRM = False
+FAST = False
 
 
 def set_verbose(v: bool) -> None:
@@ -28,13 +28,35 @@ def set_no_confirm(v: bool) -> None:
     NO_CONFIRM = bool(v)  # type: ignore
 
 
+def set_fast(v: bool) -> None:
+    """Enable or disable fast mode (no UI pacing delays)."""
+    global FAST
+    FAST = bool(v)  # type: ignore
+
+
+def pacing() -> bool:
+    """
+    Whether UI pacing delays apply. They are skipped in fast, verbose and
+    no-confirm modes, and when the output is not a terminal.
+    """
+    if FAST or VERBOSE or NO_CONFIRM:
+        return False
+    return sys.stdout.isatty()
+
+
+def pace(t: float) -> None:
+    """Sleep t seconds so the user can read the screen, if pacing applies."""
+    if t > 0 and pacing():
+        sleep(t)
+
+
 def clear(t: float) -> None:
     """
     Sleep t seconds and clear the console, unless verbose mode is enabled.
     """
     if VERBOSE:
         return
-    sleep(t)
+    pace(t)
     system("cls" if name == "nt" else "clear")
 
 
@@ -47,6 +69,10 @@ def confirm(msg: str, default: bool = True) -> bool:
     """
     if NO_CONFIRM:
         return True
+
+    # Imported here so commands that never prompt skip loading InquirerPy
+    from InquirerPy import inquirer  # type: ignore
+
     return inquirer.confirm(  # type: ignore
         message=msg, default=default
     ).execute()
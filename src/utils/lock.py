@@ -0,0 +1,68 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from types import TracebackType
+
+#################################################
+# CODE
+#################################################
+
+
+class LockedError(Exception):
+    """Raised when another process holds a lock."""
+
+
+class FileLock:
+    """
+    Advisory lock on a file, held by one process at a time. The system
+    releases it if the process dies, so a crash never leaves it stale.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.__fd: int | None = None
+
+    def __enter__(self) -> FileLock:
+        self.acquire()
+        return self
+
+    def __exit__(
+        self,
+        kind: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.release()
+
+    def acquire(self) -> None:
+        """Take the lock, or raise LockedError right away if taken."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self.__lock(fd)
+        except OSError:
+            os.close(fd)
+            raise LockedError(f"{self.path} is locked") from None
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.__fd = fd
+
+    def release(self) -> None:
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    @staticmethod
+    def __lock(fd: int) -> None:
+        try:
+            import fcntl
+
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except ImportError:
+            import msvcrt  # type: ignore
+
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)  # type: ignore
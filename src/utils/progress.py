@@ -0,0 +1,77 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+import sys
+from threading import Lock
+from time import perf_counter
+
+
+#################################################
+# CODE
+#################################################
+class Progress:
+    """
+    Aggregate progress of several concurrent transfers. Workers report the
+    bytes they move with `advance` and a single status line (items done,
+    bytes and throughput) is refreshed on interactive terminals.
+    """
+
+    def __init__(self, label: str, items: int = 0, interval: float = 0.5):
+        self.label = label
+        self.items = items
+        self.interval = interval
+
+        self.done = 0
+        self.bytes = 0
+        self.start = perf_counter()
+        self.__shown = 0.0
+        self.__lock = Lock()
+        self.__tty = sys.stdout.isatty()
+
+    @property
+    def elapsed(self) -> float:
+        return perf_counter() - self.start
+
+    @property
+    def rate(self) -> float:
+        """Throughput in bytes per second."""
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def advance(self, nbytes: int) -> None:
+        with self.__lock:
+            self.bytes += nbytes
+            self.__show()
+
+    def item_done(self) -> None:
+        with self.__lock:
+            self.done += 1
+            self.__show(force=True)
+
+    def log(self, message: str) -> None:
+        """Print a line above the status line."""
+        with self.__lock:
+            clear = "\r\033[K" if self.__tty else ""
+            print(f"{clear}{message}", flush=True)
+            self.__show(force=True)
+
+    def summary(self) -> str:
+        items = f"{self.done}/{self.items}" if self.items else str(self.done)
+        return (
+            f"{self.label}: {items} done, {self.bytes / 1024**2:.1f} MB "
+            f"in {self.elapsed:.1f}s ({self.rate / 1024**2:.1f} MB/s)"
+        )
+
+    def finish(self) -> None:
+        """Replace the status line with the final summary."""
+        with self.__lock:
+            end = "\r" if self.__tty else ""
+            print(f"{end}{self.summary()}", flush=True)
+
+    def __show(self, force: bool = False) -> None:
+        now = perf_counter()
+        if not self.__tty or (not force and now - self.__shown < self.interval):
+            return
+        self.__shown = now
+        print(f"\r{self.summary()}", end="", flush=True)
@@ -0,0 +1,24 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+import re
+
+#################################################
+# CODE
+#################################################
+SIZE = re.compile(r"(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?", re.IGNORECASE)
+
+
+def parse_size(text: str) -> int:
+    """
+    Bytes of a size such as `512M`, `20MB`, `1.5GiB` or `4096`. Units are
+    binary (K = 1024 bytes) with or without the `i`, as docker prints
+    memory, and case insensitive. Raises ValueError if `text` isn't one.
+    """
+    match = SIZE.fullmatch(text.strip())
+    if not match:
+        raise ValueError(f"Invalid size {text}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMGT".index(unit.upper() or " "))
@@ -0,0 +1,40 @@
+#################################################
+# IMPORTS
+#################################################
+from __future__ import annotations
+
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Iterator
+
+#################################################
+# CODE
+#################################################
+# Per-phase wall times recorded during the current command
+TIMINGS: list[tuple[str, float]] = []
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Record the wall time spent inside the block under `name`."""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        TIMINGS.append((name, perf_counter() - start))
+
+
+def report() -> None:
+    """Print the recorded phases, aggregated by name, and reset them."""
+    if not TIMINGS:
+        return
+
+    totals: dict[str, list[float]] = {}
+    for name, elapsed in TIMINGS:
+        totals.setdefault(name, []).append(elapsed)
+    TIMINGS.clear()
+
+    print("\nTimings:")
+    for name, times in totals.items():
+        count = f" (x{len(times)})" if len(times) > 1 else ""
+        print(f"  {name}{count}: {sum(times) * 1000:.1f} ms")
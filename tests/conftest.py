@@ -10,44 +10,15 @@ import pytest  # type: ignore
 @pytest.fixture()
 def isolate_cwd(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
     """Redirect CLI file operations to a temporary directory."""
-    # Ensure core classes write into tmp_path instead of real cwd
-    # Try to obtain the runtime instances created at import time and
-    # patch their underlying classes so existing instances use tmp_path.
+    # The command groups are built lazily, on each invocation, so patching
+    # the classes is enough for their instances to use tmp_path
+    import src.cli.custom_group as _cg
+    import src.core.docker as _docker
+    import src.core.files as _files
 
-    try:
-        import src as _src
-    except Exception:
-        _src = importlib.import_module("src")
-
-    # builder instance is created in src.__main__ and exported on package
-    builder_inst = getattr(_src, "builder", None)
-    if builder_inst is None:
-        mod = importlib.import_module("src.__main__")
-        builder_inst = getattr(mod, "builder", None)
-
-    if builder_inst is not None:
-        # CustomGroup is the base class of Builder (mro[1])
-        cg_cls = builder_inst.__class__.__mro__[1]
-        monkeypatch.setattr(cg_cls, "cwd", tmp_path, raising=False)
-
-        # Patch FileManager and ComposeManager classes used by the instance
-        if hasattr(builder_inst, "file_manager"):
-            fm_cls = builder_inst.file_manager.__class__
-            monkeypatch.setattr(fm_cls, "cwd", tmp_path, raising=False)
-        if hasattr(builder_inst, "compose_manager"):
-            cm_cls = builder_inst.compose_manager.__class__
-            monkeypatch.setattr(cm_cls, "cwd", tmp_path, raising=False)
-    else:
-        # Fallback: import modules directly
-        import src.cli.custom_group as _cg
-        import src.core.docker as _docker
-        import src.core.files as _files
-
-        monkeypatch.setattr(_cg.CustomGroup, "cwd", tmp_path, raising=False)
-        monkeypatch.setattr(_files.FileManager, "cwd", tmp_path, raising=False)
-        monkeypatch.setattr(
-            _docker.ComposeManager, "cwd", tmp_path, raising=False
-        )
+    monkeypatch.setattr(_cg.CustomGroup, "cwd", tmp_path)
+    monkeypatch.setattr(_files.FileManager, "cwd", tmp_path)
+    monkeypatch.setattr(_docker.ComposeManager, "cwd", tmp_path)
     return tmp_path
 
 
@@ -55,6 +26,16 @@ def isolate_cwd(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
 T = TypeVar("T", bound=Callable[..., Any])
 
 
+@pytest.fixture(autouse=True)
+def isolate_cache(
+    tmp_path_factory: pytest.TempPathFactory, monkeypatch: pytest.MonkeyPatch
+) -> Path:
+    """Keep the jar and metadata caches out of the user's home directory."""
+    cache = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("MCDOCKER_CACHE_DIR", str(cache))
+    return cache
+
+
 @pytest.fixture(autouse=True)
 def disable_yaspin(monkeypatch: pytest.MonkeyPatch) -> None:
     """Disable yaspin spinners/colors during tests by replacing the
@@ -145,51 +126,3 @@ def disable_cli_clear_confirm(monkeypatch: pytest.MonkeyPatch) -> None:
         except Exception:
             # If a module isn't importable in a given test environment, ignore it.
             pass
-
-
-@pytest.fixture(autouse=True)
-def zero_sleep(monkeypatch: pytest.MonkeyPatch) -> None:
-    """Ensure FileManager and ComposeManager sleep times are zero during tests.
-
-    This prevents test slowdown by forcing both the class defaults and any
-    existing instances (created at import time) to use `sleep = 0`.
-    """
-    try:
-        import importlib
-
-        try:
-            import src as _src
-        except Exception:
-            _src = importlib.import_module("src")
-
-        # Try to find runtime builder instance if present
-        builder_inst = getattr(_src, "builder", None)
-        if builder_inst is None:
-            try:
-                mod = importlib.import_module("src.__main__")
-                builder_inst = getattr(mod, "builder", None)
-            except Exception:
-                builder_inst = None
-
-        import src.core.docker as _docker
-        import src.core.files as _files
-
-        # Patch class-level defaults so future instances are fast
-        monkeypatch.setattr(_files.FileManager, "sleep", 0, raising=False)
-        monkeypatch.setattr(_docker.ComposeManager, "sleep", 0, raising=False)
-
-        # If runtime instances exist, set their attribute as well
-        if builder_inst is not None:
-            if hasattr(builder_inst, "file_manager"):
-                try:
-                    builder_inst.file_manager.sleep = 0
-                except Exception:
-                    pass
-            if hasattr(builder_inst, "compose_manager"):
-                try:
-                    builder_inst.compose_manager.sleep = 0
-                except Exception:
-                    pass
-    except Exception:
-        # Keep tests resilient if any import/patch fails
-        pass
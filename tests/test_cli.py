@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from importlib import import_module
 import json
+import os
 from pathlib import Path
 from typing import Any
 
@@ -32,6 +33,23 @@ class Test_CLI:
             result = self.runner.invoke(self.cli, [command, "--help"])
             assert result.exit_code == 0
 
+    def test_manifest(self) -> None:
+        from src.__main__ import COMMANDS
+        from src.cli.builder import Builder
+        from src.cli.manager import Manager
+
+        for source, group in (("Builder", Builder()), ("Manager", Manager())):
+            manifest = {
+                name: short_help
+                for name, (src, short_help) in COMMANDS.items()
+                if src == source
+            }
+            actual = {
+                name: cmd.get_short_help_str()
+                for name, cmd in group.commands.items()
+            }
+            assert manifest == actual
+
     # BUILDER
     def test_create_errors(  # type: ignore
         self, isolate_cwd: Path, monkeypatch: pytest.MonkeyPatch
@@ -184,6 +202,67 @@ class Test_CLI:
 
         assert (base / "web").exists()
 
+    def test_create_from_spec(self, isolate_cwd: Path) -> None:
+        base = isolate_cwd
+
+        resources = {
+            "cpus": 0.1,
+            "memory": 256,
+            "memory_reservation": 128,
+        }
+        spec: dicts = {
+            "defaults": {"resources": resources, "version": "1.21.4"},
+            "servers": [
+                {"name": "proxy", "type": "velocity"},
+                {
+                    "name": "lobby-{i}",
+                    "count": 2,
+                    "ports": {"HOST": 25566},
+                    "expose": [],
+                },
+            ],
+            "database": {"user": "mc", "password": "Password1", "db": "mc"},
+            "web": True,
+        }
+        (base / "spec.json").write_text(json.dumps(spec), encoding="utf-8")
+
+        result = self.runner.invoke(
+            self.cli, ["create", "--from-spec", str(base / "spec.json")]
+        )
+        assert result.exit_code == 0, result.output
+        assert "Files saved!" in result.output
+
+        data = json.loads((base / "data.json").read_text(encoding="utf-8"))
+        servers = data["compose"]["servers"]
+        assert [s["name"] for s in servers] == ["proxy", "lobby-1", "lobby-2"]
+        assert [s["ports"] for s in servers] == [
+            ["25565:25565"],
+            ["25566:25566"],
+            ["25567:25567"],
+        ]
+        assert servers[1]["resources"]["limits"] == {
+            "cpus": 0.1,
+            "memory": "0.25g",
+        }
+        assert data["envs"][1]["MIN_HEAP_SIZE"] == "128M"
+        assert data["envs"][1]["MAX_HEAP_SIZE"] == "256M"
+        assert data["server_files"][0]["server"]["type"] == "velocity"
+        assert data["server_files"][2]["server"]["version"] == "1.21.4"
+        assert data["compose"]["database"]["user"] == "mc"
+        for name in ("proxy", "lobby-1", "lobby-2"):
+            assert (base / "servers" / name / ".env").exists()
+        assert (base / "web").exists()
+
+        (base / "data.json").unlink()
+        spec["servers"][1]["ports"] = {"HOST": 25565}
+        (base / "spec.json").write_text(json.dumps(spec), encoding="utf-8")
+        result = self.runner.invoke(
+            self.cli, ["create", "--from-spec", str(base / "spec.json")]
+        )
+        assert result.exit_code != 0
+        assert "port 25565 already used by 'proxy'" in result.output
+        assert not (base / "data.json").exists()
+
     def test_update_errors(self, isolate_cwd: Path) -> None:
         result = self.runner.invoke(self.cli, ["update", "--add", "--remove"])
         assert result.exit_code != 0
@@ -255,6 +334,11 @@ class Test_CLI:
         (base / "data.json").write_text(
             json.dumps(data, indent=2), encoding="utf-8"
         )
+        result = self.runner.invoke(self.cli, ["build"])
+        assert result.exit_code == 0, result.output
+        world = base / "servers" / "server1" / "data" / "world"
+        world.mkdir()
+        world.joinpath("level.dat").write_bytes(b"level")
 
         result = self.runner.invoke(
             self.cli, ["update", "--server", "server1", "--remove"]
@@ -262,6 +346,16 @@ class Test_CLI:
         assert result.exit_code == 0
         assert "removed and files updated." in result.output
 
+        # Its generated files are gone, its world is kept
+        manifest = json.loads(
+            (base / ".mcdocker" / "manifest.json").read_text(encoding="utf-8")
+        )
+        assert not [n for n in manifest["outputs"] if "server1" in n]
+        assert any("server2" in n for n in manifest["outputs"])
+        assert not (base / "servers" / "server1" / "Dockerfile").exists()
+        assert not (base / "servers" / "server1" / ".env").exists()
+        assert world.joinpath("level.dat").exists()
+
         data_after = json.loads(
             (base / "data.json").read_text(encoding="utf-8")
         )
@@ -400,6 +494,42 @@ class Test_CLI:
         )
         assert data_after.get("compose").get("database") == data_base_changed
 
+    def test_update_database_missing(
+        self, isolate_cwd: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        base = isolate_cwd
+
+        root = Path(__file__).resolve().parent.parent
+        template = root / "src" / "assets" / "templates" / "template.json"
+        with open(template, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        data["compose"].pop("database", None)
+
+        (base / "data.json").write_text(
+            json.dumps(data, indent=2), encoding="utf-8"
+        )
+
+        database = {"user": "UserName", "password": "PassCode", "db": "db"}
+        menus = import_module("src.cli.menu").Menus
+        defaults: list[Any] = []
+        init = menus.__init__
+
+        def record(self: Any, *args: Any, **kwargs: Any) -> None:
+            defaults.append(kwargs.get("defaults"))
+            init(self, *args, **kwargs)
+
+        monkeypatch.setattr(menus, "__init__", record)
+        monkeypatch.setattr(menus, "database", lambda self: database)
+
+        result = self.runner.invoke(self.cli, ["update", "--database"])
+        assert result.exit_code == 0, result.output
+        assert defaults == [None]
+
+        data_after = json.loads(
+            (base / "data.json").read_text(encoding="utf-8")
+        )
+        assert data_after.get("compose").get("database") == database
+
     def test_update_web(self, isolate_cwd: Path) -> None:
         base = isolate_cwd
 
@@ -462,6 +592,309 @@ class Test_CLI:
         assert (base / "servers" / "server" / "run.sh").exists()
         assert (base / "servers" / "server" / "data" / "eula.txt").exists()
 
+    def test_build_incremental(  # type: ignore
+        self, isolate_cwd: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        base = isolate_cwd
+
+        root = Path(__file__).resolve().parent.parent
+        template = root / "src" / "assets" / "templates" / "template.json"
+        data = json.loads(template.read_text(encoding="utf-8"))
+        (base / "data.json").write_text(json.dumps(data), encoding="utf-8")
+
+        from src.core.downloader import Downloader
+
+        downloads: list[Path] = []
+        resolved = {"project": "paper", "version": "1.20.1", "build": 1}
+
+        def download(self: Any, resolved: dicts, path: Path) -> None:
+            downloads.append(path)
+            path.write_bytes(f"jar {resolved['build']}".encode())
+
+        monkeypatch.setattr(
+            Downloader, "resolve", lambda self, e, v=None: dict(resolved)  # type: ignore
+        )
+        monkeypatch.setattr(Downloader, "download", download)
+
+        result = self.runner.invoke(self.cli, ["build"])
+        assert result.exit_code == 0
+        assert (base / ".mcdocker" / "manifest.json").exists()
+        assert len(downloads) == 1
+
+        outputs = [p for p in base.rglob("*") if p.is_file()]
+        outputs = [
+            p
+            for p in outputs
+            if ".mcdocker" not in p.parts and p.name != "data.json"
+        ]
+        for output in outputs:
+            os.utime(output, ns=(0, 0))
+
+        result = self.runner.invoke(self.cli, ["build"])
+        assert result.exit_code == 0
+        assert len(downloads) == 1
+        assert all(p.stat().st_mtime_ns == 0 for p in outputs)
+
+        data["envs"][0]["MAX_HEAP_SIZE"] = "2048M"
+        (base / "data.json").write_text(json.dumps(data), encoding="utf-8")
+        resolved["build"] = 2
+
+        result = self.runner.invoke(self.cli, ["build"])
+        assert result.exit_code == 0
+        assert len(downloads) == 2
+        env_file = base / "servers" / "server" / ".env"
+        assert "2048M" in env_file.read_text(encoding="utf-8")
+        changed = {p for p in outputs if p.stat().st_mtime_ns != 0}
+        assert changed == {env_file, base / "servers/server/data/server.jar"}
+
+    def test_build_server(self, isolate_cwd: Path) -> None:
+        base = isolate_cwd
+
+        env2 = dict(e1, CONTAINER_NAME="server2")
+        data: dicts = {
+            "compose": {
+                "servers": [dict(s1), dict(s1, name="server2")],
+                "database": {},
+                "web": False,
+            },
+            "envs": [dict(e1), env2],
+            "server_files": [dict(f1), dict(f1, name="server2")],
+        }
+        (base / "data.json").write_text(json.dumps(data), encoding="utf-8")
+
+        result = self.runner.invoke(self.cli, ["build"])
+        assert result.exit_code == 0
+        outputs = [
+            p
+            for p in (base / "servers").rglob("*")
+            if p.is_file() and "server2" not in p.parts
+        ]
+        for output in outputs + [base / "docker-compose.yml"]:
+            os.utime(output, ns=(0, 0))
+
+        env2["MAX_HEAP_SIZE"] = "2048M"
+        (base / "data.json").write_text(json.dumps(data), encoding="utf-8")
+
+        result = self.runner.invoke(self.cli, ["build", "--server", "server2"])
+        assert result.exit_code == 0, result.output
+        env_file = base / "servers" / "server2" / ".env"
+        assert "2048M" in env_file.read_text(encoding="utf-8")
+        assert all(p.stat().st_mtime_ns == 0 for p in outputs)
+        assert (base / "docker-compose.yml").stat().st_mtime_ns == 0
+
+        # Partial builds keep the manifest entries of the other servers
+        manifest = json.loads(
+            (base / ".mcdocker" / "manifest.json").read_text(encoding="utf-8")
+        )
+        assert "servers/server1/.env" in manifest["outputs"]
+
+        result = self.runner.invoke(self.cli, ["build", "--server", "nope"])
+        assert result.exit_code != 0
+
+    def test_build_watch(  # type: ignore
+        self, isolate_cwd: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        base = isolate_cwd
+
+        env2 = dict(e1, CONTAINER_NAME="server2")
+        data: dicts = {
+            "compose": {
+                "servers": [dict(s1), dict(s1, name="server2")],
+                "database": {},
+                "web": False,
+            },
+            "envs": [dict(e1), env2],
+            "server_files": [dict(f1), dict(f1, name="server2")],
+        }
+        (base / "data.json").write_text(json.dumps(data), encoding="utf-8")
+
+        def edit() -> set[Path]:
+            env2["MAX_HEAP_SIZE"] = "2048M"
+            (base / "data.json").write_text(json.dumps(data), encoding="utf-8")
+            return {(base / "data.json").absolute()}
+
+        def stop() -> set[Path]:
+            raise KeyboardInterrupt
+
+        class FakeWatcher:
+            def __init__(self, paths: Any) -> None:
+                self.batches = [edit, stop]
+
+            def __enter__(self) -> FakeWatcher:
+                return self
+
+            def __exit__(self, *exc: Any) -> None:
+                pass
+
+            def wait(self) -> set[Path]:
+                return self.batches.pop(0)()
+
+        ups: list[list[str]] = []
+        import src.cli.builder as builder_module
+        from src.core.docker import ComposeManager
+
+        monkeypatch.setattr(builder_module, "watcher", FakeWatcher)
+        monkeypatch.setattr(
+            ComposeManager,
+            "up",
+            lambda self, attached, services=None: ups.append(services),  # type: ignore
+        )
+
+        result = self.runner.invoke(self.cli, ["build", "--watch", "--up"])
+        assert result.exit_code == 0, result.output
+        assert "Rebuilt: server2" in result.output
+        assert "Stopped watching." in result.output
+        env_file = base / "servers" / "server2" / ".env"
+        assert "2048M" in env_file.read_text(encoding="utf-8")
+        assert ups == [["server2"]]
+
+    def test_build_watch_assets(
+        self, isolate_cwd: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        base = isolate_cwd
+        data: dicts = {
+            "compose": {"servers": [dict(s1), dict(s1, name="server2")]},
+            "envs": [dict(e1), dict(e1, CONTAINER_NAME="server2")],
+            "server_files": [dict(f1), dict(f1, name="server2")],
+        }
+        (base / "data.json").write_text(json.dumps(data), encoding="utf-8")
+
+        result = self.runner.invoke(self.cli, ["build", "--up"])
+        assert result.exit_code == 2
+        assert "--up only applies with --watch" in result.output
+
+        root = Path(__file__).resolve().parent.parent
+        run_sh = root / "src" / "assets" / "scripts" / "run.sh"
+        watched: list[Path] = []
+        started: list[list[str]] = []
+
+        class FakeWatcher:
+            events = [{run_sh}]
+
+            def __init__(self, paths: list[Path]) -> None:
+                watched.extend(paths)
+
+            def __enter__(self) -> FakeWatcher:
+                return self
+
+            def __exit__(self, *exc: Any) -> None:
+                pass
+
+            def wait(self) -> set[Path]:
+                if not self.events:
+                    raise KeyboardInterrupt
+                return self.events.pop(0)
+
+        monkeypatch.setattr(
+            import_module("src.cli.builder"), "watcher", FakeWatcher
+        )
+        monkeypatch.setattr(
+            import_module("src.core.docker").ComposeManager,
+            "up",
+            lambda self, attached, services=None: started.append(services),
+        )
+
+        result = self.runner.invoke(self.cli, ["build", "--watch", "--up"])
+        assert result.exit_code == 0, result.output
+        # Editing an asset rebuilds and restarts every server
+        assert run_sh.parent in watched
+        assert (root / "src" / "assets" / "docker") in watched
+        assert started == [["server1", "server2"]]
+
+    def test_build_timings(self, isolate_cwd: Path) -> None:
+        base = isolate_cwd
+
+        root = Path(__file__).resolve().parent.parent
+        template = root / "src" / "assets" / "templates" / "template.json"
+        (base / "data.json").write_text(
+            template.read_text(encoding="utf-8"), encoding="utf-8"
+        )
+
+        result = self.runner.invoke(self.cli, ["--fast", "build"])
+        assert result.exit_code == 0
+        assert "Timings:" not in result.output
+
+        result = self.runner.invoke(self.cli, ["-v", "build"])
+        assert result.exit_code == 0
+        assert "Timings:" in result.output
+        assert "render .env files" in result.output
+
+    # MANAGER
+    def test_backup_repository(self, isolate_cwd: Path) -> None:
+        from io import BytesIO
+
+        from src.core.repository import Repository, Snapshot
+
+        base = isolate_cwd
+        data: dicts = {
+            "compose": {"servers": [dict(s1)], "database": {}},
+            "envs": [dict(e1)],
+            "server_files": [dict(f1)],
+        }
+        (base / "data.json").write_text(json.dumps(data), encoding="utf-8")
+
+        result = self.runner.invoke(self.cli, ["backup", "list"])
+        assert result.exit_code != 0
+
+        result = self.runner.invoke(
+            self.cli, ["backup", "--compression", "gzip", "--level", "12"]
+        )
+        assert result.exit_code != 0
+        assert "gzip compression levels go from 1 to 9" in result.output
+
+        repository = Repository(base / ".backup" / "repo")
+        for i in range(3):
+            snapshot = Snapshot("server1", f"0{i}", float(i))
+            tree, size, snapshot.added = repository.store(
+                BytesIO(f"level {i}".encode())
+            )
+            snapshot.files["world/level.dat"] = [size, i, 0o644, tree]
+            repository.save(snapshot)
+
+        result = self.runner.invoke(self.cli, ["backup", "list"])
+        assert result.exit_code == 0
+        assert result.output.count("server1") == 3
+
+        out = base / "restored"
+        result = self.runner.invoke(
+            self.cli,
+            [
+                "backup",
+                "restore",
+                "--server",
+                "server1",
+                "--snapshot",
+                "01",
+                "--to",
+                str(out),
+            ],
+        )
+        assert result.exit_code == 0, result.output
+        assert (out / "world" / "level.dat").read_text() == "level 1"
+
+        result = self.runner.invoke(
+            self.cli, ["backup", "prune", "--keep", "1"]
+        )
+        assert result.exit_code == 0
+        assert "Removed 2 snapshots" in result.output
+        assert [s.id for s in Repository(repository.root).snapshots()] == ["02"]
+
+        result = self.runner.invoke(self.cli, ["backup", "verify"])
+        assert result.exit_code == 0, result.output
+        assert "no errors" in result.output
+
+        result = self.runner.invoke(self.cli, ["restore"])
+        assert result.exit_code != 0
+        assert "--server" in result.output
+
+        for args, error in [
+            (["--every", "soon"], "Invalid duration"),
+            (["--interval", "server9=6h"], "Unknown server server9"),
+        ]:
+            result = self.runner.invoke(self.cli, ["backup", "schedule", *args])
+            assert result.exit_code != 0
+            assert error in result.output
+
     def __render_template(self, data: dicts, template_name: str) -> str:
         import jinja2
 
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import resource
+import shutil
+from subprocess import PIPE, Popen
+import tarfile
+from time import perf_counter, process_time
+
+import pytest  # type: ignore
+
+# Size (MB) of the generated world. Override for a closer look.
+WORLD_MB = int(os.environ.get("MCDOCKER_BENCH_MB", "32"))
+
+
+def world(path: Path) -> Path:
+    """Region-like files: half random (compressed chunks), half NBT-like."""
+    path.mkdir()
+    for i in range(WORLD_MB // 2):
+        nbt = b"".join(
+            b"\x0a\x00\x05Level\x03\x00\x04xPos%08d" % (i * 4096 + j)
+            for j in range(2**15)
+        )
+        data = os.urandom(1024 * 1024) + nbt[: 1024 * 1024]
+        path.joinpath(f"r.{i}.0.mca").write_bytes(data)
+    return path
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not shutil.which("tar"), reason="needs tar")
+def test_compression(tmp_path: Path) -> None:
+    """
+    In-container gzip against host-side compression. `tar` runs as a child
+    process standing for the container: its CPU time is what counts
+    against the quota of the server.
+    """
+    from src.core.repository import Repository
+
+    source = world(tmp_path / "world")
+    rows: list[tuple[str, float, float, float]] = []
+
+    # Old pipeline: tar -czf inside the container, the host only writes
+    start, cpu = perf_counter(), children_cpu()
+    with Popen(["tar", "-C", str(source), "-czf", "-", "."], stdout=PIPE) as p:
+        with open(tmp_path / "world.tar.gz", "wb") as f:
+            shutil.copyfileobj(p.stdout, f)  # type: ignore
+    rows.append(
+        ("container gzip", perf_counter() - start, children_cpu() - cpu, 0)
+    )
+
+    modes = ["gzip"]
+    try:
+        import zstandard  # type: ignore # noqa: F401
+
+        modes.append("zstd")
+    except ImportError:
+        pass
+
+    for mode in modes:
+        repository = Repository(tmp_path / f"repo-{mode}", mode)
+        start, cpu, host = perf_counter(), children_cpu(), process_time()
+        with Popen(
+            ["tar", "-C", str(source), "-cf", "-", "."], stdout=PIPE
+        ) as p:
+            with tarfile.open(fileobj=p.stdout, mode="r|") as tar:
+                for member in tar:
+                    data = tar.extractfile(member)
+                    if data is not None:
+                        repository.store(data)  # type: ignore
+        repository.close()
+        rows.append(
+            (
+                f"host {mode}",
+                perf_counter() - start,
+                children_cpu() - cpu,
+                process_time() - host,
+            )
+        )
+
+    print(f"\n{WORLD_MB} MB world")
+    header = ("mode", "wall s", "container cpu s", "host cpu s")
+    print("{:<16} {:>8} {:>16} {:>11}".format(*header))
+    for mode, wall, container, host in rows:
+        print(f"{mode:<16} {wall:>8.2f} {container:>16.2f} {host:>11.2f}")
+
+    # Compression left the container
+    assert all(row[2] < rows[0][2] for row in rows[1:])
@@ -0,0 +1,1349 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+import tarfile
+from typing import Any
+
+import pytest  # type: ignore
+
+from .__vars__ import *
+
+
+class Test_State:
+
+    def test_cached_until_changed(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from src.core import state as _state
+        from src.core.state import ProjectState
+
+        path = tmp_path / "data.json"
+        data: dicts = {
+            "compose": {"servers": [{"name": "server1"}, {"name": "server2"}]},
+            "envs": [{"CONTAINER_NAME": "server2"}, e1],
+            "server_files": [f1, {"name": "server2", "server": {}}],
+        }
+        path.write_text(json.dumps(data), encoding="utf-8")
+
+        parses: list[bytes] = []
+        loads = json.loads
+
+        def counting_loads(raw: bytes) -> object:
+            parses.append(raw)
+            return loads(raw)
+
+        monkeypatch.setattr(_state.json, "loads", counting_loads)
+
+        state = ProjectState.load(path)
+        assert state.names == ["server1", "server2"]
+        assert state.envs["server1"] == e1
+        assert state.server_files["server1"] == f1
+        assert ProjectState.load(path) is state
+        assert len(parses) == 1
+
+        data["compose"]["servers"] = [{"name": "server1"}]
+        path.write_text(json.dumps(data), encoding="utf-8")
+        os.utime(path, ns=(0, 0))
+        assert ProjectState.load(path).names == ["server1"]
+        assert len(parses) == 2
+
+    def test_missing_and_empty(self, tmp_path: Path) -> None:
+        from src.core.state import ProjectState
+
+        path = tmp_path / "data.json"
+        state = ProjectState.load(path)
+        assert not state.exists
+        assert state.data == {} and state.names == []
+
+        path.write_text("")
+        state = ProjectState.load(path)
+        assert state.exists
+        assert state.data == {}
+
+
+class Test_JarCache:
+
+    class Source:
+        def __init__(self) -> None:
+            self.calls = 0
+
+        def download(self, resolved: dicts, path: Path) -> None:
+            self.calls += 1
+            path.write_bytes(resolved["content"])
+
+    @staticmethod
+    def resolved(
+        build: int, content: bytes, sha256: str | None = None
+    ) -> dicts:
+        return {
+            "project": "paper",
+            "version": "1.21.4",
+            "build": build,
+            "content": content,
+            "sha256": sha256,
+        }
+
+    def test_fetch_and_link(self, tmp_path: Path) -> None:
+        import hashlib
+
+        from src.core.cache import JarCache
+
+        cache = JarCache(tmp_path / "jars")
+        source = self.Source()
+        content = b"x" * 100
+        resolved = self.resolved(
+            1, content, hashlib.sha256(content).hexdigest()
+        )
+
+        blob = cache.fetch(resolved, source)
+        assert cache.fetch(resolved, source) == blob
+        assert source.calls == 1
+
+        for name in ("a", "b"):
+            cache.link(blob, tmp_path / name / "server.jar")
+            assert (tmp_path / name / "server.jar").read_bytes() == content
+        assert blob.stat().st_nlink == 3
+
+        with pytest.raises(ValueError):
+            cache.fetch(self.resolved(2, b"corrupt", "0" * 64), source)
+        assert cache.get(self.resolved(2, b"")) is None
+
+    def test_prune_lru(self, tmp_path: Path) -> None:
+        from src.core.cache import JarCache
+
+        cache = JarCache(tmp_path / "jars")
+        source = self.Source()
+        old = cache.fetch(self.resolved(1, b"a" * 100), source)
+        new = cache.fetch(self.resolved(2, b"b" * 100), source)
+        cache.get(self.resolved(2, b""))
+
+        assert cache.prune(150) == (1, 100)
+        assert not old.exists() and new.exists()
+        assert cache.get(self.resolved(1, b"")) is None
+
+        assert cache.prune(0) == (1, 100)
+        assert cache.size() == 0
+
+
+class Test_FetchJars:
+
+    def test_coalesced(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        from threading import Lock
+
+        from src.core.downloader import Downloader
+        from src.core.files import FileManager
+        from src.core.manifest import BuildManifest
+
+        calls: dict[str, list[Any]] = {"resolve": [], "download": []}
+        lock = Lock()
+
+        def resolve(self, endpoint: str, version: str | None = None) -> dicts:
+            with lock:
+                calls["resolve"].append((endpoint, version))
+            return {
+                "project": endpoint,
+                "version": version or "1.21.4",
+                "build": 1,
+                "url": "",
+                "sha256": None,
+            }
+
+        def download(self, resolved: dicts, path: Path) -> None:
+            with lock:
+                calls["download"].append(resolved["project"])
+            path.write_bytes(resolved["project"].encode())
+
+        monkeypatch.setattr(Downloader, "resolve", resolve)
+        monkeypatch.setattr(Downloader, "download", download)
+
+        jars = [
+            (f"lobby-{i}", "paper", None, tmp_path / f"lobby-{i}" / "s.jar")
+            for i in range(4)
+        ]
+        jars.append(("proxy", "velocity", None, tmp_path / "proxy" / "p.jar"))
+
+        manager = FileManager()
+        manager.jobs = 3
+        manager.fetch_jars(jars, BuildManifest(tmp_path))
+
+        assert sorted(calls["resolve"]) == [("paper", None), ("velocity", None)]
+        assert sorted(calls["download"]) == ["paper", "velocity"]
+        for _, server_type, _, jar_path in jars:
+            assert jar_path.read_bytes() == server_type.encode()
+
+
+class Test_Downloader:
+
+    @pytest.fixture()
+    def server(self) -> Any:
+        """Local HTTP server dropping the first transfers halfway."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from threading import Thread
+
+        payload = os.urandom(2 * 1024**2)
+        log: dict[str, Any] = {"ranges": [], "drops": 2}
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                header = self.headers.get("Range")
+                log["ranges"].append(header)
+                start = int(header[6:-1]) if header else 0
+                body = payload[start:]
+
+                self.send_response(206 if start else 200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if log["drops"]:
+                    log["drops"] -= 1
+                    self.wfile.write(body[: len(body) // 2])
+                    self.wfile.flush()
+                    self.connection.shutdown(2)
+                    return
+                self.wfile.write(body)
+
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        Thread(target=httpd.serve_forever, daemon=True).start()
+        yield f"http://127.0.0.1:{httpd.server_port}/server.jar", payload, log
+        httpd.shutdown()
+        httpd.server_close()
+
+    @pytest.mark.enable_socket
+    def test_resume(self, tmp_path: Path, server: Any) -> None:
+        import hashlib
+
+        from src.core.downloader import Downloader
+
+        url, payload, log = server
+        sha256 = hashlib.sha256(payload).hexdigest()
+        downloader = Downloader(url)
+        downloader.backoff = 0
+
+        path = tmp_path / "server.jar"
+        assert downloader.download_file(url, path, sha256) == sha256
+        assert path.read_bytes() == payload
+        assert not path.with_name("server.jar.part").exists()
+
+        # Two drops, each attempt resuming where the previous one stopped
+        assert log["ranges"][0] is None
+        assert all(r and r.startswith("bytes=") for r in log["ranges"][1:])
+        assert len(log["ranges"]) == 3
+
+    @pytest.mark.enable_socket
+    def test_checksum_mismatch(self, tmp_path: Path, server: Any) -> None:
+        from src.core.downloader import ChecksumError, Downloader
+
+        url, _, log = server
+        log["drops"] = 0
+        downloader = Downloader(url)
+        downloader.backoff = 0
+
+        path = tmp_path / "server.jar"
+        with pytest.raises(ChecksumError):
+            downloader.download_file(url, path, "0" * 64)
+        assert not path.exists()
+        assert not path.with_name("server.jar.part").exists()
+        assert len(log["ranges"]) == 1
+
+
+class Test_MetadataCache:
+
+    class Session:
+        def __init__(self) -> None:
+            self.requests: list[dict[str, str]] = []
+
+        def get(self, url: str, headers: dict[str, str], **kwargs: Any) -> Any:
+            from types import SimpleNamespace
+
+            self.requests.append(headers)
+            not_modified = headers.get("If-None-Match") == '"v1"'
+            return SimpleNamespace(
+                status_code=304 if not_modified else 200,
+                headers={"ETag": '"v1"'},
+                json=lambda: {"versions": {"1.21": ["1.21.4"]}},
+                raise_for_status=lambda: None,
+            )
+
+    def test_ttl_and_revalidation(self, tmp_path: Path) -> None:
+        from src.core.cache import MetadataCache
+
+        cache = MetadataCache(tmp_path / "metadata")
+        session = self.Session()
+        url = "https://fill.papermc.io/v3/projects/paper"
+
+        body = cache.fetch(session, url)
+        assert cache.fetch(session, url) == body
+        assert session.requests == [{}]
+
+        # Stale entries are revalidated and kept on 304
+        cache.ttl = 0
+        assert cache.fetch(session, url) == body
+        assert session.requests[-1] == {"If-None-Match": '"v1"'}
+        assert cache.load(url)["etag"] == '"v1"'  # type: ignore
+
+        assert cache.clear() == 1
+        assert cache.load(url) is None
+
+
+class Test_Model:
+
+    @staticmethod
+    def data() -> dicts:
+        servers = [
+            {"name": name, "env_file": f"./servers/{name}/.env", "x": 1}
+            for name in ("proxy", "lobby")
+        ]
+        envs = [
+            {"CONTAINER_NAME": name, "SERVER_JAR": f"{name}.jar"}
+            for name in ("lobby", "proxy")
+        ]
+        server_files = [
+            {"name": "proxy", "server": {"type": "velocity", "version": None}},
+            {"name": "lobby", "server": {"type": "paper", "version": None}},
+        ]
+        return {
+            "compose": {"servers": servers, "database": {}, "web": False},
+            "envs": envs,
+            "server_files": server_files,
+            "custom": True,
+        }
+
+    def test_round_trip(self) -> None:
+        from src.core.model import Project
+
+        data = self.data()
+        project = Project.from_dict(data)
+        assert project.to_dict() == data
+        assert project.database is None
+        assert project.servers["proxy"].extra == {"x": 1}
+
+    def test_keyed_despite_drift(self) -> None:
+        from src.core.model import Env, Project, Server, ServerFiles
+
+        project = Project.from_dict(self.data())
+        _, env, server_files = project.get("proxy")
+        assert env.server_jar == "proxy.jar"  # type: ignore
+        assert server_files.server["type"] == "velocity"  # type: ignore
+
+        project.put(
+            Server(name="proxy"),
+            Env(container_name="proxy", server_jar="new.jar"),
+            ServerFiles(name="proxy"),
+        )
+        data = project.to_dict()
+        assert [s["name"] for s in data["compose"]["servers"]] == [
+            "proxy",
+            "lobby",
+        ]
+        assert data["envs"][1] == {
+            "CONTAINER_NAME": "proxy",
+            "SERVER_JAR": "new.jar",
+        }
+
+        assert project.remove("lobby") and not project.remove("lobby")
+        assert project.names == ["proxy"] and list(project.envs) == ["proxy"]
+
+    def test_changed(self) -> None:
+        from src.core.model import Project
+
+        before = Project.from_dict(self.data())
+        data = self.data()
+        data["envs"][1]["SERVER_JAR"] = "new.jar"
+        data["compose"]["servers"].append({"name": "hub"})
+        assert Project.from_dict(data).changed(before) == {"proxy", "hub"}
+        assert before.changed(before) == set()
+
+    def test_invalid(self) -> None:
+        from src.core.model import ModelError, Project
+
+        data = self.data()
+        data["envs"].append({"CONTAINER_NAME": "lobby"})
+        with pytest.raises(ModelError):
+            Project.from_dict(data)
+        with pytest.raises(ModelError):
+            Project.from_dict({"compose": {"servers": [{"ports": []}]}})
+
+
+class Test_Watcher:
+
+    @pytest.mark.parametrize("backend", ["inotify", "polling"])
+    def test_debounced(self, tmp_path: Path, backend: str) -> None:
+        from threading import Thread
+        from time import sleep
+
+        from src.core.watch import InotifyWatcher, PollingWatcher
+
+        data_json = tmp_path / "data.json"
+        data_json.write_text("{}")
+        templates = tmp_path / "templates"
+        templates.mkdir()
+
+        if backend == "inotify":
+            watcher = InotifyWatcher([data_json, templates], debounce=0.2)
+        else:
+            watcher = PollingWatcher(
+                [data_json, templates], debounce=0.2, interval=0.05
+            )
+
+        def burst() -> None:
+            sleep(0.1)
+            for i in range(5):
+                data_json.write_text(str(i))
+                sleep(0.02)
+            (templates / ".env.j2").write_text("x")
+            (tmp_path / "other.txt").write_text("x")
+
+        with watcher:
+            assert watcher.wait(0.1) == set()
+            Thread(target=burst).start()
+            assert watcher.wait(2) == {data_json, templates / ".env.j2"}
+            assert watcher.wait(0.3) == set()
+
+
+class Test_EngineRuntime:
+
+    @pytest.fixture()
+    def daemon(self, tmp_path: Path) -> Any:
+        """Fake Docker daemon on a unix socket."""
+        from http.server import BaseHTTPRequestHandler
+        from socketserver import ThreadingUnixStreamServer
+        from threading import Thread
+
+        log: dict[str, Any] = {"requests": [], "connections": 0}
+        running = {"proxy": False, "lobby": True}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                log["connections"] += 1
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def address_string(self) -> str:
+                return "unix"
+
+            def reply(self, status: int, body: Any = None) -> None:
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if data:
+                    self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                log["requests"].append(("GET", self.path))
+                path = self.path.split("?")[0]
+                if path == "/containers/json":
+                    assert "working_dir" in self.path
+                    names = [{"Names": [f"/{n}"]} for n in running]
+                    self.reply(200, names)
+                elif path == "/exec/e1/json":
+                    self.reply(200, {"ExitCode": 0})
+                elif path.endswith("/stats"):
+                    self.reply(
+                        200,
+                        {
+                            "cpu_stats": {
+                                "cpu_usage": {"total_usage": 300},
+                                "system_cpu_usage": 2000,
+                                "online_cpus": 2,
+                            },
+                            "precpu_stats": {
+                                "cpu_usage": {"total_usage": 100},
+                                "system_cpu_usage": 1000,
+                            },
+                            "memory_stats": {"usage": 2048, "limit": 4096},
+                        },
+                    )
+                else:
+                    self.reply(404, {"message": "no such container"})
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"null")
+                log["requests"].append(("POST", self.path))
+                parts = self.path.strip("/").split("/")
+                if parts[0] == "containers" and parts[1] not in running:
+                    self.reply(404, {"message": "no such container"})
+                elif parts[-1] in ("start", "stop") and parts[0] != "exec":
+                    running[parts[1]] = parts[-1] == "start"
+                    self.reply(204)
+                elif parts[-1] == "exec":
+                    assert body["Cmd"] in (["tar", "-cf", "-", "."], ["cat"])
+                    log["stdin"] = body["AttachStdin"]
+                    self.reply(201, {"Id": "e1"})
+                elif parts[0] == "exec":
+                    # Hijacked, multiplexed stream until close
+                    self.send_response(200)
+                    self.send_header(
+                        "Content-Type", "application/vnd.docker.raw-stream"
+                    )
+                    self.end_headers()
+                    frames = [(1, b"tar "), (2, b"warn"), (1, b"data")]
+                    if log["stdin"]:
+                        # Echo the input once the client half-closes
+                        frames = [(1, self.rfile.read())]
+                    for stream, data in frames:
+                        header = bytes([stream, 0, 0, 0]) + len(data).to_bytes(
+                            4, "big"
+                        )
+                        self.wfile.write(header + data)
+                    self.close_connection = True
+
+            def do_PUT(self) -> None:
+                log["requests"].append(("PUT", self.path))
+                assert self.headers["Transfer-Encoding"] == "chunked"
+                body = bytearray()
+                while size := int(self.rfile.readline(), 16):
+                    body.extend(self.rfile.read(size))
+                    self.rfile.readline()
+                self.rfile.readline()
+                log["archive"] = bytes(body)
+                self.reply(200)
+
+        path = tmp_path / "docker.sock"
+        server = ThreadingUnixStreamServer(str(path), Handler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, daemon=True).start()
+        yield str(path), log, running
+        server.shutdown()
+        server.server_close()
+
+    @pytest.mark.enable_socket
+    def test_pooled_operations(self, tmp_path: Path, daemon: Any) -> None:
+        from io import BytesIO
+
+        from src.core.runtime import DockerError, EngineRuntime
+
+        path, log, running = daemon
+        runtime = EngineRuntime(path, size=2)
+
+        names = runtime.containers(tmp_path)
+        assert names == ["proxy", "lobby"]
+        runtime.start(names)
+        runtime.stop(["lobby"])
+        assert running == {"proxy": True, "lobby": False}
+
+        out = BytesIO()
+        assert runtime.exec("proxy", ["tar", "-cf", "-", "."], out) == (
+            0,
+            b"warn",
+        )
+        assert out.getvalue() == b"tar data"
+
+        stats = runtime.stats(["proxy"])
+        assert stats["proxy"] == {"cpu": 40.0, "memory": 2048, "limit": 4096}
+
+        with pytest.raises(DockerError, match="no such container"):
+            runtime.start(["nope"])
+
+        # Keep-alive connections are reused, the exec stream gets its own
+        assert len(log["requests"]) == 9
+        assert runtime.opened == log["connections"] <= 4
+        runtime.close()
+
+    @pytest.mark.enable_socket
+    def test_exec_stdin(self, daemon: Any) -> None:
+        from io import BytesIO
+
+        from src.core.runtime import EngineRuntime
+
+        path, log, _ = daemon
+        runtime = EngineRuntime(path)
+        out = BytesIO()
+        data = os.urandom(1024 * 1024)
+
+        assert runtime.exec("proxy", ["cat"], out, BytesIO(data)) == (0, b"")
+        assert out.getvalue() == data
+        runtime.close()
+
+    @pytest.mark.enable_socket
+    def test_put_archive(self, daemon: Any) -> None:
+        from io import BytesIO
+
+        from src.core.runtime import EngineRuntime
+
+        path, log, _ = daemon
+        runtime = EngineRuntime(path)
+        data = os.urandom(1024 * 1024)
+
+        runtime.put_archive("proxy", "/home/serverUser", BytesIO(data))
+        assert log["archive"] == data
+        assert log["requests"][-1] == (
+            "PUT",
+            "/containers/proxy/archive?path=%2Fhome%2FserverUser&copyUIDGID=1",
+        )
+        # The connection goes back to the pool
+        runtime.put_archive("proxy", "/tmp", BytesIO(b"tar"))
+        assert log["connections"] == 1
+        runtime.close()
+
+
+class Test_Repository:
+
+    def test_chunks_follow_content(self) -> None:
+        from io import BytesIO
+
+        from src.core.repository import CHUNK_MAX, CHUNK_MIN, chunks
+
+        data = os.urandom(8 * 1024 * 1024)
+        before = list(chunks(BytesIO(data)))
+        after = list(chunks(BytesIO(b"inserted" + data)))
+
+        assert b"".join(before) == data
+        assert all(CHUNK_MIN <= len(c) <= CHUNK_MAX for c in before[:-1])
+        # Only the chunk holding the insertion changes
+        assert len(set(before) - set(after)) == 1
+
+    def test_dedup_and_gc(self, tmp_path: Path, monkeypatch: Any) -> None:
+        from io import BytesIO
+
+        from src.core import repository as module
+        from src.core.repository import CHUNK_MAX, Repository, Snapshot
+
+        monkeypatch.setattr(module, "PACK_SIZE", 1024 * 1024)
+        world = os.urandom(3 * 1024 * 1024)
+        repository = Repository(tmp_path)
+
+        def snapshot(name: str, files: dict[str, bytes]) -> Snapshot:
+            snap = Snapshot("proxy", name, 0)
+            for path, data in files.items():
+                tree, size, added = repository.store(BytesIO(data))
+                snap.files[path] = [size, 0, 0o644, tree]
+                snap.added += added
+            repository.save(snap)
+            return snap
+
+        old = os.urandom(2 * 1024 * 1024)
+        first = snapshot("1", {"r.0.0.mca": world, "old.mca": old})
+        second = snapshot("2", {"r.0.0.mca": world, "level.dat": b"b" * 100})
+        assert first.added > len(world) + len(old)
+        # Only the new level.dat and its tree
+        assert 0 < second.added < 200
+
+        # Everything is found again from the packs and indexes on disk
+        repository = Repository(tmp_path)
+        reader = repository.open(first.files["r.0.0.mca"][3])
+        assert reader.read(10) + reader.read() == world
+        repository.extract(second, tmp_path / "out")
+        assert (tmp_path / "out" / "level.dat").read_bytes() == b"b" * 100
+
+        # Packs of dropped snapshots go, live chunks are kept
+        size = repository.size()
+        repository.forget(first)
+        removed, freed = repository.gc()
+        assert removed >= 1 and freed > len(old) // 2
+        assert repository.size() < size - len(old) + CHUNK_MAX
+        assert repository.open(second.files["r.0.0.mca"][3]).read() == world
+
+        repository.forget(second)
+        repository.gc()
+        assert repository.index == {} and repository.size() == 0
+
+    @pytest.mark.parametrize("compression", ["gzip", "zstd"])
+    def test_compression_and_export(
+        self, tmp_path: Path, compression: str
+    ) -> None:
+        from io import BytesIO
+        import tarfile
+
+        from src.core.repository import RAW, Repository, Snapshot
+
+        if compression == "zstd":
+            pytest.importorskip("zstandard")
+        repository = Repository(tmp_path / "repo", compression, threads=4)
+
+        text = b"".join(b"chunk %d of level.dat\n" % i for i in range(10**5))
+        noise = os.urandom(1024 * 1024)
+        snapshot = Snapshot("proxy", "1", 0)
+        for path, data in (("level.dat", text), ("r.0.0.mca", noise)):
+            tree, size, _ = repository.store(BytesIO(data))
+            snapshot.files[path] = [size, 0, 0o644, tree]
+        repository.save(snapshot)
+
+        # Text compresses, random data is kept as it is
+        codecs = {loc.codec for loc in repository.index.values()}
+        assert RAW in codecs and len(codecs) == 2
+        assert repository.size() < len(text) // 4 + len(noise) + 4096
+
+        out = tmp_path / f"proxy.tar.{compression}"
+        with open(out, "wb") as f:
+            repository.export(snapshot, f, compression)
+        if compression == "zstd":
+            import zstandard  # type: ignore
+
+            with open(out, "rb") as f:
+                data = zstandard.ZstdDecompressor().stream_reader(f).read()
+            tar = tarfile.open(fileobj=BytesIO(data))
+        else:
+            tar = tarfile.open(out, "r:gz")
+        with tar:
+            assert tar.extractfile("level.dat").read() == text  # type: ignore
+            assert tar.extractfile("r.0.0.mca").read() == noise  # type: ignore
+
+        repository.close()
+
+    def test_levels(self, tmp_path: Path, monkeypatch: Any) -> None:
+        from io import BytesIO
+
+        from src.core.repository import Repository, RepositoryError, Snapshot
+
+        with pytest.raises(RepositoryError, match="from 1 to 9"):
+            Repository(tmp_path / "repo", "gzip", level=12)
+        monkeypatch.setenv("MCDOCKER_BACKUP_LEVEL", "19")
+        with pytest.raises(RepositoryError, match="from 1 to 9"):
+            Repository(tmp_path / "repo", "gzip")
+
+        monkeypatch.delenv("MCDOCKER_BACKUP_LEVEL")
+        repository = Repository(tmp_path / "repo", "gzip", level=9)
+        with pytest.raises(RepositoryError, match="from 1 to 9"):
+            repository.export(Snapshot("proxy", "1", 0), BytesIO(), "gzip", 22)
+        repository.close()
+
+
+class Test_Throttle:
+
+    def test_rate(self) -> None:
+        from threading import Thread
+        from time import perf_counter
+
+        from src.core.throttle import Throttle
+
+        throttle = Throttle(4 * 1024**2)
+
+        def move() -> None:
+            for _ in range(16):
+                throttle.take(64 * 1024)
+
+        start = perf_counter()
+        threads = [Thread(target=move) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 2 MB shared by both at 4 MB/s
+        assert 0.4 < perf_counter() - start < 1.5
+
+    def test_adaptive(self) -> None:
+        from src.core.throttle import CpuGuard, Throttle
+
+        throttle = Throttle(None, floor=1024)
+        throttle.slow_down(100 * 1024)
+        assert throttle.current == 50 * 1024
+        throttle.speed_up()
+        assert throttle.current == 75 * 1024
+        # Back to unlimited past the fastest rate seen
+        throttle.speed_up()
+        assert throttle.current is None
+
+        class Runtime:
+            cpu = [250.0, 250.0, 10.0, 10.0, 10.0, 10.0, 10.0, 10.0]
+
+            def stats(self, names: list[str]) -> dict[str, dicts]:
+                cpu = self.cpu.pop(0) if self.cpu else 10.0
+                return {name: {"cpu": cpu} for name in names}
+
+        logs: list[str] = []
+        throttle = Throttle(8 * 1024**2)
+        guard = CpuGuard(Runtime(), ["proxy"], throttle, 90, logs.append)
+        guard.interval = 0.01
+        with guard:
+            while Runtime.cpu or throttle.current != throttle.rate:
+                throttle.take(1024)
+        assert guard.backoffs == 2
+        assert logs[0].startswith("Servers busy (250% CPU)")
+        assert logs[-1] == "Servers calm, backups back to full speed"
+
+
+class Test_Size:
+
+    def test_parse_size(self) -> None:
+        from src.utils.size import parse_size
+
+        assert parse_size("4096") == 4096
+        assert parse_size("512k") == 512 * 1024
+        # Binary whether or not the unit has the `i`
+        assert parse_size("20MB") == parse_size("20MiB") == 20 * 1024**2
+        assert parse_size(" 1.5GiB ") == int(1.5 * 1024**3)
+        assert parse_size("2T") == 2 * 1024**4
+        for text in ("", "MB", "-1M", "2P", "1.2.3G"):
+            with pytest.raises(ValueError):
+                parse_size(text)
+
+
+class Test_Retention:
+
+    def test_select(self) -> None:
+        from time import mktime
+
+        from src.core.retention import Policy
+
+        start = mktime((2026, 1, 1, 0, 0, 0, 0, 0, -1))
+        # One backup every 30 minutes for 60 days
+        times = [start + i * 1800 for i in range(60 * 48)]
+
+        kept = Policy(last=3, hourly=5, daily=3).select(times)
+        newest = len(times) - 1
+        # The last 3, one per hour for 5 hours (2 already among the last
+        # 3), one per day for 3 days (today's already kept)
+        assert newest in kept and newest - 2 in kept
+        assert len(kept) == 3 + 3 + 2
+        assert {times[i] % 1800 for i in kept} == {0}
+
+        # January, February and March 1st
+        monthly = Policy(monthly=12).select(times)
+        assert len(monthly) == 3
+        assert Policy().select(times) == set(range(len(times)))
+
+    def test_over_budget(self) -> None:
+        from src.core.retention import over_budget
+
+        sizes = {b"a": 10, b"b": 10, b"c": 10, b"d": 10}
+        references = [{b"a", b"b"}, {b"b", b"c"}, {b"c", b"d"}]
+        # Dropping the oldest only frees the chunk no other one uses
+        assert over_budget(references, sizes, 40) == 0
+        assert over_budget(references, sizes, 30) == 1
+        assert over_budget(references, sizes, 20) == 2
+        # The newest stays, whatever its size
+        assert over_budget(references, sizes, 5) == 2
+
+    def test_prune(self, tmp_path: Path, monkeypatch: Any) -> None:
+        from io import BytesIO
+
+        from src.core.backup import BackupManager
+        from src.core.repository import Repository, Snapshot
+        from src.core.retention import Policy
+
+        manager = BackupManager(None, tmp_path)  # type: ignore
+        repository = manager.repository
+        for hour in range(6):
+            snapshot = Snapshot("proxy", f"2026-01-01_0{hour}-00-00", 0.0)
+            snapshot.time = 1767225600 + hour * 3600
+            tree, size, snapshot.added = repository.store(
+                BytesIO(os.urandom(300 * 1024))
+            )
+            snapshot.files["world/r.0.0.mca"] = [size, 0, 0o644, tree]
+            repository.save(snapshot)
+        manager.path.joinpath("database_2026-01-01_00-00-00.sql").write_bytes(
+            bytes(800 * 1024)
+        )
+        manager.path.joinpath("database_01-01-2025_00-00-00.sql").write_text(
+            "older"
+        )
+        manager.path.joinpath("database_2026-01-02_00-00-00.sql").write_text(
+            "new"
+        )
+
+        # Listing and pruning only read the snapshot index
+        assert repository.catalog_path.is_file()
+
+        def unexpected(*args: Any) -> Any:
+            raise AssertionError("read every snapshot")
+
+        monkeypatch.setattr(Repository, "snapshots", unexpected)
+        assert len(repository.catalog("proxy")) == 6
+        assert manager.prune(Policy(last=10)).snapshots == []
+        monkeypatch.undo()
+
+        result = manager.prune(Policy(last=2))
+        assert [info.id[11:13] for info in result.snapshots] == [
+            "00",
+            "01",
+            "02",
+            "03",
+        ]
+        assert [d.name for d in result.dumps] == [
+            "database_01-01-2025_00-00-00.sql"
+        ]
+
+        # The newest dump stays, whatever its size
+        result = manager.prune(Policy(last=2, max_bytes=400 * 1024))
+        assert len(result.snapshots) == 1
+        assert [info.id[11:13] for info in repository.catalog()] == ["05"]
+        assert [d.name for d in manager.dumps()] == [
+            "database_2026-01-02_00-00-00.sql"
+        ]
+        assert repository.reindex() == 1
+
+
+class Test_BackupManager:
+
+    @pytest.fixture()
+    def runtime(self) -> Any:
+        from threading import Lock
+
+        from src.core.runtime import Runtime
+
+        class FakeRuntime(Runtime):
+            """
+            Runtime keeping the files of each container in memory. Answers
+            the listing, tar and pg_dump commands of the backups, slowly.
+            """
+
+            def __init__(self) -> None:
+                self.disks: dict[str, dict[str, bytes]] = {}
+                self.mtimes: dict[tuple[str, str], int] = {}
+                self.failing: set[str] = set()
+                self.read: list[list[str]] = []
+                self.working = self.peak = 0
+                self.stopped: set[str] = set()
+                self.online = 0
+                self.calls: list[tuple[str, list[str]]] = []
+                self.events: list[str] = []
+                self.niced: list[str] = []
+                self.lock = Lock()
+
+            def containers(self, project_dir: Path) -> list[str]:
+                return list(self.disks)
+
+            def stats(self, names: list[str]) -> dict[str, dicts]:
+                return {name: {"cpu": 0.0} for name in names}
+
+            def address(self, container: str) -> str:
+                return "127.0.0.1"
+
+            def running(self, container: str) -> bool:
+                return container not in self.stopped
+
+            def stop(self, names: list[str]) -> None:
+                self.events.extend(f"stop {name}" for name in names)
+
+            def start(self, names: list[str]) -> None:
+                self.events.extend(f"start {name}" for name in names)
+
+            def put_archive(
+                self, container: str, path: str, stream: Any
+            ) -> None:
+                import tarfile
+
+                with tarfile.open(fileobj=stream, mode="r|") as tar:
+                    for member in tar:
+                        data = tar.extractfile(member).read()  # type: ignore
+                        name = f"{path}/{member.name.removeprefix('./')}"
+                        name = name.removeprefix("/home/serverUser/")
+                        self.write(container, name, data)
+                self.events.append(f"put {container}")
+
+            def write(self, container: str, path: str, data: bytes) -> None:
+                self.disks.setdefault(container, {})[path] = data
+                self.mtimes[(container, path)] = 1000 + len(self.mtimes)
+
+            def exec(
+                self,
+                container: str,
+                cmd: list[str],
+                stdout: Any,
+                stdin: Any = None,
+            ) -> Any:
+                from io import BytesIO
+                import tarfile
+                from time import sleep
+
+                files = self.disks.get(container, {})
+                if cmd[:2] == ["sh", "-c"] and cmd[3:4] == ["nice"]:
+                    self.niced.append(cmd[4])
+                    cmd = cmd[4:]
+                if cmd[0] == "cat":
+                    path = cmd[1].removeprefix("/home/serverUser/")
+                    if path not in files:
+                        return 1, b"cat: no such file"
+                    stdout.write(files[path])
+                    return 0, b""
+                if cmd[0] == "sh":
+                    for path, data in files.items():
+                        mtime = self.mtimes[(container, path)]
+                        line = f"{len(data)} {mtime} ./{path}\n"
+                        stdout.write(line.encode())
+                    return 0, b""
+
+                with self.lock:
+                    self.calls.append((container, cmd))
+                    self.working += 1
+                    self.peak = max(self.peak, self.working)
+                sleep(0.05)
+                with self.lock:
+                    self.working -= 1
+                if container in self.failing:
+                    return 2, b"tar: no space left"
+                if cmd[0] == "pg_dump":
+                    folder = cmd[cmd.index("-f") + 1]
+                    self.write(container, f"{folder}/toc.dat", b"PGDMP toc")
+                    self.write(container, f"{folder}/3001.dat.gz", b"rows")
+                    return 0, b""
+                if cmd[:2] == ["rm", "-rf"]:
+                    for path in list(files):
+                        if path.startswith(f"{cmd[2]}/"):
+                            del files[path]
+                    return 0, b""
+                if cmd[0] in ("pg_restore", "mkdir"):
+                    return 0, b""
+                if cmd[-1] == ".":
+                    # Directory dump streamed out of the container
+                    folder = f"{cmd[2]}/"
+                    with tarfile.open(fileobj=stdout, mode="w|") as tar:
+                        for path, data in sorted(files.items()):
+                            if path.startswith(folder):
+                                info = tarfile.TarInfo(
+                                    f"./{path.removeprefix(folder)}"
+                                )
+                                info.size = len(data)
+                                tar.addfile(info, BytesIO(data))
+                    return 0, b""
+
+                assert cmd[-3:] == ["-", "-T", "-"]
+                names = stdin.read().decode().split()
+                self.read.append(names)
+                self.events.append(f"tar {container}")
+                with tarfile.open(fileobj=stdout, mode="w|") as tar:
+                    for name in names:
+                        info = tarfile.TarInfo(f"./{name}")
+                        info.size = len(files[name])
+                        info.mtime = self.mtimes[(container, name)]
+                        tar.addfile(info, BytesIO(files[name]))
+                return 0, b""
+
+        return FakeRuntime()
+
+    def test_parallel(self, tmp_path: Path, runtime: Any) -> None:
+        from src.core.backup import BackupManager
+
+        names = ["proxy", "lobby-1", "lobby-2", "lobby-3"]
+        for name in names:
+            runtime.write(name, "level.dat", name.encode())
+        runtime.failing.add("lobby-2")
+        manager = BackupManager(runtime, tmp_path, jobs=2)
+        database = {"user": "u", "db": "d", "container": "plugins_db"}
+        results = manager.run(names, database)
+
+        # Two world backups at once plus the database dump
+        assert runtime.peak == 3
+        # Run with the lowest priority
+        assert {"sh", "tar", "pg_dump"} <= set(runtime.niced)
+        dump = [(name, c) for name, c in runtime.calls if c[0] == "pg_dump"]
+        assert dump[0][0] == "plugins_db"
+        assert dump[0][1][:7] == ["pg_dump", "-U", "u", "-F", "d", "-j", "4"]
+        # Streamed out, then removed from the container
+        assert not runtime.disks["plugins_db"]
+
+        by_name = {result.name: result for result in results}
+        assert by_name["proxy"].size > 0 and by_name["proxy"].path.is_file()
+        with tarfile.open(by_name["database"].path) as tar:
+            assert sorted(tar.getnames()) == ["./3001.dat.gz", "./toc.dat"]
+        assert by_name["lobby-2"].error == "tar: no space left"
+        assert {s.server for s in manager.repository.snapshots()} == {
+            "proxy",
+            "lobby-1",
+            "lobby-3",
+        }
+
+    def test_incremental(self, tmp_path: Path, runtime: Any) -> None:
+        from src.core.backup import BackupManager
+        from src.utils.progress import Progress
+
+        world = os.urandom(2 * 1024 * 1024)
+        runtime.write("proxy", "level.dat", b"v1")
+        runtime.write("proxy", "world/region/r.0.0.mca", world)
+        runtime.write("proxy", "world/region/r.0.1.mca", b"old")
+        manager = BackupManager(runtime, tmp_path)
+        manager.full_every = 3
+
+        def backup(stamp: str) -> Any:
+            result = manager.server("proxy", stamp, Progress("Backups"))
+            assert result.ok, result.error
+            return result.snapshot
+
+        first = backup("1")
+        runtime.write("proxy", "level.dat", b"v2")
+        del runtime.disks["proxy"]["world/region/r.0.1.mca"]
+        second = backup("2")
+        third = backup("3")
+
+        assert [s.kind for s in (first, second, third)] == [
+            "full",
+            "incremental",
+            "incremental",
+        ]
+        assert runtime.read[1:] == [["level.dat"]]
+        assert second.added < 200 and third.added == 0
+        assert set(third.files) == {"level.dat", "world/region/r.0.0.mca"}
+
+        dest = tmp_path / "restored"
+        manager.repository.extract(third, dest)
+        assert (dest / "level.dat").read_bytes() == b"v2"
+        assert (dest / "world/region/r.0.0.mca").read_bytes() == world
+
+        # Every file is read again periodically, without storing it twice
+        fourth = backup("4")
+        assert fourth.kind == "full" and fourth.added == 0
+
+    def test_restore(self, tmp_path: Path, runtime: Any) -> None:
+        from src.core.backup import BackupError, BackupManager
+
+        world = os.urandom(512 * 1024)
+        runtime.write("proxy", "world/region/r.0.0.mca", world)
+        runtime.write("proxy", "world/level.dat", b"v1")
+        manager = BackupManager(runtime, tmp_path)
+        backup = manager.run(["proxy"], {"user": "u", "db": "d"})
+        stamp = backup[-1].snapshot.id
+
+        # Played on since the backup
+        runtime.write("proxy", "world/level.dat", b"v2")
+        runtime.write("proxy", "world/region/r.9.9.mca", b"new")
+        runtime.events.clear()
+        results = manager.restore(["proxy"], stamp, {"user": "u", "db": "d"})
+
+        assert all(result.ok for result in results), results
+        files = runtime.disks["proxy"]
+        assert files["world/level.dat"] == b"v1"
+        assert files["world/region/r.0.0.mca"] == world
+        # Left for run.sh to delete
+        assert files[".mcdocker-restore"].decode().split() == [
+            "2",
+            "world/level.dat",
+            "world/region/r.0.0.mca",
+        ]
+        assert [e for e in runtime.events if e.endswith("proxy")] == [
+            "stop proxy",
+            "put proxy",
+            "put proxy",
+            "start proxy",
+        ]
+        # Extracted for pg_restore, then removed
+        restore = [c for _, c in runtime.calls if c[0] == "pg_restore"][0]
+        assert restore[-3:] == [
+            "-j",
+            str(manager.restore_jobs),
+            "/tmp/mcdocker-restore",
+        ]
+        assert "put postgres_db" in runtime.events
+        assert not runtime.disks["postgres_db"]
+
+        # A damaged backup leaves the server running
+        for pack in manager.repository.root.glob("packs/*/*.pack"):
+            pack.write_bytes(bytes(pack.stat().st_size))
+        runtime.events.clear()
+        damaged = BackupManager(runtime, tmp_path)
+        results = damaged.restore(["proxy"])
+        assert "damaged backup" in (results[0].error or "")
+        assert runtime.events == []
+
+        with pytest.raises(BackupError):
+            manager.restore(["proxy"], "no-such-snapshot")
+
+    @pytest.fixture()
+    def rcon(self, runtime: Any) -> Any:
+        """Fake RCON server logging the commands in the runtime events."""
+        import socket
+        import struct
+        from threading import Thread
+
+        server = socket.create_server(("127.0.0.1", 0))
+
+        def packet(conn: Any, id: int, kind: int, body: bytes) -> None:
+            payload = body + b"\x00\x00"
+            conn.sendall(struct.pack("<iii", len(payload) + 8, id, kind))
+            conn.sendall(payload)
+
+        def serve(conn: Any) -> None:
+            with conn, conn.makefile("rb") as f:
+                while header := f.read(12):
+                    length, id, kind = struct.unpack("<iii", header)
+                    body = f.read(length - 8)[:-2].decode()
+                    if kind == 3:
+                        ok = body == "secret"
+                        packet(conn, id if ok else -1, 2, b"")
+                    elif body == "list":
+                        players = f"There are {runtime.online} of a max of 20"
+                        packet(
+                            conn, id, 0, f"{players} players online: ".encode()
+                        )
+                    else:
+                        runtime.events.append(body)
+                        packet(conn, id, 0, f"ran {body}".encode())
+
+        def accept() -> None:
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    return
+                Thread(target=serve, args=(conn,), daemon=True).start()
+
+        Thread(target=accept, daemon=True).start()
+        yield server.getsockname()[1]
+        server.close()
+
+    @pytest.mark.enable_socket
+    def test_saves_paused(
+        self, tmp_path: Path, runtime: Any, rcon: int
+    ) -> None:
+        from src.core.backup import BackupManager
+
+        # The hub has the wrong password: it keeps saving
+        for name, password in [
+            ("proxy", "secret"),
+            ("lobby", "secret"),
+            ("hub", "wrong"),
+        ]:
+            settings = f"enable-rcon=true\nrcon.port={rcon}\n"
+            settings += f"rcon.password={password}\n"
+            runtime.write(name, "server.properties", settings.encode())
+            runtime.write(name, "world/level.dat", name.encode())
+        runtime.failing.add("lobby")
+        manager = BackupManager(runtime, tmp_path, jobs=1)
+        results = manager.run(["proxy", "lobby", "hub"])
+
+        # Saving is back on even when the copy fails
+        pause = ["save-off", "save-all flush"]
+        assert runtime.events == [
+            *pause,
+            "tar proxy",
+            "save-on",
+            *pause,
+            "save-on",
+            "tar hub",
+        ]
+        by_name = {result.name: result for result in results}
+        assert by_name["proxy"].paused is not None
+        assert by_name["hub"].paused is None
+        assert by_name["lobby"].error == "tar: no space left"
+        snapshot = by_name["proxy"].snapshot
+        dest = tmp_path / "restored"
+        manager.repository.extract(snapshot, dest)
+        assert (dest / "world/level.dat").read_bytes() == b"proxy"
+
+    @pytest.mark.enable_socket
+    def test_schedule(
+        self, tmp_path: Path, runtime: Any, rcon: int, monkeypatch: Any
+    ) -> None:
+        import time
+
+        from src.core.backup import BackupManager
+        from src.core.scheduler import Scheduler, parse_duration
+
+        assert parse_duration("1h30m") == parse_duration("90m") == 5400
+        assert parse_duration("45") == 45
+        with pytest.raises(ValueError):
+            parse_duration("1 hour")
+
+        # The proxy has RCON, the lobby doesn't and the hub is stopped
+        settings = f"enable-rcon=true\nrcon.port={rcon}\nrcon.password=secret"
+        runtime.write("proxy", "server.properties", settings.encode())
+        for name in ("proxy", "lobby", "hub"):
+            runtime.write(name, "level.dat", name.encode())
+        runtime.stopped.add("hub")
+
+        now = [time.time()]
+        monkeypatch.setattr(
+            "src.core.backup.strftime",
+            lambda fmt: time.strftime(fmt, time.localtime(now[0])),
+        )
+        manager = BackupManager(runtime, tmp_path)
+        manager.pause_saves = False
+        logs: list[str] = []
+        scheduler = Scheduler(
+            manager,
+            ["proxy", "lobby", "hub"],
+            3600,
+            {"lobby": 600},
+            clock=lambda: now[0],
+            log=logs.append,
+            prune=False,
+        )
+
+        # First backups spread over a tenth of the interval
+        assert scheduler.step() == []
+        assert now[0] <= scheduler.due["proxy"] <= now[0] + 360
+        assert now[0] <= scheduler.due["lobby"] <= now[0] + 60
+        now[0] += 360
+        assert scheduler.step() == ["proxy", "lobby"]
+        assert any("Skipped hub: stopped" in line for line in logs)
+
+        # Nobody joined the proxy since, the lobby can't tell
+        now[0] += 3960
+        assert scheduler.step() == ["lobby"]
+        assert any("Skipped proxy: no players" in line for line in logs)
+
+        runtime.online = 1
+        scheduler.step()
+        runtime.online = 0
+        now[0] += 3960
+        # A backup is running: the next tick tries again
+        with manager.locked():
+            assert scheduler.step() == []
+        assert scheduler.step() == ["proxy", "lobby"]
+        assert len(manager.repository.catalog("proxy")) == 2
+
+    def test_verify(
+        self, tmp_path: Path, runtime: Any, monkeypatch: Any
+    ) -> None:
+        import hashlib
+
+        from src.core.backup import BackupManager
+
+        world = os.urandom(512 * 1024)
+        for name in ("proxy", "lobby"):
+            runtime.write(name, "level.dat", name.encode())
+            runtime.write(name, "world/region/r.0.0.mca", world)
+        manager = BackupManager(runtime, tmp_path)
+        database = {"user": "u", "db": "d"}
+        results = manager.run(["proxy", "lobby"], database, prune=False)
+
+        # The manifests are written along with the backups
+        by_name = {result.name: result for result in results}
+        snapshot = by_name["proxy"].snapshot
+        assert (
+            snapshot.hashes["level.dat"] == hashlib.sha256(b"proxy").hexdigest()
+        )
+        assert snapshot.elapsed > 0
+        assert manager.repository.catalog("proxy")[0].elapsed > 0
+        manifest = json.loads(
+            by_name["database"].path.with_suffix(".json").read_text()
+        )
+        assert (
+            manifest["sha256"]
+            == hashlib.sha256(by_name["database"].path.read_bytes()).hexdigest()
+        )
+
+        result = manager.verify()
+        assert result.ok, result.errors
+        # The region file is shared by both servers
+        assert (result.files, result.dumps) == (3, 1)
+        assert result.packs > 0 and result.size > 2 * len(world)
+
+        # Unchanged since, nothing is read again
+        result = manager.verify()
+        assert (result.packs, result.files, result.dumps) == (0, 0, 0)
+        assert result.ok and result.skipped > 0
+
+        runtime.write("proxy", "level.dat", b"proxy v2")
+        monkeypatch.setattr(
+            "src.core.backup.strftime", lambda fmt: "2099-01-01_00-00-00"
+        )
+        manager.run(["proxy"], prune=False)
+        result = manager.verify()
+        assert (result.packs, result.files, result.dumps) == (1, 1, 0)
+
+        # Damage the region file and the dump
+        for pack in manager.repository.root.glob("packs/*/*.pack"):
+            data = bytearray(pack.read_bytes())
+            if len(data) > len(world):
+                data[len(data) // 2] ^= 0xFF
+                pack.write_bytes(data)
+        dump = by_name["database"].path
+        dump.write_bytes(dump.read_bytes().replace(b"rows", b"rown"))
+        result = manager.verify()
+        assert not result.ok
+        assert any("corrupted chunks" in error for error in result.errors)
+        assert any("database_" in error for error in result.errors)
+        assert not manager.verify(full=True).ok
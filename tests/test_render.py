@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+
+import pytest  # type: ignore
+
+dicts = dict[str, Any]
+
+
+def network(count: int) -> tuple[dicts, list[dicts]]:
+    servers: list[dicts] = []
+    envs: list[dicts] = []
+    for i in range(count):
+        name = "proxy" if i == 0 else f"lobby-{i}"
+        servers.append(
+            {
+                "name": name,
+                "build": {"context": f"./servers/{name}/"},
+                "env_file": f"./servers/{name}/.env",
+                "expose": [25565 + i],
+                "resources": {
+                    "limits": {"cpus": 1.0, "memory": "1.0g"},
+                    "reservations": {"cpus": 0.0, "memory": "0.25g"},
+                },
+            }
+        )
+        envs.append(
+            {
+                "CONTAINER_NAME": name,
+                "SERVER_JAR": "server.jar",
+                "JAVA_ARGS": "",
+                "MIN_HEAP_SIZE": "256M",
+                "MAX_HEAP_SIZE": "1024M",
+                "HOST_PORTS": {"HOST": 25565 + i},
+            }
+        )
+    compose = {"servers": servers, "database": {}, "web": False}
+    return compose, envs
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("count", [1, 100, 1000])
+def test_render(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, count: int
+) -> None:
+    from importlib_resources import files  # type: ignore
+    import jinja2
+
+    from src.core.files import FileManager
+    from src.core.manifest import BuildManifest
+    from src.core.templates import TemplateEngine
+
+    compose, envs = network(count)
+    bytecode = tmp_path / "bytecode"
+    manager = FileManager()
+
+    # Templates compiled from source, and batches rendered
+    compiled: list[str] = []
+    batches: list[int] = []
+    compile_source = jinja2.Environment.compile
+    render_many = TemplateEngine.render_many
+
+    def compile(
+        self: Any, source: Any, name: Any = None, *args: Any, **kwargs: Any
+    ) -> Any:
+        compiled.append(name)
+        return compile_source(self, source, name, *args, **kwargs)
+
+    def batch(self: Any, name: str, contexts: Any) -> list[str]:
+        contexts = list(contexts)
+        batches.append(len(contexts))
+        return render_many(self, name, contexts)
+
+    monkeypatch.setattr(jinja2.Environment, "compile", compile)
+    monkeypatch.setattr(TemplateEngine, "render_many", batch)
+
+    def render(templates: TemplateEngine, out: Path) -> float:
+        manifest = BuildManifest(out)
+        start = perf_counter()
+        manager.render_files(
+            templates,
+            "docker-compose.yml.j2",
+            [(compose, out / "docker-compose.yml")],
+            manifest,
+        )
+        manager.render_files(
+            templates,
+            ".env.j2",
+            [
+                (env, out / "servers" / env["CONTAINER_NAME"] / ".env")
+                for env in envs
+            ],
+            manifest,
+        )
+        elapsed = (perf_counter() - start) * 1000
+        manifest.save()
+        return elapsed
+
+    def stats(out: Path) -> dict[Path, int]:
+        outputs = [out / "docker-compose.yml", *out.glob("servers/*/.env")]
+        return {path: path.stat().st_mtime_ns for path in outputs}
+
+    # Cold: both templates compiled, each rendered in a single batch
+    out = tmp_path / "project"
+    cold = render(TemplateEngine(files("src.assets.templates"), bytecode), out)
+    assert len(compiled) == 2 and batches == [1, count]
+    assert len(list(out.glob("servers/*/.env"))) == count
+    before = stats(out)
+
+    # Warm: every output is fresh, nothing is rendered nor rewritten
+    batches.clear()
+    warm = render(TemplateEngine(files("src.assets.templates"), bytecode), out)
+    assert batches == [] and stats(out) == before
+
+    # A new process loads the compiled templates from the bytecode cache
+    compiled.clear()
+    templates = TemplateEngine(files("src.assets.templates"), bytecode)
+    fresh = render(templates, tmp_path / "other")
+    assert compiled == [] and batches == [1, count]
+
+    # Only the output of the server that changed is rendered again
+    batches.clear()
+    envs[-1]["MAX_HEAP_SIZE"] = "2048M"
+    render(templates, out)
+    changed = [
+        path for path, mtime in stats(out).items() if before[path] != mtime
+    ]
+    assert batches == [1] and changed == [
+        out / "servers" / envs[-1]["CONTAINER_NAME"] / ".env"
+    ]
+
+    print(
+        f"{count:>5} servers  cold {cold:8.2f} ms  warm {warm:8.2f} ms  "
+        f"cached bytecode {fresh:8.2f} ms"
+    )
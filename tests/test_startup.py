@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest  # type: ignore
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules only the interactive builder commands are allowed to pull in
+HEAVY = (
+    "InquirerPy",
+    "prompt_toolkit",
+    "jinja2",
+    "requests",
+    "psutil",
+    "docker",
+)
+
+# Backup machinery, imported only when a backup command runs
+DEFERRED = (
+    "src.core.backup",
+    "src.core.repository",
+    "src.core.scheduler",
+    "src.core.throttle",
+    "src.core.verify",
+)
+
+# Most modules each command may load on top of a bare `import click`. The
+# counts don't depend on the speed of the machine, unlike wall times, and
+# grow as soon as a command starts importing more than it needs.
+MAX_MODULES = {
+    "--help": 15,
+    "stop --help": 70,
+    "up --help": 70,
+    "stop": 100,
+    "up": 70,
+}
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from src.__main__ import cli
+try:
+    cli(sys.argv[1:], standalone_mode=False)
+except SystemExit:
+    pass
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({"ms": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+BASELINE = "import json, sys, click; print(json.dumps(sorted(sys.modules)))"
+
+# Stands in for the docker CLI, recording its arguments
+DOCKER = '#!/bin/sh\necho "$@" >> "$(dirname "$0")/calls"\n'
+
+
+@pytest.fixture()
+def project(tmp_path: Path) -> tuple[Path, dict[str, str]]:
+    """Empty project folder, and an environment running a fake docker."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    docker = bin_dir / "docker"
+    docker.write_text(DOCKER)
+    docker.chmod(0o755)
+
+    env = dict(os.environ)
+    env["PATH"] = f"{bin_dir}{os.pathsep}{env.get('PATH', '')}"
+    env["PYTHONPATH"] = str(ROOT)
+    env["MCDOCKER_RUNTIME"] = "cli"
+    return tmp_path, env
+
+
+def probe(
+    cwd: Path, env: dict[str, str], *args: str
+) -> tuple[float, list[str], dict[str, int]]:
+    """Run the CLI in a fresh interpreter and return its startup stats."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE, *args],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # Cumulative import time (us) of each first-party module
+    import_times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if name.startswith("src") and cumulative.strip().isdigit():
+            import_times[name] = int(cumulative)
+
+    return stats["ms"], stats["modules"], import_times
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(os.name != "posix", reason="fake docker is a sh script")
+@pytest.mark.parametrize("command", list(MAX_MODULES))
+def test_startup(command: str, project: tuple[Path, dict[str, str]]) -> None:
+    cwd, env = project
+    args = command.split()
+    baseline = json.loads(
+        subprocess.run(
+            [sys.executable, "-c", BASELINE],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    )
+
+    # Best of three runs to smooth out cold caches
+    runs = [probe(cwd, env, *args) for _ in range(3)]
+    ms, modules, import_times = min(runs, key=lambda r: r[0])
+
+    for name, us in sorted(import_times.items(), key=lambda i: -i[1]):
+        print(f"{name:<30} {us / 1000:8.2f} ms")
+    extra = sorted(set(modules) - set(baseline))
+    print(f"{command:<30} {ms:8.2f} ms total, {len(extra)} modules")
+
+    loaded = [m for m in modules if m.split(".")[0] in HEAVY]
+    assert not loaded, f"'{command}' imported {loaded}"
+    loaded = [m for m in modules if m in DEFERRED]
+    assert not loaded, f"'{command}' imported {loaded}"
+    assert len(extra) <= MAX_MODULES[command], (
+        f"'{command}' imported {len(extra)} modules "
+        f"(at most {MAX_MODULES[command]}): {extra}"
+    )
+
+    # The commands themselves ran, through the docker CLI
+    if "--help" not in args:
+        calls = (cwd / "bin" / "calls").read_text().splitlines()
+        assert any(f" {args[0]}" in call for call in calls), calls